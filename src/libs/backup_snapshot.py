@@ -0,0 +1,138 @@
+import time
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency: fall back to the array module
+    np = None
+
+from libs.velero_records import BackupPhase
+
+PHASE_OTHER = 0
+PHASE_COMPLETED = 1
+PHASE_IN_PROGRESS = 2
+PHASE_FAILED = 3
+PHASE_PARTIALLY_FAILED = 4
+
+PHASE_CODES = {BackupPhase.COMPLETED: PHASE_COMPLETED,
+               BackupPhase.IN_PROGRESS: PHASE_IN_PROGRESS,
+               BackupPhase.FAILED: PHASE_FAILED,
+               BackupPhase.PARTIALLY_FAILED: PHASE_PARTIALLY_FAILED}
+
+SECONDS_DAY = 86400
+NAN = float('nan')
+
+AGE_BINS_DAYS = (1, 2, 7, 30)
+
+
+class BackupSnapshot:
+    """
+    Columnar representation of the last backup records:
+    categorical phase codes, epoch timestamps and error/warning flags in parallel arrays.
+    The statistics are computed with vectorized passes (numpy if available)
+    """
+
+    def __init__(self, backups: dict, now=None):
+        self.now = time.time() if now is None else now
+        self.names = list(backups.keys())
+
+        phases = array('b')
+        expires = array('d')
+        expire_days = array('d')
+        completions = array('d')
+        errors = array('b')
+        warnings = array('b')
+
+        for record in backups.values():
+            phases.append(PHASE_CODES.get(record.phase, PHASE_OTHER))
+            expires.append(NAN if record.expiration is None else record.expiration)
+            expire_days.append(NAN if record.expire_days is None else record.expire_days)
+            completions.append(NAN if record.completion is None else record.completion)
+            errors.append(record.errors > 0)
+            warnings.append(record.warnings > 0)
+
+        if np is not None:
+            self.phases = np.array(phases, dtype=np.int8)
+            self.expires = np.array(expires, dtype=np.float64)
+            self.expire_days = np.array(expire_days, dtype=np.float64)
+            self.completions = np.array(completions, dtype=np.float64)
+            self.errors = np.array(errors, dtype=bool)
+            self.warnings = np.array(warnings, dtype=bool)
+        else:
+            self.phases = phases
+            self.expires = expires
+            self.expire_days = expire_days
+            self.completions = completions
+            self.errors = errors
+            self.warnings = warnings
+
+    def __len__(self):
+        return len(self.names)
+
+    def phase_counts(self):
+        """
+        Number of backups for every phase code
+        """
+        if np is not None:
+            counts = np.bincount(self.phases, minlength=PHASE_PARTIALLY_FAILED + 1)
+            return {code: int(counts[code]) for code in range(len(counts))}
+        counts = dict.fromkeys(range(PHASE_PARTIALLY_FAILED + 1), 0)
+        for code in self.phases:
+            counts[code] += 1
+        return counts
+
+    def __select__(self, mask):
+        if np is not None:
+            return [self.names[index] for index in np.flatnonzero(mask)]
+        return [name for name, flag in zip(self.names, mask) if flag]
+
+    def names_in_phase(self, code):
+        if np is not None:
+            return self.__select__(self.phases == code)
+        return self.__select__(value == code for value in self.phases)
+
+    def names_with_errors(self):
+        return self.__select__(self.errors)
+
+    def names_with_warnings(self):
+        return self.__select__(self.warnings)
+
+    def expiring(self, threshold_days):
+        """
+        Backups expiring in less than threshold days and backups without a valid expiration
+        @return: names in warning period, number of not retrieved
+        """
+        days = self.expire_days
+        if np is not None:
+            valid = days > 0
+            return self.__select__(valid & (days < threshold_days)), int(len(days) - np.count_nonzero(valid))
+        expiring = [name for name, value in zip(self.names, days) if 0 < value < threshold_days]
+        not_retrieved = sum(1 for value in days if not value > 0)
+        return expiring, not_retrieved
+
+    def expiry_buckets(self, edges_days=(7, 14, 30)):
+        """
+        Number of backups expiring within every edge (cumulative buckets), unknown expiration excluded
+        """
+        if np is not None:
+            days = (self.expires[~np.isnan(self.expires)] - self.now) / SECONDS_DAY
+            return {edge: int(np.count_nonzero(days < edge)) for edge in edges_days}
+        days = [(value - self.now) / SECONDS_DAY for value in self.expires if value == value]
+        return {edge: sum(1 for value in days if value < edge) for edge in edges_days}
+
+    def age_histogram(self, bins_days=AGE_BINS_DAYS):
+        """
+        Histogram of the age of the completed backups: bucket upper bound (days) -> count, None for older
+        """
+        if np is not None:
+            ages = (self.now - self.completions[~np.isnan(self.completions)]) / SECONDS_DAY
+            counts = np.histogram(ages, bins=[-np.inf, *bins_days, np.inf])[0]
+        else:
+            counts = [0] * (len(bins_days) + 1)
+            for value in self.completions:
+                if value != value:
+                    continue
+                age = (self.now - value) / SECONDS_DAY
+                index = next((i for i, edge in enumerate(bins_days) if age < edge), len(bins_days))
+                counts[index] += 1
+        return dict(zip([*bins_days, None], (int(count) for count in counts)))
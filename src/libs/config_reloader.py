@@ -0,0 +1,124 @@
+import asyncio
+
+from utils.config_snapshot import ConfigSnapshot, build_snapshot, read_config_source, source_version, \
+    changed_keys, restart_keys
+from utils.print_helper import PrintHelper
+from utils.handle_error import handle_exceptions_async_method
+
+
+class ConfigReloader:
+    """
+    Watch the mounted ConfigMap and swap a new validated snapshot in the components (apply_config).
+    The collection keeps running and the cached cluster state is not dropped: only the settings change.
+    An invalid source is reported and the current snapshot is kept
+    """
+
+    def __init__(self,
+                 debug_on=True,
+                 logger=None,
+                 path='',
+                 reload_seconds=30,
+                 snapshot: ConfigSnapshot = None,
+                 targets=None):
+
+        self.print_helper = PrintHelper('config_reloader', logger)
+        self.debug_on = debug_on
+
+        self.print_helper.debug_if(self.debug_on, f"__init__")
+
+        self.path = path
+        self.reload_seconds = reload_seconds
+        self.snapshot = snapshot
+        # components with an apply_config(snapshot) method
+        self.targets = targets or []
+
+        self.version = None
+        self.reloads = 0
+        self.errors = 0
+
+    def __load__(self):
+        """
+        Read and validate the source (worker thread)
+        @return: snapshot
+        """
+        values = read_config_source(self.path)
+        return build_snapshot(self.snapshot.version + 1, values)
+
+    def apply(self, snapshot: ConfigSnapshot):
+        """
+        Swap the snapshot in all the components. Called in the event loop: no component runs
+        between the first and the last apply_config, a cycle sees the old or the new settings.
+        The values are parsed and checked in build_snapshot, apply_config only assigns them: if a component
+        fails anyway the ones already updated are restored to the current snapshot
+        @raise Exception: error of the component, the current snapshot is kept
+        """
+        keys = changed_keys(self.snapshot.values, snapshot.values)
+        applied = []
+        try:
+            for target in self.targets:
+                target.apply_config(snapshot)
+                applied.append(target)
+        except Exception:
+            for target in applied:
+                target.apply_config(self.snapshot)
+            raise
+        self.snapshot = snapshot
+        self.reloads += 1
+
+        self.print_helper.info('config version %s applied, changed keys: %s', snapshot.version, ', '.join(keys))
+        restart = restart_keys(keys)
+        if len(restart) > 0:
+            self.print_helper.wrn('config keys applied at the next restart: %s', ', '.join(restart))
+
+    async def check(self):
+        """
+        Reload the source if it changed
+        @return: True if a new snapshot is applied
+        """
+        version = await asyncio.to_thread(source_version, self.path)
+        if version == self.version:
+            return False
+
+        try:
+            snapshot = await asyncio.to_thread(self.__load__)
+        except Exception as err:
+            # the same source is not validated again until it changes
+            self.version = version
+            self.errors += 1
+            self.print_helper.error('config not valid, the current version %s is kept: %s',
+                                    self.snapshot.version, err)
+            return False
+
+        self.version = version
+        if len(changed_keys(self.snapshot.values, snapshot.values)) == 0:
+            return False
+        try:
+            self.apply(snapshot)
+        except Exception as err:
+            self.errors += 1
+            self.print_helper.error('config version %s not applied, the current version %s is kept: %s',
+                                    snapshot.version, self.snapshot.version, err)
+            return False
+        return True
+
+    @handle_exceptions_async_method
+    async def run(self):
+        """
+        Main loop
+        """
+        self.print_helper.info(f"config reload path={self.path} every {self.reload_seconds} sec")
+        # the startup snapshot is built from the same source
+        try:
+            self.version = await asyncio.to_thread(source_version, self.path)
+        except OSError as err:
+            self.print_helper.wrn('config source not available: %s', err)
+
+        while True:
+            await asyncio.sleep(self.reload_seconds)
+            try:
+                await self.check()
+            except OSError as err:
+                # the volume is updated or not mounted: the next check retries
+                self.print_helper.wrn('config source not available: %s', err)
+            except Exception as err:
+                self.print_helper.error_and_exception(f"run", err)
@@ -36,6 +36,11 @@ class Dispatcher:
         self.queue_telegram = queue_telegram
         self.queue_mail = queue_mail
 
+    def apply_config(self, snapshot):
+        self.dispatcher_config = snapshot.dispatcher
+        for queue in (self.queue, self.queue_telegram, self.queue_mail):
+            queue.pressure_size = snapshot.dispatcher.queue_pressure
+
     @handle_exceptions_async_method
     async def __put_in_queue__(self,
                                queue,
@@ -65,8 +70,8 @@ class Dispatcher:
                 if item is None:
                     break
 
-                self.print_helper.info_if(self.print_debug,
-                                          f"dispatcher new receive element")
+                self.print_helper.info("dispatcher new element: severity %s sequence %s kind %s",
+                                       item.severity, item.sequence, item.kind)
 
                 if item is not None and len(item) > 0:
                     if self.dispatcher_config.telegram_enable:
@@ -77,7 +82,8 @@ class Dispatcher:
                                                     item)
                     if (not self.dispatcher_config.telegram_enable and
                             not self.dispatcher_config.email_enable):
-                        self.print_helper.info(f"send_to_std_out[Disable send...only std out]=\n{item}")
+                        self.print_helper.info(f"send_to_std_out[Disable send...only std out]="
+                                               f"[{item.severity}]\n{item.message}")
 
         except Exception as err:
             self.print_helper.error_and_exception(f"run", err)
@@ -2,9 +2,7 @@ from utils.config import ConfigK8sProcess
 from utils.config import ConfigDispatcher
 from utils.print_helper import PrintHelper
 from utils.handle_error import handle_exceptions_async_method
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from libs.notification_event import Severity, Destination, DEFAULT_DESTINATION
 
 
 class DispatcherEmail:
@@ -35,27 +33,44 @@ class DispatcherEmail:
 
         self.queue = queue
 
+    def apply_config(self, snapshot):
+        self.dispatcher_config = snapshot.dispatcher
+
     @handle_exceptions_async_method
-    async def send_email(self, message):
+    async def send_email(self, message, severity=Severity.INFO, destination: Destination = DEFAULT_DESTINATION):
         """
         Send email func
         @param message: body message
+        @param severity: added to the subject if critical or warning
+        @param destination: recipients of the route, the channel ones for the default destination
         """
         try:
-            self.print_helper.info(f"send_email")
+            self.print_helper.info(f"send_email. destination {destination.name}")
+            recipients = self.dispatcher_config.email_recipient if destination.is_default \
+                else destination.email_recipients
+            if len(recipients) == 0 and not destination.is_default:
+                self.print_helper.info(f"send_email. no recipients for the destination {destination.name}")
+                return
             if self.dispatcher_config.email_enable:
                 if ((len(self.dispatcher_config.email_smtp_server) > 0)
                         and (len(self.dispatcher_config.email_smtp_server) > 0)
                         and (len(self.dispatcher_config.email_sender) > 0)
                         and (len(self.dispatcher_config.email_sender_password) > 0)
                         and self.dispatcher_config.email_smtp_port > 0
-                        and (len(self.dispatcher_config.email_recipient) > 0)):
+                        and (len(recipients) > 0)):
+                    # imported only when the channel sends
+                    import smtplib
+                    from email.mime.text import MIMEText
+                    from email.mime.multipart import MIMEMultipart
+
                     # Create an email message
                     msg = MIMEMultipart()
 
                     msg['From'] = self.dispatcher_config.email_sender
-                    msg['To'] = self.dispatcher_config.email_recipient
+                    msg['To'] = recipients
                     msg['Subject'] = 'Velero-watchdog report'
+                    if severity <= Severity.WARNING:
+                        msg['Subject'] = f'Velero-watchdog report [{severity}]'
                     # Attach the message
                     msg.attach(MIMEText(message, 'plain'))
                     # Connect to the SMTP server and send the email
@@ -70,10 +85,10 @@ class DispatcherEmail:
                         server.login(self.dispatcher_config.email_sender,
                                      self.dispatcher_config.email_sender_password)
                         server.sendmail(self.dispatcher_config.email_sender,
-                                        self.dispatcher_config.email_recipient.split(';'),
+                                        recipients.split(';'),
                                         msg.as_string())
                         server.quit()
-                        self.print_helper.info(f"Email sent successfully to {self.dispatcher_config.email_recipient}")
+                        self.print_helper.info(f"Email sent successfully to {recipients}")
                     except Exception as e:
                         self.print_helper.error(f"send_email in error {str(e)}")
                 else:
@@ -101,7 +116,7 @@ class DispatcherEmail:
                                           f"email channel: new element received")
 
                 if item is not None and len(item) > 0:
-                    await self.send_email(item)
+                    await self.send_email(item.message, item.severity, item.destination)
 
         except Exception as err:
             self.print_helper.error_and_exception(f"run", err)
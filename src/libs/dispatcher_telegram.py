@@ -1,11 +1,11 @@
 import asyncio
-import requests
 from datetime import datetime
 from utils.config import ConfigK8sProcess
 from utils.config import ConfigDispatcher
 from utils.print_helper import PrintHelper
 from utils.handle_error import handle_exceptions_async_method
 from utils.strings import ClassString
+from libs.notification_event import Destination, DEFAULT_DESTINATION
 
 
 class DispatcherTelegram:
@@ -32,70 +32,85 @@ class DispatcherTelegram:
 
         self.queue = queue
 
+        self.__set_dispatcher_config__(dispatcher_config)
+
+        # bot token -> [minute, messages sent in the minute]: the routes with the same bot share its rate limit
+        self.telegram_rates = {}
+
+        # init class string
+        self.class_strings = ClassString(debug_on=self.print_debug,
+                                         print_helper=self.print_helper)
+
+    def __set_dispatcher_config__(self, dispatcher_config: ConfigDispatcher):
         self.telegram_api_token = dispatcher_config.telegram_token
         self.telegram_chat_ID = dispatcher_config.telegram_chat_id
         self.telegram_enable = dispatcher_config.telegram_enable
         self.telegram_max_msg_len = dispatcher_config.telegram_max_msg_len
         self.telegram_rate_minute = dispatcher_config.telegram_rate_limit
 
-        self.telegram_last_minute = 0
-        self.telegram_last_rate = 0
-
-        # init class string
-        self.class_strings = ClassString(debug_on=self.print_debug,
-                                         print_helper=self.print_helper)
+    def apply_config(self, snapshot):
+        # the rate counters of the current minute are kept
+        self.__set_dispatcher_config__(snapshot.dispatcher)
 
     @handle_exceptions_async_method
-    async def __can_send_message__(self):
+    async def __can_send_message__(self, token):
         """
-        Check if the rate limit for the current time is reached
+        Check if the rate limit of the bot for the current time is reached
+        @param token: bot token
         """
         try:
+            rate = self.telegram_rates.setdefault(token, [0, 0])
             self.print_helper.info(f"__can_send_message__"
-                                   f"{self.telegram_last_rate}/{self.telegram_rate_minute}")
-            self.telegram_last_rate += 1
-            seconds_waiting = 0
+                                   f"{rate[1]}/{self.telegram_rate_minute}")
+            rate[1] += 1
             while True:
                 my_data = datetime.now()
-                if my_data.minute != self.telegram_last_minute:
-                    self.telegram_last_minute = my_data.minute
-                    self.telegram_last_rate = 0
+                if my_data.minute != rate[0]:
+                    rate[0] = my_data.minute
+                    rate[1] = 0
 
-                if self.telegram_last_rate <= self.telegram_rate_minute:
+                if rate[1] <= self.telegram_rate_minute:
                     break
-                if seconds_waiting % 30 == 0:
-                    self.print_helper.info(f"...wait {60 - my_data.second} seconds. "
-                                           f"Max rate minute reached {self.telegram_rate_minute}")
-
-                await asyncio.sleep(1)
-                seconds_waiting += 1
+                # wait the next minute at once instead of polling every second
+                seconds = 60 - my_data.second - my_data.microsecond / 1000000
+                self.print_helper.info(f"...wait {seconds:.1f} seconds. "
+                                       f"Max rate minute reached {self.telegram_rate_minute}")
+                await asyncio.sleep(seconds)
 
         except Exception as err:
             self.print_helper.error_and_exception(f"__can_send_message__", err)
 
     @handle_exceptions_async_method
-    async def send_to_telegram(self, message):
+    async def send_to_telegram(self, message, destination: Destination = DEFAULT_DESTINATION):
         """
         Send message to telegram
         @param message: body message
+        @param destination: chat and bot of the route, the channel ones for the default destination
         """
-        self.print_helper.info(f"send_to_telegram")
-        await self.__can_send_message__()
+        self.print_helper.info(f"send_to_telegram. destination {destination.name}")
+        token = destination.telegram_token or self.telegram_api_token
+        chat_id = self.telegram_chat_ID if destination.is_default else destination.telegram_chat_id
+        if len(chat_id) == 0 and not destination.is_default:
+            self.print_helper.info(f"send_to_telegram. no chat for the destination {destination.name}")
+            return
+        await self.__can_send_message__(token)
         if self.telegram_enable:
-            if len(self.telegram_api_token) > 0 and len(self.telegram_chat_ID) > 0:
-                api_url = f'https://api.telegram.org/bot{self.telegram_api_token}/sendMessage'
+            if len(token) > 0 and len(chat_id) > 0:
+                api_url = f'https://api.telegram.org/bot{token}/sendMessage'
                 try:
+                    # imported only when the channel sends
+                    import requests
 
-                    response = requests.post(api_url, json={'chat_id': self.telegram_chat_ID,
+                    response = requests.post(api_url, json={'chat_id': chat_id,
                                                             'text': message})
                     self.print_helper.info(f"send_to_telegram.response {response.text[1:10]}")
 
                 except Exception as e:
                     self.print_helper.error_and_exception(f"send_to_telegram", e)
             else:
-                if len(self.telegram_api_token) == 0:
+                if len(token) == 0:
                     self.print_helper.error(f"send_to_telegram. api token is not defined")
-                if len(self.telegram_chat_ID) == 0:
+                if len(chat_id) == 0:
                     self.print_helper.error(f"send_to_telegram. chatID is not defined")
         else:
             self.print_helper.info(f"send_to_telegram[Disable send...only std out]=\n{message}")
@@ -119,10 +134,16 @@ class DispatcherTelegram:
                                           f"telegram channel: new element received")
 
                 if item is not None:
-                    messages = self.class_strings.split_string(item,
+                    messages = self.class_strings.split_string(item.message,
                                                                self.telegram_max_msg_len, '\n')
-                    for message in messages:
-                        await self.send_to_telegram(message)
+                    for index, message in enumerate(messages):
+                        await self.send_to_telegram(message, item.destination)
+                        if index + 1 < len(messages) and self.queue.preempts(item):
+                            # a higher severity arrived while the parts are rate limited: it goes first
+                            self.print_helper.info("telegram channel: %s parts of sequence %s delayed",
+                                                   len(messages) - index - 1, item.sequence)
+                            self.queue.put_nowait(item.with_message('\n'.join(messages[index + 1:])))
+                            break
 
         except Exception as err:
             self.print_helper.error_and_exception(f"run", err)
@@ -0,0 +1,250 @@
+import os
+import sqlite3
+import threading
+import time
+
+from utils.handle_error import handle_exceptions_method
+from libs.velero_records import BackupPhase, TERMINAL_PHASES
+
+SECONDS_DAY = 86400
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS backups (
+    backup_name     TEXT PRIMARY KEY,
+    schedule        TEXT NOT NULL,
+    namespace       TEXT,
+    phase           TEXT NOT NULL,
+    start           REAL,
+    completion      REAL NOT NULL,
+    duration        REAL,
+    items_backed_up INTEGER,
+    total_items     INTEGER,
+    errors          INTEGER,
+    warnings        INTEGER,
+    expiration      REAL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS backups_schedule_completion ON backups (schedule, completion);
+CREATE INDEX IF NOT EXISTS backups_completion ON backups (completion);
+
+CREATE TABLE IF NOT EXISTS schedule_daily (
+    schedule         TEXT NOT NULL,
+    day              INTEGER NOT NULL,
+    total            INTEGER NOT NULL,
+    completed        INTEGER NOT NULL,
+    partially_failed INTEGER NOT NULL,
+    failed           INTEGER NOT NULL,
+    duration_sum     REAL NOT NULL,
+    duration_count   INTEGER NOT NULL,
+    items_sum        INTEGER NOT NULL,
+    PRIMARY KEY (day, schedule)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS namespace_gaps (
+    namespace TEXT NOT NULL,
+    gap_start REAL NOT NULL,
+    gap_end   REAL,
+    PRIMARY KEY (namespace, gap_start)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS namespace_gaps_end ON namespace_gaps (gap_end);
+"""
+
+# rollup of a terminal backup in its completion day
+UPSERT_DAILY = """
+INSERT INTO schedule_daily (schedule, day, total, completed, partially_failed, failed,
+                            duration_sum, duration_count, items_sum)
+VALUES (?, ?, 1, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (day, schedule) DO UPDATE SET
+    total = total + 1,
+    completed = completed + excluded.completed,
+    partially_failed = partially_failed + excluded.partially_failed,
+    failed = failed + excluded.failed,
+    duration_sum = duration_sum + excluded.duration_sum,
+    duration_count = duration_count + excluded.duration_count,
+    items_sum = items_sum + excluded.items_sum
+"""
+
+
+class HistoryStore:
+    """
+    Append-only history of the backup outcomes and of the unscheduled namespaces (SQLite file on the PVC).
+    Every terminal backup is stored once and rolled up per schedule and day: the aggregate queries read the
+    daily rollup, the detail queries the raw rows. The raw rows are kept raw_days, the rollups retention_days
+    """
+
+    def __init__(self, path='./logs/history.db', raw_days=90, retention_days=400):
+        self.path = path
+        self.raw_days = raw_days
+        self.retention_days = retention_days
+        self.last_compaction = 0.0
+
+        # the store is used by the checker and the http api from worker threads
+        self.lock = threading.Lock()
+
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.execute('PRAGMA synchronous = NORMAL')
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    @handle_exceptions_method
+    def record_backups(self, records, now=None):
+        """
+        Append the backups that reached a terminal phase, the backups already stored are ignored.
+        The backups completed before raw_days are skipped: their rows may be compacted already and the
+        rollup of their day must not count them again
+        @param records: BackupRecord iterable
+        @return: number of new backups
+        """
+        now = time.time() if now is None else now
+        raw_limit = now - self.raw_days * SECONDS_DAY
+        rows = [record for record in records
+                if record.phase in TERMINAL_PHASES and record.completion is not None
+                and record.completion >= raw_limit]
+        inserted = 0
+        with self.lock:
+            self.connection.execute('BEGIN')
+            try:
+                for record in rows:
+                    duration = record.duration
+                    cursor = self.connection.execute(
+                        'INSERT OR IGNORE INTO backups VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        (record.backup_name, record.schedule or '', record.namespace, record.phase.value,
+                         record.start, record.completion, duration, record.items_backed_up,
+                         record.total_items, record.errors, record.warnings, record.expiration))
+                    if cursor.rowcount == 0:
+                        continue
+                    inserted += 1
+                    self.connection.execute(UPSERT_DAILY,
+                                            (record.schedule or '',
+                                             int(record.completion // SECONDS_DAY),
+                                             int(record.phase == BackupPhase.COMPLETED),
+                                             int(record.phase == BackupPhase.PARTIALLY_FAILED),
+                                             int(record.phase in (BackupPhase.FAILED,
+                                                                  BackupPhase.FAILED_VALIDATION)),
+                                             duration or 0.0,
+                                             int(duration is not None),
+                                             record.items_backed_up))
+                self.connection.execute('COMMIT')
+            except Exception:
+                self.connection.execute('ROLLBACK')
+                raise
+
+        if now - self.last_compaction > SECONDS_DAY:
+            self.compact(now)
+        return inserted
+
+    @handle_exceptions_method
+    def record_unscheduled(self, namespaces, now=None):
+        """
+        Open a gap for the namespaces that became unscheduled and close the gaps of the namespaces
+        covered again by a schedule
+        @param namespaces: current unscheduled namespaces
+        """
+        now = time.time() if now is None else now
+        current = set(namespaces)
+        with self.lock:
+            opened = {row[0] for row in
+                      self.connection.execute('SELECT namespace FROM namespace_gaps WHERE gap_end IS NULL')}
+            self.connection.execute('BEGIN')
+            try:
+                self.connection.executemany('UPDATE namespace_gaps SET gap_end = ? '
+                                            'WHERE namespace = ? AND gap_end IS NULL',
+                                            [(now, namespace) for namespace in opened - current])
+                self.connection.executemany('INSERT OR IGNORE INTO namespace_gaps VALUES (?, ?, NULL)',
+                                            [(namespace, now) for namespace in current - opened])
+                self.connection.execute('COMMIT')
+            except Exception:
+                self.connection.execute('ROLLBACK')
+                raise
+
+    @handle_exceptions_method
+    def schedule_summary(self, start, end, schedule=None):
+        """
+        Outcome of the schedules in a time range, read from the daily rollup (day granularity)
+        @param start: epoch seconds
+        @param end: epoch seconds
+        @param schedule: only this schedule
+        """
+        query = ('SELECT schedule, SUM(total), SUM(completed), SUM(partially_failed), SUM(failed), '
+                 'SUM(duration_sum), SUM(duration_count), SUM(items_sum) '
+                 'FROM schedule_daily WHERE day >= ? AND day <= ?')
+        params = [int(start // SECONDS_DAY), int(end // SECONDS_DAY)]
+        if schedule is not None:
+            query += ' AND schedule = ?'
+            params.append(schedule)
+        query += ' GROUP BY schedule ORDER BY schedule'
+
+        with self.lock:
+            rows = self.connection.execute(query, params).fetchall()
+
+        summary = {}
+        for name, total, completed, partially_failed, failed, duration_sum, duration_count, items_sum in rows:
+            summary[name] = {'total': total,
+                             'completed': completed,
+                             'partially_failed': partially_failed,
+                             'failed': failed,
+                             'success_rate': round(completed / total, 4) if total else None,
+                             'avg_duration': round(duration_sum / duration_count, 1) if duration_count else None,
+                             'avg_items': round(items_sum / total, 1) if total else None}
+        return summary
+
+    @handle_exceptions_method
+    def schedule_backups(self, schedule, start, end, limit=1000):
+        """
+        Stored backups of a schedule completed in a time range (last first)
+        """
+        with self.lock:
+            cursor = self.connection.execute('SELECT * FROM backups WHERE schedule = ? AND completion >= ? '
+                                             'AND completion < ? ORDER BY completion DESC LIMIT ?',
+                                             (schedule, start, end, limit))
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    @handle_exceptions_method
+    def unprotected_namespaces(self, start, end):
+        """
+        Namespaces without a schedule for some time in the range
+        @return: namespace -> list of [gap start, gap end (None if still open)]
+        """
+        with self.lock:
+            rows = self.connection.execute('SELECT namespace, gap_start, gap_end FROM namespace_gaps '
+                                           'WHERE gap_start < ? AND (gap_end IS NULL OR gap_end > ?) '
+                                           'ORDER BY namespace, gap_start', (end, start)).fetchall()
+        result = {}
+        for namespace, gap_start, gap_end in rows:
+            result.setdefault(namespace, []).append([gap_start, gap_end])
+        return result
+
+    @handle_exceptions_method
+    def compact(self, now=None):
+        """
+        Drop the raw rows older than raw_days and the rollups and closed gaps older than retention_days
+        @return: number of deleted rows
+        """
+        now = time.time() if now is None else now
+        raw_limit = now - self.raw_days * SECONDS_DAY
+        retention_limit = now - self.retention_days * SECONDS_DAY
+        with self.lock:
+            self.connection.execute('BEGIN')
+            try:
+                deleted = self.connection.execute('DELETE FROM backups WHERE completion < ?',
+                                                  (raw_limit,)).rowcount
+                deleted += self.connection.execute('DELETE FROM schedule_daily WHERE day < ?',
+                                                   (int(retention_limit // SECONDS_DAY),)).rowcount
+                deleted += self.connection.execute('DELETE FROM namespace_gaps WHERE gap_end < ?',
+                                                   (retention_limit,)).rowcount
+                self.connection.execute('COMMIT')
+            except Exception:
+                self.connection.execute('ROLLBACK')
+                raise
+            if deleted > 0:
+                self.connection.execute('PRAGMA incremental_vacuum')
+        self.last_compaction = now
+        return deleted
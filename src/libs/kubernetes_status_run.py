@@ -1,9 +1,13 @@
 import asyncio
 
 from utils.config import ConfigK8sProcess
+from utils.transport_stats import TransportStats
 from utils.print_helper import PrintHelper
-from utils.handle_error import handle_exceptions_async_method
-from libs.velero_status import VeleroStatus
+from utils.log_structured import log_context
+from utils.handle_error import handle_exceptions_async_method, is_error_result
+
+# start key, schedules, backups, end key
+CYCLE_STEPS = 4
 
 
 class KubernetesStatusRun:
@@ -18,7 +22,8 @@ class KubernetesStatusRun:
                  logger=None,
                  queue=None,
                  cycles_seconds: int = 120,
-                 k8s_key_config: ConfigK8sProcess = None):
+                 k8s_key_config: ConfigK8sProcess = None,
+                 transport_stats: TransportStats = None):
 
         self.print_helper = PrintHelper('k8s_status_run', logger)
         self.print_debug = debug_on
@@ -30,11 +35,13 @@ class KubernetesStatusRun:
 
         self.cycle_seconds = cycles_seconds
         self.loop = 0
+        # set by a config reload: the wait of the cycle restarts with the new period
+        self.wake = asyncio.Event()
 
-        self.velero_stat = VeleroStatus(k8s_key_config,
-                                        debug_on,
-                                        logger,
-                                        self.print_helper)
+        # created on the first cycle: the kubernetes client and the kube config are loaded after the startup
+        self.logger = logger
+        self.velero_stat = None
+        self.transport_stats = transport_stats
 
         self.k8s_config = ConfigK8sProcess()
         if k8s_key_config is not None:
@@ -50,6 +57,110 @@ class KubernetesStatusRun:
 
         await self.queue.put(obj)
 
+    def __is_valid_result(self, key, result):
+        """
+        Errors and skipped requests (circuit open) are not forwarded to the checker:
+        it keeps the last known state
+        @param key: data key
+        @param result: data returned by VeleroStatus
+        """
+        if result is None:
+            self.print_helper.wrn("%s skipped, the api server is not available", key)
+            return False
+        if is_error_result(result):
+            self.print_helper.error("%s request in error: %s", key, result['error'].get('description'))
+            return False
+        return True
+
+    def apply_config(self, snapshot):
+        """
+        New settings from the next step of the cycle, the kubernetes client is kept
+        """
+        self.k8s_config = snapshot.k8s
+        if self.velero_stat is not None:
+            self.velero_stat.apply_config(snapshot.k8s)
+        if snapshot.cycle_seconds != self.cycle_seconds:
+            self.cycle_seconds = snapshot.cycle_seconds
+            self.wake.set()
+
+    async def __wait_next_cycle__(self):
+        """
+        Wait the cycle period, a new period applies to the wait in progress
+        """
+        start = asyncio.get_running_loop().time()
+        while True:
+            self.wake.clear()
+            remaining = start + self.cycle_seconds - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                return
+            try:
+                await asyncio.wait_for(self.wake.wait(), remaining)
+                self.print_helper.info("...cycle period changed to %s sec", self.cycle_seconds)
+            except asyncio.TimeoutError:
+                return
+
+    def __load_velero_status__(self):
+        if self.velero_stat is None:
+            # imported here: the kubernetes client is the slowest import of the watchdog
+            from libs.velero_status import VeleroStatus
+
+            self.velero_stat = VeleroStatus(self.k8s_config,
+                                            self.print_debug,
+                                            self.logger,
+                                            self.print_helper,
+                                            self.transport_stats)
+        return self.velero_stat
+
+    def __collect__(self, index):
+        """
+        Data of a step of the cycle
+        @param index: step (0 start key, 1 schedules, 2 backups, 3 end key)
+        """
+        data_res = {}
+        match index:
+            case 0:
+                # send start data key for capturing the state in one message
+                if self.k8s_config.disp_msg_key_unique:
+                    data_res[self.k8s_config.disp_msg_key_start] = "start"
+
+            case 1:
+                if self.k8s_config.schedule_enable:
+                    schedule_list = self.velero_stat.get_k8s_velero_schedules()
+                    if self.__is_valid_result(self.k8s_config.schedule_key, schedule_list):
+                        data_res[self.k8s_config.schedule_key] = schedule_list
+
+            case 2:
+                if self.k8s_config.backup_enable:
+                    backups_list = self.velero_stat.get_k8s_last_backup_status()
+                    if self.__is_valid_result(self.k8s_config.backup_key, backups_list):
+                        data_res[self.k8s_config.backup_key] = backups_list
+
+            case 3:
+                # send end data key for sending message
+                if self.k8s_config.disp_msg_key_unique:
+                    data_res[self.k8s_config.disp_msg_key_end] = "end"
+        return data_res
+
+    @handle_exceptions_async_method
+    async def run_once(self):
+        """
+        Single cycle without waits, followed by the stop signal of the checker
+        """
+        self.loop += 1
+        log_context.start_cycle(self.loop)
+        self.print_helper.info("start run once")
+
+        try:
+            await asyncio.to_thread(self.__load_velero_status__)
+            await self.__put_in_queue({self.k8s_config.cluster_name_key: self.k8s_config.cluster_name})
+            for index in range(CYCLE_STEPS):
+                data_res = self.__collect__(index)
+                if data_res:
+                    await self.__put_in_queue(data_res)
+        finally:
+            # the checker stops also when the cycle fails
+            await self.__put_in_queue(None)
+
     @handle_exceptions_async_method
     async def run(self):
         """
@@ -57,12 +168,6 @@ class KubernetesStatusRun:
         """
         self.print_helper.info(f"start main procedure seconds {self.cycle_seconds}")
 
-        seconds_waiting = self.cycle_seconds + 1
-        index = 0
-
-        # add wait
-        await asyncio.sleep(2)
-
         cluster_name = self.k8s_config.cluster_name
 
         data_res = {self.k8s_config.cluster_name_key: cluster_name}
@@ -70,55 +175,25 @@ class KubernetesStatusRun:
 
         while True:
             try:
-                if seconds_waiting > self.cycle_seconds:
-                    if index == 0:
-                        self.loop += 1
-                        self.print_helper.info(f"start run status. loop counter {self.loop} - index {index}")
-                        if self.loop > 500000:
-                            self.loop = 1
-
-                    data_res = {}
-
-                    self.print_helper.info(f"index request {index}-{index}")
-                    match index:
-                        case 0:
-                            # send start data key for capturing the state in one message
-                            if self.k8s_config.disp_msg_key_unique:
-                                data_res[self.k8s_config.disp_msg_key_start] = "start"
-
-                        case 1:
-                            if self.k8s_config.schedule_enable:
-                                schedule_list = self.velero_stat.get_k8s_velero_schedules()
-                                data_res[self.k8s_config.schedule_key] = schedule_list
-
-                        case 2:
-                            if self.k8s_config.backup_enable:
-                                backups_list = self.velero_stat.get_k8s_last_backup_status()
-                                data_res[self.k8s_config.backup_key] = backups_list
-
-                        case 3:
-                            # send end data key for sending message
-                            if self.k8s_config.disp_msg_key_unique:
-                                data_res[self.k8s_config.disp_msg_key_end] = "end"
-
-                        case _:
-                            seconds_waiting = 0
-                            index = 0
-
-                    if seconds_waiting > 0:
-                        index += 1
-                        if data_res:
-                            await self.__put_in_queue(data_res)
-
-                    else:
-                        index = 0
-                        self.print_helper.info(f"end read.{index}")
-
-                if seconds_waiting % 30 == 0:
-                    self.print_helper.info(f"...wait next check in {self.cycle_seconds - seconds_waiting} sec")
-
-                await asyncio.sleep(1)
-                seconds_waiting += 1
+                if self.velero_stat is None:
+                    # the event loop (status api) keeps running while the kubernetes client is loaded
+                    await asyncio.to_thread(self.__load_velero_status__)
+
+                self.loop += 1
+                if self.loop > 500000:
+                    self.loop = 1
+                log_context.start_cycle(self.loop)
+                self.print_helper.info("start run status. loop counter %s", self.loop)
+
+                for index in range(CYCLE_STEPS):
+                    self.print_helper.info("index request %s-%s", index, index)
+                    data_res = self.__collect__(index)
+                    if data_res:
+                        await self.__put_in_queue(data_res)
+
+                self.print_helper.info("...wait next check in %s sec", self.cycle_seconds)
+                await self.__wait_next_cycle__()
 
             except Exception as e:
                 self.print_helper.error(f"run.{e}")
+                await self.__wait_next_cycle__()
@@ -0,0 +1,173 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from bisect import bisect_left
+
+from utils.print_helper import PrintHelper
+from utils.handle_error import handle_exceptions_async_method
+
+# upper bounds (seconds) of the lag histogram buckets
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STACK_LIMIT = 30
+
+
+class LagHistogram:
+    """
+    Fixed buckets histogram of the scheduling delays (Prometheus semantic: le upper bounds)
+    """
+    __slots__ = ('bounds', 'counts', 'count', 'total', 'max')
+
+    def __init__(self, bounds=LAG_BUCKETS):
+        self.bounds = bounds
+        # the last bucket is +Inf
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """
+        Upper bound of the bucket holding the quantile (None if empty, inf beyond the last bound)
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return self.bounds[index] if index < len(self.bounds) else float('inf')
+        return float('inf')
+
+    def to_prometheus(self, name, help_text):
+        lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum {self.total:.6f}")
+        lines.append(f"{name}_count {self.count}")
+        return lines
+
+
+class LoopLagMonitor:
+    """
+    Sample the scheduling delay of the event loop: a coroutine sleeps a fixed interval and measures how late it
+    wakes up. A watcher thread detects the stalls (the coroutine does not wake up within the threshold) and
+    captures the stack of the event loop thread and the running task while the blocking call is still running
+    """
+
+    def __init__(self,
+                 debug_on=True,
+                 logger=None,
+                 interval_ms=500,
+                 stall_threshold_ms=1000,
+                 report_sec=300):
+        self.print_helper = PrintHelper('loop_monitor', logger)
+        self.debug_on = debug_on
+
+        self.print_helper.debug_if(self.debug_on, f"__init__")
+
+        self.interval = interval_ms / 1000
+        self.stall_threshold = stall_threshold_ms / 1000
+        self.report_sec = report_sec
+
+        self.histogram = LagHistogram()
+        self.stalls = 0
+        # duration, task, stack of the last stall
+        self.last_stall = None
+
+        self.loop = None
+        self.loop_thread_id = None
+        self.heartbeat = time.monotonic()
+        self.captured_heartbeat = None
+        self.stop_event = threading.Event()
+
+    def __capture__(self, blocked):
+        frame = sys._current_frames().get(self.loop_thread_id)
+        stack = ''.join(traceback.format_stack(frame, limit=STACK_LIMIT)) if frame is not None else ''
+        task = asyncio.current_task(self.loop)
+        task_name = 'no task'
+        if task is not None:
+            coro = task.get_coro()
+            task_name = f"{task.get_name()} {getattr(coro, '__qualname__', coro)}"
+        self.last_stall = {'blocked': blocked, 'task': task_name, 'stack': stack, 'time': time.time()}
+        self.print_helper.wrn('event loop blocked for %.0f ms in %s\n%s', blocked * 1000, task_name, stack)
+
+    def __watch__(self):
+        """
+        Watcher thread: capture the stack once for every stall
+        """
+        while not self.stop_event.wait(self.stall_threshold / 2):
+            heartbeat = self.heartbeat
+            blocked = time.monotonic() - heartbeat - self.interval
+            if blocked > self.stall_threshold and self.captured_heartbeat != heartbeat:
+                self.captured_heartbeat = heartbeat
+                try:
+                    self.__capture__(blocked)
+                except Exception as err:
+                    self.print_helper.error('stall capture error %s', err)
+
+    def __report__(self):
+        p50 = self.histogram.quantile(0.5)
+        p99 = self.histogram.quantile(0.99)
+        self.print_helper.info('event loop lag samples=%s p50<=%s s p99<=%s s max=%.3f s stalls=%s',
+                               self.histogram.count, p50, p99, self.histogram.max, self.stalls)
+
+    def metrics(self):
+        """
+        Prometheus text lines of the lag histogram and of the stalls
+        """
+        lines = self.histogram.to_prometheus('watchdog_event_loop_lag_seconds',
+                                             'Scheduling delay of the event loop')
+        lines += ['# HELP watchdog_event_loop_lag_max_seconds Max scheduling delay of the event loop',
+                  '# TYPE watchdog_event_loop_lag_max_seconds gauge',
+                  f'watchdog_event_loop_lag_max_seconds {self.histogram.max:.6f}',
+                  '# HELP watchdog_event_loop_stalls_total Scheduling delays above the stall threshold',
+                  '# TYPE watchdog_event_loop_stalls_total counter',
+                  f'watchdog_event_loop_stalls_total {self.stalls}']
+        return lines
+
+    @handle_exceptions_async_method
+    async def run(self):
+        """
+        Main loop
+        """
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread_id = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        self.stop_event.clear()
+        watcher = threading.Thread(target=self.__watch__, name='loop-monitor', daemon=True)
+        watcher.start()
+
+        self.print_helper.info(f"loop monitor interval={self.interval}s stall threshold={self.stall_threshold}s")
+        last_report = time.monotonic()
+        try:
+            while True:
+                expected = self.loop.time() + self.interval
+                await asyncio.sleep(self.interval)
+                lag = max(0.0, self.loop.time() - expected)
+                self.heartbeat = time.monotonic()
+
+                self.histogram.add(lag)
+                if lag > self.stall_threshold:
+                    self.stalls += 1
+
+                if self.heartbeat - last_report >= self.report_sec:
+                    last_report = self.heartbeat
+                    self.__report__()
+
+        except Exception as err:
+            self.print_helper.error_and_exception(f"run", err)
+        finally:
+            self.stop_event.set()
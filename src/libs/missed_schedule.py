@@ -0,0 +1,105 @@
+from datetime import datetime, timezone
+
+from utils.cron import CronExpression, CronError
+from libs.velero_records import BackupRecord, ScheduleRecord
+
+# a backup started slightly before the expected activation still matches it (clock skew)
+MATCH_TOLERANCE_SECONDS = 60
+BACKUP_NAME_TIME_FORMAT = '%Y%m%d%H%M%S'
+
+
+def backup_time(record: BackupRecord):
+    """
+    Activation time of a backup: start time, or the timestamp suffix of the name given by the schedule
+    (<schedule>-yyyymmddhhmmss) for the backups not started yet, or the completion time
+    """
+    if record.start is not None:
+        return record.start
+    suffix = record.backup_name.rsplit('-', 1)[-1]
+    if len(suffix) == 14 and suffix.isdigit():
+        try:
+            return datetime.strptime(suffix, BACKUP_NAME_TIME_FORMAT).replace(tzinfo=timezone.utc).timestamp()
+        except ValueError:
+            pass
+    return record.completion
+
+
+class MissedSchedule:
+    __slots__ = ('name', 'expected', 'last_backup', 'last_time', 'paused')
+
+    def __init__(self, name, expected, last_backup, last_time, paused):
+        self.name = name
+        self.expected = expected
+        self.last_backup = last_backup
+        self.last_time = last_time
+        self.paused = paused
+
+
+class MissedScheduleDetector:
+    """
+    Detect the schedules that did not fire: for every schedule the last expected activation
+    (older than the grace period) is compared with the last backup of the schedule.
+    The cron expressions are compiled once and recompiled only when they change
+    """
+
+    def __init__(self, grace_seconds=3600):
+        self.grace_seconds = grace_seconds
+        # schedule name -> (cron expression, compiled expression or None if not valid)
+        self.compiled = {}
+
+    def __compile__(self, schedule: ScheduleRecord):
+        cached = self.compiled.get(schedule.name)
+        if cached is not None and cached[0] == schedule.cron_time:
+            return cached[1], None
+        try:
+            expression = CronExpression(schedule.cron_time)
+            error = None
+        except (CronError, ValueError) as err:
+            expression = None
+            error = f"{schedule.name}: {err}"
+        self.compiled[schedule.name] = (schedule.cron_time, expression)
+        return expression, error
+
+    def check(self, schedules: dict, backups: dict, now: float):
+        """
+        @param schedules: schedule name -> ScheduleRecord
+        @param backups: last backup records (one for every schedule)
+        @param now: epoch seconds
+        @return: dict schedule name -> MissedSchedule, list of the cron expressions not valid
+        """
+        for name in [name for name in self.compiled if name not in schedules]:
+            del self.compiled[name]
+
+        latest = {record.schedule: record for record in backups.values() if record.schedule is not None}
+        missed = {}
+        errors = []
+        for name, schedule in schedules.items():
+            expression, error = self.__compile__(schedule)
+            if error is not None:
+                errors.append(error)
+            if expression is None:
+                continue
+
+            record = latest.get(name)
+            last_time = backup_time(record) if record is not None else None
+
+            if expression.interval is not None:
+                reference = last_time if last_time is not None else schedule.created
+                if reference is None:
+                    continue
+                expected = reference + expression.interval
+                if now <= expected + self.grace_seconds:
+                    continue
+            else:
+                expected = expression.previous_fire(now - self.grace_seconds)
+                if expected is None:
+                    continue
+                if schedule.created is not None and expected < schedule.created:
+                    continue
+                if last_time is not None and last_time >= expected - MATCH_TOLERANCE_SECONDS:
+                    continue
+
+            missed[name] = MissedSchedule(name, expected,
+                                          record.backup_name if record is not None else None,
+                                          last_time, schedule.paused)
+        return missed, errors
@@ -0,0 +1,143 @@
+from fnmatch import fnmatchcase
+
+GLOB_CHARS = ('*', '?', '[')
+
+
+class CoverageRule:
+    """
+    Namespaces selected by a schedule, with the Velero semantics:
+    empty or '*' included list means all the namespaces, glob patterns, excluded namespaces win.
+    The label selectors (labelSelector, orLabelSelectors) select resources inside the included namespaces,
+    not the namespaces: a schedule with selectors covers its included namespaces
+    """
+    __slots__ = ('all_namespaces', 'names', 'patterns', 'excluded_names', 'excluded_patterns')
+
+    def __init__(self, included=(), excluded=()):
+        self.all_namespaces = len(included) == 0 or '*' in included
+        self.names = frozenset(name for name in included if not any(char in name for char in GLOB_CHARS))
+        self.patterns = tuple(name for name in included if name != '*' and name not in self.names)
+        self.excluded_names = frozenset(name for name in excluded if not any(char in name for char in GLOB_CHARS))
+        self.excluded_patterns = tuple(name for name in excluded if name not in self.excluded_names)
+
+    @property
+    def explicit_only(self):
+        """
+        The rule selects only the listed names: the candidate namespaces are the names
+        """
+        return not self.all_namespaces and len(self.patterns) == 0
+
+    def covers(self, namespace, labels):
+        if namespace in self.excluded_names:
+            return False
+        if any(fnmatchcase(namespace, pattern) for pattern in self.excluded_patterns):
+            return False
+        return self.all_namespaces or namespace in self.names or \
+            any(fnmatchcase(namespace, pattern) for pattern in self.patterns)
+
+
+class NamespaceCoverageIndex:
+    """
+    Inverted index namespace -> covering schedules, updated incrementally:
+    a changed namespace is evaluated against the schedules, a changed schedule against the namespaces
+    (only its listed names when it has no wildcard). Unprotected namespaces and covering schedules are lookups
+    """
+
+    def __init__(self):
+        # namespace -> labels
+        self.namespaces = {}
+        # schedule name -> (spec key, CoverageRule)
+        self.rules = {}
+        # namespace -> set of schedule names
+        self.covered_by = {}
+        # schedule name -> set of namespaces
+        self.covers = {}
+        self.unprotected_set = set()
+
+    def __link__(self, namespace, schedule):
+        self.covered_by[namespace].add(schedule)
+        self.covers[schedule].add(namespace)
+        self.unprotected_set.discard(namespace)
+
+    def __unlink__(self, namespace, schedule):
+        schedules = self.covered_by.get(namespace)
+        if schedules is not None:
+            schedules.discard(schedule)
+            if len(schedules) == 0:
+                self.unprotected_set.add(namespace)
+
+    def __remove_namespace__(self, namespace):
+        for schedule in self.covered_by.pop(namespace, ()):
+            self.covers[schedule].discard(namespace)
+        self.unprotected_set.discard(namespace)
+        del self.namespaces[namespace]
+
+    def __evaluate_namespace__(self, namespace, labels):
+        for schedule in self.covered_by.get(namespace, ()):
+            self.covers[schedule].discard(namespace)
+        self.namespaces[namespace] = labels
+        self.covered_by[namespace] = set()
+        self.unprotected_set.add(namespace)
+        for schedule, (_, rule) in self.rules.items():
+            if rule.covers(namespace, labels):
+                self.__link__(namespace, schedule)
+
+    def __remove_schedule__(self, schedule):
+        for namespace in self.covers.pop(schedule, ()):
+            self.__unlink__(namespace, schedule)
+        del self.rules[schedule]
+
+    def __evaluate_schedule__(self, schedule, key, rule: CoverageRule):
+        if schedule in self.rules:
+            self.__remove_schedule__(schedule)
+        self.rules[schedule] = (key, rule)
+        self.covers[schedule] = set()
+        candidates = rule.names if rule.explicit_only else self.namespaces
+        for namespace in candidates:
+            labels = self.namespaces.get(namespace)
+            if labels is not None and rule.covers(namespace, labels):
+                self.__link__(namespace, schedule)
+
+    def update_namespaces(self, namespaces: dict):
+        """
+        Apply the current namespaces
+        @param namespaces: namespace -> labels
+        @return: number of namespaces added, removed or with new labels
+        """
+        changes = 0
+        for namespace in [namespace for namespace in self.namespaces if namespace not in namespaces]:
+            self.__remove_namespace__(namespace)
+            changes += 1
+        for namespace, labels in namespaces.items():
+            if self.namespaces.get(namespace) != labels:
+                self.__evaluate_namespace__(namespace, labels)
+                changes += 1
+        return changes
+
+    def update_schedules(self, schedules: dict):
+        """
+        Apply the current schedules
+        @param schedules: schedule name -> ScheduleRecord
+        @return: number of schedules added, removed or with a new selection
+        """
+        changes = 0
+        for schedule in [schedule for schedule in self.rules if schedule not in schedules]:
+            self.__remove_schedule__(schedule)
+            changes += 1
+        for schedule, record in schedules.items():
+            key = (record.included_namespaces, record.excluded_namespaces)
+            current = self.rules.get(schedule)
+            if current is not None and current[0] == key:
+                continue
+            self.__evaluate_schedule__(schedule, key, CoverageRule(*key))
+            changes += 1
+        return changes
+
+    @property
+    def schedule_names(self):
+        return self.rules.keys()
+
+    def unprotected(self):
+        return sorted(self.unprotected_set)
+
+    def covering(self, namespace):
+        return sorted(self.covered_by.get(namespace, ()))
@@ -0,0 +1,111 @@
+import hashlib
+import re
+import time
+from collections import OrderedDict
+
+from libs.notification_event import NotificationEvent
+
+# volatile parts of a report: replaced before the fingerprint, a report that differs only in these is a repeat
+VOLATILE_PATTERNS = (
+    # timestamps (end at, expected at, ...)
+    (re.compile(r'\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(:\d{2})?\S*'), '<time>'),
+    # expiry countdown of the details and of the warning list
+    (re.compile(r'expire=(\d+d|in progress|N/A)'), 'expire=<days>'),
+    # progress of the volumes
+    (re.compile(r'bytes=\d+/\d+'), 'bytes=<n>/<n>'),
+    # timestamp suffix of the backup names created by a schedule (name-20240101120000)
+    (re.compile(r'-\d{14}\b'), '-<ts>'),
+    (re.compile(r'[ \t]+'), ' '),
+)
+
+
+def normalize_message(message):
+    for pattern, replace in VOLATILE_PATTERNS:
+        message = pattern.sub(replace, message)
+    return message.strip()
+
+
+def message_text(message):
+    return message.message if isinstance(message, NotificationEvent) else message
+
+
+def fingerprint(message):
+    """
+    Fingerprint of a report without the volatile fields, for an event also of its destination:
+    the same report sent to two destinations is not a repeat
+    """
+    text = normalize_message(message_text(message))
+    if isinstance(message, NotificationEvent):
+        text = f"{message.destination!r}\n{text}"
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=12).hexdigest()
+
+
+class _Entry:
+    __slots__ = ('first_sent', 'repeated', 'last_message')
+
+    def __init__(self, first_sent, message):
+        self.first_sent = first_sent
+        self.repeated = 0
+        self.last_message = message
+
+
+class NotificationDeduplicator:
+    """
+    Suppress the reports with the same fingerprint sent within the window. When the window of a suppressed report
+    closes, its last version is sent once with "(repeated N times)". The cache is bounded: the oldest fingerprint
+    is evicted (and its repeats flushed) when the max entries are reached
+    """
+
+    def __init__(self, window_seconds=900, max_entries=256):
+        self.window_seconds = window_seconds
+        self.max_entries = max(1, max_entries)
+        # fingerprint -> entry, ordered by first send
+        self.entries = OrderedDict()
+        self.suppressed = 0
+
+    @staticmethod
+    def repeated_message(entry: _Entry):
+        """
+        Last version of the report (text or NotificationEvent) with the number of repeats
+        """
+        text = f"{message_text(entry.last_message)}\n(repeated {entry.repeated} times)"
+        if isinstance(entry.last_message, NotificationEvent):
+            return entry.last_message.with_message(text)
+        return text
+
+    def admit(self, message, now=None):
+        """
+        @param message: report text or NotificationEvent
+        @return: True if the message is sent now, False if it is a repeat within the window
+        """
+        if self.window_seconds <= 0:
+            return True
+        now = time.monotonic() if now is None else now
+        key = fingerprint(message)
+        entry = self.entries.get(key)
+        if entry is not None and now - entry.first_sent < self.window_seconds:
+            entry.repeated += 1
+            entry.last_message = message
+            self.suppressed += 1
+            return False
+        if entry is not None:
+            # window closed and not flushed yet: the repeats are dropped, the new message opens a new window
+            del self.entries[key]
+        self.entries[key] = _Entry(now, message)
+        return True
+
+    def expired(self, now=None):
+        """
+        Close the elapsed windows and the entries above the max size
+        @return: messages of the closed windows with repeats
+        """
+        now = time.monotonic() if now is None else now
+        messages = []
+        while len(self.entries) > 0:
+            key, entry = next(iter(self.entries.items()))
+            if now - entry.first_sent < self.window_seconds and len(self.entries) <= self.max_entries:
+                break
+            del self.entries[key]
+            if entry.repeated > 0:
+                messages.append(self.repeated_message(entry))
+        return messages
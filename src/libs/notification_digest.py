@@ -0,0 +1,200 @@
+import time
+
+from libs.velero_records import BackupRecord
+from libs.run_once import FAILED_PHASES
+
+DIGEST_BACKUP = 'backup'
+DIGEST_SCHEDULE = 'schedule'
+
+
+def is_failure(record: BackupRecord):
+    """
+    Changes that bypass the digest window
+    """
+    return record is not None and (record.phase in FAILED_PHASES or record.errors > 0)
+
+
+def _format_backup(record: BackupRecord):
+    if record is None:
+        return 'none'
+    return f"{record.backup_name} {record.phase.value}"
+
+
+class _BackupChange:
+    __slots__ = ('first', 'last')
+
+    def __init__(self, first, last):
+        self.first = first
+        self.last = last
+
+
+class _ScheduleChange:
+    __slots__ = ('kind', 'fields')
+
+    def __init__(self, kind):
+        self.kind = kind
+        # field -> [first old value, last new value]
+        self.fields = {}
+
+
+class ChangeDigest:
+    """
+    Changes accumulated over a window and sent as one summary. Every backup key (schedule, or backup name
+    without schedule) and every schedule keeps only the first and the last state of the window: the intermediate
+    states are merged as they arrive. The warnings of the backups (anomalies, failed volumes, expiring) keep their
+    last text. The entries are bounded, the changes above the limit are only counted
+    """
+
+    def __init__(self, window_seconds=900, max_entries=500):
+        self.window_seconds = window_seconds
+        self.max_entries = max(1, max_entries)
+
+        self.started = None
+        self.events = 0
+        self.dropped = 0
+        # (kind, name) -> change
+        self.entries = {}
+        self.unscheduled = set()
+        self.scheduled = set()
+        # (kind, backup name) -> text
+        self.warnings = {}
+
+    def __len__(self):
+        return len(self.entries) + len(self.unscheduled) + len(self.scheduled) + len(self.warnings)
+
+    @property
+    def has_warnings(self):
+        return len(self.warnings) > 0 or len(self.unscheduled) > 0
+
+    def __entry__(self, key, factory):
+        entry = self.entries.get(key)
+        if entry is None:
+            if len(self) >= self.max_entries:
+                self.dropped += 1
+                return None
+            entry = factory()
+            self.entries[key] = entry
+        return entry
+
+    def __touch__(self, now):
+        self.events += 1
+        if self.started is None:
+            self.started = time.monotonic() if now is None else now
+
+    def add_backup(self, key, old: BackupRecord | None, new: BackupRecord | None, now=None):
+        """
+        @param key: schedule name or backup name of the backups without schedule
+        @param old: previous record (None if added)
+        @param new: current record (None if removed)
+        """
+        self.__touch__(now)
+        entry = self.__entry__((DIGEST_BACKUP, key), lambda: _BackupChange(old, new))
+        if entry is None:
+            return
+        entry.last = new if new is not None or entry.last is None or entry.last == old else entry.last
+        if entry.first == entry.last:
+            # back to the first state (or added and removed): nothing to report
+            del self.entries[(DIGEST_BACKUP, key)]
+
+    def add_schedule(self, name, kind, changed_fields=(), now=None):
+        """
+        @param kind: added, removed or updated
+        @param changed_fields: (field, old value, new value) of an update
+        """
+        self.__touch__(now)
+        entry = self.__entry__((DIGEST_SCHEDULE, name), lambda: _ScheduleChange(kind))
+        if entry is None:
+            return
+        if entry.kind == 'added' and kind == 'removed':
+            del self.entries[(DIGEST_SCHEDULE, name)]
+            return
+        if kind != 'updated' or entry.kind == 'removed':
+            entry.kind = kind
+        for field, old_value, new_value in changed_fields:
+            values = entry.fields.setdefault(field, [old_value, new_value])
+            values[1] = new_value
+            if values[0] == values[1]:
+                del entry.fields[field]
+
+    def add_namespaces(self, scheduled, unscheduled, now=None):
+        """
+        @param scheduled: namespaces covered again by a schedule
+        @param unscheduled: namespaces no longer covered
+        """
+        self.__touch__(now)
+        for namespace in scheduled:
+            if namespace in self.unscheduled:
+                self.unscheduled.discard(namespace)
+            elif len(self) < self.max_entries:
+                self.scheduled.add(namespace)
+            else:
+                self.dropped += 1
+        for namespace in unscheduled:
+            if namespace in self.scheduled:
+                self.scheduled.discard(namespace)
+            elif len(self) < self.max_entries:
+                self.unscheduled.add(namespace)
+            else:
+                self.dropped += 1
+
+    def add_warnings(self, warnings, now=None):
+        """
+        @param warnings: (key, text) of the warnings of the backups, a key already listed is updated
+        """
+        if len(warnings) == 0:
+            return
+        self.__touch__(now)
+        for key, text in warnings:
+            if key in self.warnings or len(self) < self.max_entries:
+                self.warnings[key] = text
+            else:
+                self.dropped += 1
+
+    def due(self, now=None):
+        now = time.monotonic() if now is None else now
+        return self.started is not None and now - self.started >= self.window_seconds
+
+    def reset(self):
+        self.started = None
+        self.events = 0
+        self.dropped = 0
+        self.entries = {}
+        self.unscheduled = set()
+        self.scheduled = set()
+        self.warnings = {}
+
+    def render(self):
+        """
+        Summary of the window ('' if the changes cancelled each other)
+        """
+        point = '\u2022'
+        backups = [(name, entry) for (kind, name), entry in self.entries.items() if kind == DIGEST_BACKUP]
+        schedules = [(name, entry) for (kind, name), entry in self.entries.items() if kind == DIGEST_SCHEDULE]
+        schedules = [(name, entry) for name, entry in schedules if entry.kind != 'updated' or len(entry.fields) > 0]
+        if len(backups) + len(schedules) + len(self.unscheduled) + len(self.scheduled) + len(self.warnings) + \
+                self.dropped == 0:
+            return ''
+
+        message = f'Digest of the last {int(self.window_seconds / 60)} min [{self.events} changes]'
+        if len(backups) > 0:
+            message += f'\n{point} Backups changed={len(backups)}'
+            for name, entry in sorted(backups, key=lambda item: item[0]):
+                message += f'\n\t{name}: {_format_backup(entry.first)} -> {_format_backup(entry.last)}'
+        if len(schedules) > 0:
+            message += f'\n{point} Schedules changed={len(schedules)}'
+            for name, entry in sorted(schedules, key=lambda item: item[0]):
+                message += f'\n\t{name}: {entry.kind}'
+                for field, (old_value, new_value) in entry.fields.items():
+                    message += f'\n\t\t{field}: from {old_value} to {new_value}'
+        if len(self.unscheduled) > 0:
+            message += f'\n{point} Namespaces without schedule={len(self.unscheduled)}'
+            message += ''.join(f'\n\t{namespace}' for namespace in sorted(self.unscheduled))
+        if len(self.scheduled) > 0:
+            message += f'\n{point} Namespaces scheduled again={len(self.scheduled)}'
+            message += ''.join(f'\n\t{namespace}' for namespace in sorted(self.scheduled))
+        if len(self.warnings) > 0:
+            message += f'\n{point} Warnings={len(self.warnings)}'
+            message += ''.join(f'\n\t{text}' for key, text in sorted(self.warnings.items()))
+        if self.dropped > 0:
+            message += f'\n{point} Changes not listed (max {self.max_entries})={self.dropped}'
+        return message
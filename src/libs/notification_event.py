@@ -0,0 +1,133 @@
+import asyncio
+import heapq
+import time
+from dataclasses import dataclass, field, replace
+from enum import IntEnum
+
+
+class Severity(IntEnum):
+    """
+    Severity of a notification, lower values are sent first
+    """
+    CRITICAL = 0
+    WARNING = 1
+    INFO = 2
+    LOW = 3
+
+    def __str__(self):
+        return self.name.lower()
+
+
+# the stop signal (None) follows all the pending notifications
+_STOP_PRIORITY = len(Severity)
+
+# kinds of notification
+EVENT_REPORT = 'report'
+EVENT_SCHEDULE = 'schedule'
+EVENT_MISSED = 'missed'
+EVENT_DIGEST = 'digest'
+EVENT_ALIVE = 'alive'
+EVENT_CONFIG = 'config'
+EVENT_SHARD = 'shard'
+
+COALESCE_SEPARATOR = f"\n{'-' * 20}\n"
+
+
+@dataclass(frozen=True, slots=True)
+class Destination:
+    """
+    Recipients of a notification route. The default destination (empty fields) uses the channels configuration,
+    a route without telegram chat or without email recipients is not sent on that channel
+    """
+    name: str = 'default'
+    telegram_chat_id: str = ''
+    # bot of the route, the channel token if empty
+    telegram_token: str = ''
+    email_recipients: str = ''
+
+    @property
+    def is_default(self):
+        return not self.telegram_chat_id and not self.email_recipients
+
+
+DEFAULT_DESTINATION = Destination()
+
+
+@dataclass(frozen=True, slots=True)
+class NotificationEvent:
+    """
+    Envelope of a message sent to the channels
+    """
+    message: str
+    severity: Severity = Severity.INFO
+    cluster: str = ''
+    # order of creation in the checker: FIFO within the same severity
+    sequence: int = 0
+    kind: str = EVENT_REPORT
+    destination: Destination = DEFAULT_DESTINATION
+    created: float = field(default_factory=time.time, compare=False)
+
+    def with_message(self, message):
+        return replace(self, message=message)
+
+    def __len__(self):
+        return len(self.message)
+
+
+class NotificationQueue(asyncio.Queue):
+    """
+    Priority queue of the notifications: severity first, then sequence. The stop signal (None) is served
+    after all the pending notifications.
+    Under pressure (pending notifications >= pressure_size) the INFO and LOW notifications are coalesced
+    with the last pending one of the same severity, kind, cluster and destination: the INFO messages are
+    appended to it, a LOW message replaces it. 0 disables the coalescing
+    """
+
+    def __init__(self, pressure_size=0):
+        super().__init__()
+        self.pressure_size = pressure_size
+        self.coalesced = 0
+
+    def _init(self, maxsize):
+        # entries: [priority, sequence, counter, event]
+        self._queue = []
+        self.counter = 0
+        # (severity, kind, cluster, destination) -> last pending entry open to the coalescing
+        self.tails = {}
+
+    def _put(self, item):
+        if item is None:
+            self.counter += 1
+            heapq.heappush(self._queue, [_STOP_PRIORITY, 0, self.counter, None])
+            return
+
+        key = (item.severity, item.kind, item.cluster, item.destination)
+        if item.severity >= Severity.INFO and 0 < self.pressure_size <= len(self._queue):
+            entry = self.tails.get(key)
+            if entry is not None:
+                pending = entry[3]
+                entry[3] = item if item.severity == Severity.LOW else \
+                    pending.with_message(f"{pending.message}{COALESCE_SEPARATOR}{item.message}")
+                self.coalesced += 1
+                return
+
+        self.counter += 1
+        entry = [int(item.severity), item.sequence, self.counter, item]
+        heapq.heappush(self._queue, entry)
+        if item.severity >= Severity.INFO:
+            self.tails[key] = entry
+
+    def _get(self):
+        entry = heapq.heappop(self._queue)
+        item = entry[3]
+        if item is not None:
+            key = (item.severity, item.kind, item.cluster, item.destination)
+            if self.tails.get(key) is entry:
+                del self.tails[key]
+        return item
+
+    def preempts(self, event: NotificationEvent):
+        """
+        @return: True if a pending notification has a higher severity than the event
+        """
+        return len(self._queue) > 0 and self._queue[0][0] < event.severity
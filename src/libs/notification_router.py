@@ -0,0 +1,157 @@
+import re
+from dataclasses import dataclass
+from fnmatch import translate
+
+from libs.notification_event import Destination, DEFAULT_DESTINATION, Severity
+
+ROUTE_KEYS = ('name', 'namespace', 'schedule', 'cluster', 'severity', 'telegram_chat_id', 'telegram_token', 'email')
+# cached routes, cleared when full
+MAX_CACHE_ENTRIES = 4096
+
+
+def _compile_globs(value):
+    """
+    One regex for a comma separated list of globs, None if empty (any value)
+    """
+    globs = [glob.strip() for glob in value.split(',') if len(glob.strip()) > 0]
+    if len(globs) == 0:
+        return None
+    return re.compile('|'.join(f'(?:{translate(glob)})' for glob in globs))
+
+
+@dataclass(frozen=True, slots=True)
+class RouteRule:
+    """
+    Compiled route: every field set must match, the namespace pattern matches if any namespace of the item matches
+    """
+    destination: Destination
+    namespace: re.Pattern | None = None
+    schedule: re.Pattern | None = None
+    cluster: re.Pattern | None = None
+    # the items at least as severe
+    severity: Severity = Severity.LOW
+
+    def matches(self, namespaces, schedule, severity, cluster):
+        if severity > self.severity:
+            return False
+        if self.cluster is not None and self.cluster.match(cluster or '') is None:
+            return False
+        if self.schedule is not None and (schedule is None or self.schedule.match(schedule) is None):
+            return False
+        if self.namespace is not None and not any(self.namespace.match(namespace) for namespace in namespaces):
+            return False
+        return True
+
+
+def parse_route(text, index=1):
+    """
+    Parse a route definition: space separated key=value fields, e.g.
+    "name=payments namespace=payments-*,billing severity=critical telegram_chat_id=-100123 email=a@b.com;c@d.com"
+    @raise ValueError: not a string, unknown field, severity not valid or no recipients
+    """
+    if not isinstance(text, str):
+        raise ValueError(f"route {index}: not valid {text!r}")
+    values = {}
+    for token in text.split():
+        key, separator, value = token.partition('=')
+        if separator == '' or key not in ROUTE_KEYS:
+            raise ValueError(f"route {index}: field not valid '{token}' (fields {', '.join(ROUTE_KEYS)})")
+        values[key] = value
+
+    severity = Severity.LOW
+    if 'severity' in values:
+        try:
+            severity = Severity[values['severity'].upper()]
+        except KeyError:
+            raise ValueError(f"route {index}: severity not valid '{values['severity']}'") from None
+
+    destination = Destination(name=values.get('name', f'route-{index}'),
+                              telegram_chat_id=values.get('telegram_chat_id', ''),
+                              telegram_token=values.get('telegram_token', ''),
+                              email_recipients=values.get('email', ''))
+    if destination.is_default:
+        raise ValueError(f"route {index}: no telegram_chat_id or email")
+
+    return RouteRule(destination=destination,
+                     namespace=_compile_globs(values.get('namespace', '')),
+                     schedule=_compile_globs(values.get('schedule', '')),
+                     cluster=_compile_globs(values.get('cluster', '')),
+                     severity=severity)
+
+
+def compile_routes(routes):
+    """
+    Compile the route definitions, the routes not valid are skipped
+    @return: (tuple of RouteRule, errors of the routes not valid)
+    """
+    rules = []
+    errors = []
+    for index, text in enumerate(routes, start=1):
+        try:
+            rules.append(parse_route(text, index))
+        except ValueError as err:
+            errors.append(str(err))
+    return tuple(rules), errors
+
+
+class NotificationRouter:
+    """
+    Destination of the notifications: the first route matching namespaces, schedule, severity and cluster,
+    the default destination if none. The routes are compiled once, the matches are cached
+    """
+
+    def __init__(self, routes=()):
+        self.rules = ()
+        self.cache = {}
+        self.errors = self.set_routes(routes)
+
+    def set_routes(self, routes):
+        """
+        Compile the route definitions, the routes not valid are skipped
+        @return: errors of the routes not valid
+        """
+        rules, errors = compile_routes(routes)
+        self.set_rules(rules)
+        return errors
+
+    def set_rules(self, rules):
+        """
+        Swap the compiled routes (config reload)
+        """
+        self.rules = rules
+        self.cache = {}
+
+    @property
+    def active(self):
+        return len(self.rules) > 0
+
+    def route(self, namespaces=(), schedule=None, severity=Severity.INFO, cluster=''):
+        """
+        @param namespaces: namespaces of the item (tuple)
+        @return: Destination
+        """
+        if len(self.rules) == 0:
+            return DEFAULT_DESTINATION
+        key = (namespaces, schedule, severity, cluster)
+        destination = self.cache.get(key)
+        if destination is None:
+            destination = DEFAULT_DESTINATION
+            for rule in self.rules:
+                if rule.matches(namespaces, schedule, severity, cluster):
+                    destination = rule.destination
+                    break
+            if len(self.cache) >= MAX_CACHE_ENTRIES:
+                self.cache.clear()
+            self.cache[key] = destination
+        return destination
+
+    def split(self, items, cluster=''):
+        """
+        Group the items by destination in a single pass
+        @param items: iterable of (key, namespaces, schedule, severity)
+        @return: destination -> list of keys, in the order of the items
+        """
+        groups = {}
+        for key, namespaces, schedule, severity in items:
+            groups.setdefault(self.route(namespaces, schedule, severity, cluster), []).append(key)
+        return groups
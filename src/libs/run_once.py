@@ -0,0 +1,97 @@
+import json
+import os
+import sys
+import time
+
+from libs.velero_records import BackupPhase, BackupRecord, format_epoch
+
+# exit codes of the run once mode (worst state)
+EXIT_OK = 0
+EXIT_WARNING = 1
+EXIT_FAILED = 2
+EXIT_ERROR = 3
+
+STATE_OK = 'ok'
+STATE_WARNING = 'warning'
+STATE_FAILED = 'failed'
+STATE_ERROR = 'error'
+
+STATE_EXIT_CODES = {STATE_OK: EXIT_OK,
+                    STATE_WARNING: EXIT_WARNING,
+                    STATE_FAILED: EXIT_FAILED,
+                    STATE_ERROR: EXIT_ERROR}
+
+FAILED_PHASES = frozenset((BackupPhase.FAILED, BackupPhase.PARTIALLY_FAILED, BackupPhase.FAILED_VALIDATION))
+
+
+def worst_state(*states):
+    return max(states, key=STATE_EXIT_CODES.get, default=STATE_OK)
+
+
+def backup_state(record: BackupRecord, expires_days_warning):
+    """
+    failed: failed phases or errors, warning: warnings or expiring soon, otherwise ok
+    """
+    if record.phase in FAILED_PHASES or record.errors > 0:
+        return STATE_FAILED
+    if record.warnings > 0 or (record.expire_days is not None and record.expire_days < expires_days_warning):
+        return STATE_WARNING
+    return STATE_OK
+
+
+def build_report(cluster_name, schedules, backups, unscheduled, missed, expires_days_warning):
+    """
+    JSON report of a single cycle
+    @param schedules: schedule name -> ScheduleRecord (None if not collected)
+    @param backups: backup name -> BackupRecord (None if not collected)
+    @param unscheduled: UnscheduledNamespaces or None
+    @param missed: schedule name -> expected activation (epoch) of the missed schedules
+    @return: report dict, exit code
+    """
+    report = {'cluster': cluster_name,
+              'time': format_epoch(time.time())}
+
+    if backups is None:
+        # the backups were not collected (api server not available or backups disabled)
+        state = STATE_ERROR
+        report['backups'] = None
+    else:
+        states = {name: backup_state(record, expires_days_warning) for name, record in backups.items()}
+        report['backups'] = [dict(record.to_dict(), state=states[name]) for name, record in backups.items()]
+        state = worst_state(*states.values())
+
+    report['schedules'] = None if schedules is None else [record.to_dict() for record in schedules.values()]
+
+    report['unscheduled'] = None if unscheduled is None else unscheduled.to_dict()
+    if unscheduled is not None and unscheduled.counter > 0:
+        state = worst_state(state, STATE_WARNING)
+
+    report['missed_schedules'] = [{'schedule': name, 'expected': format_epoch(expected)}
+                                  for name, expected in sorted(missed.items())]
+    if len(missed) > 0:
+        state = worst_state(state, STATE_WARNING)
+
+    report['state'] = state
+    report['exit_code'] = STATE_EXIT_CODES[state]
+    return report, report['exit_code']
+
+
+def write_report(report, output=None):
+    """
+    Write the report to a file (atomic replace) or to the standard output
+    @param output: file path, None or '-' for the standard output
+    """
+    body = json.dumps(report, indent=2, default=str)
+    if output is None or output == '-':
+        # the logs are on stderr, stdout is reserved to the report
+        sys.__stdout__.write(body + '\n')
+        sys.__stdout__.flush()
+        return
+
+    folder = os.path.dirname(os.path.abspath(output))
+    os.makedirs(folder, exist_ok=True)
+    temp_path = f"{output}.tmp"
+    with open(temp_path, 'w') as file:
+        file.write(body)
+        file.write('\n')
+    os.replace(temp_path, output)
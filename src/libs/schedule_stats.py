@@ -0,0 +1,137 @@
+import json
+import math
+import os
+
+from utils.handle_error import handle_exceptions_method
+from libs.velero_records import BackupPhase
+
+
+class RunningStats:
+    """
+    Exponentially weighted mean and variance, O(1) memory.
+    The first samples use the cumulative mean (weight 1/count) so the warm up is not biased by the first value
+    """
+    __slots__ = ('count', 'mean', 'variance')
+
+    def __init__(self, count=0, mean=0.0, variance=0.0):
+        self.count = count
+        self.mean = mean
+        self.variance = variance
+
+    def update(self, value, alpha):
+        self.count += 1
+        weight = max(alpha, 1.0 / self.count)
+        diff = value - self.mean
+        increment = weight * diff
+        self.mean += increment
+        self.variance = (1 - weight) * (self.variance + diff * increment)
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+    def is_anomaly(self, value, min_samples, zscore, min_ratio):
+        """
+        The value deviates more than zscore standard deviations and more than min_ratio of the mean
+        """
+        if self.count < min_samples or self.mean <= 0:
+            return False
+        deviation = abs(value - self.mean)
+        return deviation > zscore * self.std and deviation > min_ratio * self.mean
+
+    def to_list(self):
+        return [self.count, self.mean, self.variance]
+
+
+class ScheduleStats:
+    """
+    Statistics of the completed backups of a schedule
+    """
+    __slots__ = ('last_backup', 'duration', 'items')
+
+    def __init__(self, last_backup=None, duration=None, items=None):
+        self.last_backup = last_backup
+        self.duration = RunningStats(*duration) if duration else RunningStats()
+        self.items = RunningStats(*items) if items else RunningStats()
+
+    def to_dict(self):
+        return {'last_backup': self.last_backup,
+                'duration': self.duration.to_list(),
+                'items': self.items.to_list()}
+
+
+class ScheduleStatsTracker:
+    """
+    Per-schedule online statistics of duration and backed up items of the completed backups.
+    Every backup is observed once; the state is saved in a json file to survive the restarts
+    """
+
+    def __init__(self, path='./logs/schedule_stats.json', alpha=0.1, min_samples=5, zscore=3.0, min_ratio=0.5):
+        self.path = path
+        self.alpha = alpha
+        self.min_samples = min_samples
+        self.zscore = zscore
+        self.min_ratio = min_ratio
+
+        self.schedules = {}
+        self.changed = False
+
+    @handle_exceptions_method
+    def load(self):
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path, 'r') as file:
+            data = json.load(file)
+        self.schedules = {name: ScheduleStats(**value) for name, value in data.items()}
+        return len(self.schedules)
+
+    @handle_exceptions_method
+    def save(self):
+        """
+        Write the state (atomic replace of the file)
+        """
+        if not self.changed:
+            return False
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump({name: stats.to_dict() for name, stats in self.schedules.items()}, file)
+        os.replace(tmp_path, self.path)
+        self.changed = False
+        return True
+
+    def observe(self, records):
+        """
+        Update the statistics with the new completed backups
+        @param records: BackupRecord iterable
+        @return: list of (backup name, schedule, description) of the anomalous backups
+        """
+        anomalies = []
+        for record in records:
+            if record.schedule is None or record.phase != BackupPhase.COMPLETED:
+                continue
+            stats = self.schedules.get(record.schedule)
+            if stats is None:
+                stats = self.schedules[record.schedule] = ScheduleStats()
+            if stats.last_backup is not None and record.backup_name <= stats.last_backup:
+                continue
+
+            duration = record.duration
+            if duration is not None:
+                if stats.duration.is_anomaly(duration, self.min_samples, self.zscore, self.min_ratio):
+                    anomalies.append((record.backup_name, record.schedule,
+                                      f"duration {duration:.0f}s, usual {stats.duration.mean:.0f}s"))
+                stats.duration.update(duration, self.alpha)
+
+            if record.total_items > 0:
+                items = record.items_backed_up
+                if stats.items.is_anomaly(items, self.min_samples, self.zscore, self.min_ratio):
+                    anomalies.append((record.backup_name, record.schedule,
+                                      f"items {items}, usual {stats.items.mean:.0f}"))
+                stats.items.update(items, self.alpha)
+
+            stats.last_backup = record.backup_name
+            self.changed = True
+        return anomalies
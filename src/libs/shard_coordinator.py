@@ -0,0 +1,157 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+
+from utils.config import ConfigShard, ConfigK8sProcess
+from utils.print_helper import PrintHelper
+from utils.handle_error import handle_exceptions_async_method, handle_exceptions_method
+from utils.hash_ring import ConsistentHashRing
+
+# shard of the cluster wide reports (namespaces without schedule, backups without schedule, alive message)
+CLUSTER_SHARD_KEY = '__cluster__'
+MEMBER_LABEL = 'app.kubernetes.io/component'
+MEMBER_LABEL_VALUE = 'k8s-watchdog-member'
+
+
+class ShardCoordinator:
+    """
+    Split the schedules between the replicas.
+    Every replica renews its own coordination.k8s.io Lease; the replicas with a not expired lease are the members
+    of a consistent hash ring and a schedule is reported only by its owner
+    """
+
+    def __init__(self,
+                 debug_on=True,
+                 logger=None,
+                 shard_config: ConfigShard = None,
+                 k8s_key_config: ConfigK8sProcess = None):
+        self.print_helper = PrintHelper('shard_coordinator', logger)
+        self.debug_on = debug_on
+
+        self.print_helper.debug_if(self.debug_on, f"__init__")
+
+        self.shard_config = ConfigShard()
+        if shard_config is not None:
+            self.shard_config = shard_config
+        self.k8s_config = k8s_key_config
+
+        self.identity = self.shard_config.identity
+        self.lease_name = f"{self.shard_config.lease_prefix}-{self.identity}"
+
+        # until the first synchronization the replica owns everything (as a single replica)
+        self.ring = ConsistentHashRing([self.identity], vnodes=self.shard_config.vnodes)
+        self.renewed_at = time.monotonic()
+
+        self.api = None
+        self.client = None
+
+    def __load_api__(self):
+        # imported here: the kubernetes client is loaded after the startup (first synchronization)
+        from kubernetes import client, config
+
+        if self.k8s_config is None or self.k8s_config.k8s_in_cluster_mode:
+            config.load_incluster_config()
+        else:
+            config.load_kube_config(config_file=self.k8s_config.k8s_config_file)
+        self.client = client
+        self.api = client.CoordinationV1Api()
+
+    @property
+    def degraded(self):
+        """
+        The lease is not renewed for the lease duration (api outage, RBAC): the ring is no longer reliable
+        """
+        return time.monotonic() - self.renewed_at > self.shard_config.lease_duration_sec
+
+    def owns(self, key):
+        """
+        Check if this replica reports a key (schedule name or CLUSTER_SHARD_KEY)
+        """
+        # without coordination every replica reports everything: duplicated notifications rather than none
+        if self.degraded:
+            return True
+        return self.ring.owner(key) == self.identity
+
+    def __renew__(self, now: datetime):
+        from kubernetes.client.exceptions import ApiException
+
+        client = self.client
+        namespace = self.shard_config.namespace
+        try:
+            lease = self.api.read_namespaced_lease(self.lease_name, namespace)
+        except ApiException as e:
+            if e.status != 404:
+                raise
+            lease = client.V1Lease(metadata=client.V1ObjectMeta(name=self.lease_name,
+                                                                labels={MEMBER_LABEL: MEMBER_LABEL_VALUE}),
+                                   spec=client.V1LeaseSpec(holder_identity=self.identity,
+                                                           lease_duration_seconds=self.shard_config.lease_duration_sec,
+                                                           acquire_time=now,
+                                                           renew_time=now))
+            self.api.create_namespaced_lease(namespace, lease)
+            return
+
+        lease.spec.holder_identity = self.identity
+        lease.spec.lease_duration_seconds = self.shard_config.lease_duration_sec
+        lease.spec.renew_time = now
+        # the resource version of the read lease protects from a concurrent update (409)
+        self.api.replace_namespaced_lease(self.lease_name, namespace, lease)
+
+    def __alive_members__(self, now: datetime):
+        leases = self.api.list_namespaced_lease(self.shard_config.namespace,
+                                                label_selector=f"{MEMBER_LABEL}={MEMBER_LABEL_VALUE}")
+        members = set()
+        for lease in leases.items:
+            spec = lease.spec
+            if spec is None or spec.holder_identity is None or spec.renew_time is None:
+                continue
+            renew_time = spec.renew_time
+            if renew_time.tzinfo is None:
+                renew_time = renew_time.replace(tzinfo=timezone.utc)
+            if (now - renew_time).total_seconds() <= (spec.lease_duration_seconds or 0):
+                members.add(spec.holder_identity)
+        members.add(self.identity)
+        return members
+
+    @handle_exceptions_method
+    def sync(self):
+        """
+        Renew the lease of this replica and rebuild the ring when the members change
+        @return: the members
+        """
+        if self.api is None:
+            self.__load_api__()
+        now = datetime.now(timezone.utc)
+        self.__renew__(now)
+        self.renewed_at = time.monotonic()
+
+        members = self.__alive_members__(now)
+        if members != self.ring.members:
+            self.print_helper.info('shard members changed: %s -> %s', sorted(self.ring.members), sorted(members))
+            self.ring = ConsistentHashRing(members, vnodes=self.shard_config.vnodes)
+        return members
+
+    @handle_exceptions_method
+    def release(self):
+        """
+        Delete the lease: the other replicas take the shards without waiting for the expiration
+        """
+        if self.api is not None:
+            self.api.delete_namespaced_lease(self.lease_name, self.shard_config.namespace)
+
+    @handle_exceptions_async_method
+    async def run(self):
+        """
+        Main loop
+        """
+        try:
+            self.print_helper.info(f"shard coordinator identity={self.identity} "
+                                   f"namespace={self.shard_config.namespace}")
+            while True:
+                members = await asyncio.to_thread(self.sync)
+                if isinstance(members, dict):
+                    self.print_helper.wrn('shard lease not renewed: %s', members['error']['description'])
+                await asyncio.sleep(self.shard_config.renew_sec)
+
+        except Exception as err:
+            self.print_helper.error_and_exception(f"run", err)
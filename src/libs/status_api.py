@@ -0,0 +1,364 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import time
+from collections import deque
+from urllib.parse import parse_qs, unquote
+
+from utils.config import ConfigStatusApi
+from utils.print_helper import PrintHelper
+from utils.handle_error import handle_exceptions_async_method, handle_exceptions_method, is_error_result
+from libs.history_store import HistoryStore
+from utils.readiness import ReadinessSignal
+from libs.loop_monitor import LoopLagMonitor
+from utils.transport_stats import TransportStats
+
+HTTP_REASONS = {200: 'OK',
+                304: 'Not Modified',
+                400: 'Bad Request',
+                404: 'Not Found',
+                405: 'Method Not Allowed',
+                500: 'Internal Server Error',
+                503: 'Service Unavailable'}
+
+SECONDS_DAY = 86400
+
+
+class CachedDocument:
+    """
+    JSON document serialized once: body, gzip body and ETag
+    """
+    __slots__ = ('body', 'body_gzip', 'etag')
+
+    def __init__(self, data):
+        self.body = json.dumps(data, separators=(',', ':'), default=str).encode('utf-8')
+        self.body_gzip = gzip.compress(self.body, compresslevel=6)
+        self.etag = f'"{hashlib.sha1(self.body).hexdigest()[:20]}"'
+
+
+class StatusCache:
+    """
+    Latest snapshot of the watchdog, pre-serialized for the http api.
+    It is updated by the checker only when the data change
+    """
+
+    def __init__(self, cluster_name=None):
+        self.cluster_name = cluster_name
+        # section -> [update time, data]
+        self.sections = {'schedules': [None, {}],
+                         'backups': [None, {}],
+                         'unscheduled': [None, None]}
+        self.documents = {}
+        for section in self.sections:
+            self.__serialize__(section)
+
+    @handle_exceptions_method
+    def update_schedules(self, schedules: dict):
+        self.__update__('schedules', {name: schedule.to_dict() for name, schedule in schedules.items()})
+
+    @handle_exceptions_method
+    def update_backups(self, backups: dict, unscheduled):
+        self.__update__('backups', {name: backup.to_dict() for name, backup in backups.items()})
+        if unscheduled is not None:
+            self.__update__('unscheduled', unscheduled.to_dict())
+
+    def __update__(self, section, data):
+        if self.sections[section][1] == data:
+            return
+        self.sections[section] = [time.time(), data]
+        self.__serialize__(section)
+
+    def __serialize__(self, section):
+        updated, data = self.sections[section]
+        self.documents[f'/status/{section}'] = CachedDocument({'cluster': self.cluster_name,
+                                                               'updated': updated,
+                                                               section: data})
+        full = {'cluster': self.cluster_name}
+        for name, (updated, data) in self.sections.items():
+            full[name] = data
+            full[f'{name}_updated'] = updated
+        self.documents['/status'] = CachedDocument(full)
+
+    def get(self, path):
+        return self.documents.get(path)
+
+
+class EventBroker:
+    """
+    Fan out of the change events to the SSE subscribers.
+    Every event is serialized once and the same bytes are queued to all the subscribers.
+    A subscriber whose queue is full is cut off
+    """
+
+    def __init__(self, queue_size=100, max_subscribers=100, history_size=100):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.subscribers = set()
+        self.history = deque(maxlen=history_size)
+        self.sequence = 0
+
+    def publish(self, event_type, data):
+        """
+        Publish an event
+        @param event_type: backup_added, backup_removed, backup_phase_changed, schedule_added,
+        schedule_removed, schedule_updated, namespace_unscheduled, namespace_scheduled
+        @param data: event payload
+        """
+        self.sequence += 1
+        payload = json.dumps(data, separators=(',', ':'), default=str)
+        event = f"id: {self.sequence}\nevent: {event_type}\ndata: {payload}\n\n".encode('utf-8')
+        self.history.append((self.sequence, event))
+
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # slow subscriber: cut off instead of buffering without limit
+                self.subscribers.discard(queue)
+                queue.closed = True
+
+    def subscribe(self, last_event_id=None):
+        """
+        Register a new subscriber
+        @param last_event_id: replay the events after this id (if they are still in the history)
+        @return: the queue of the subscriber or None if the limit of subscribers is reached
+        """
+        if len(self.subscribers) >= self.max_subscribers:
+            return None
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        queue.closed = False
+        if last_event_id is not None:
+            for sequence, event in self.history:
+                if sequence > last_event_id and not queue.full():
+                    queue.put_nowait(event)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+
+
+class StatusApiServer:
+    """
+    Read-only http api serving the cached snapshot. The api server of the cluster is never called
+    """
+
+    def __init__(self,
+                 debug_on=True,
+                 logger=None,
+                 cache: StatusCache = None,
+                 broker: EventBroker = None,
+                 history: HistoryStore = None,
+                 readiness: ReadinessSignal = None,
+                 loop_monitor: LoopLagMonitor = None,
+                 transport_stats: TransportStats = None,
+                 api_config: ConfigStatusApi = None):
+        self.print_helper = PrintHelper('status_api', logger)
+        self.print_debug = debug_on
+
+        self.print_helper.debug_if(self.print_debug,
+                                   f"__init__")
+
+        self.api_config = ConfigStatusApi()
+        if api_config is not None:
+            self.api_config = api_config
+
+        self.cache = cache
+        self.broker = broker
+        self.history = history
+        self.readiness = readiness
+        self.loop_monitor = loop_monitor
+        self.transport_stats = transport_stats
+
+    @staticmethod
+    async def __write_response__(writer, code, headers=None, body=b'', head_only=False):
+        lines = [f"HTTP/1.1 {code} {HTTP_REASONS.get(code, '')}"]
+        for key, value in (headers or {}).items():
+            lines.append(f"{key}: {value}")
+        lines.append(f"Content-Length: {len(body)}")
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        if not head_only and len(body) > 0:
+            writer.write(body)
+        await writer.drain()
+
+    async def __read_request__(self, reader):
+        request_line = await asyncio.wait_for(reader.readline(), timeout=self.api_config.read_timeout)
+        if not request_line:
+            return None, None, None, None
+        headers = {}
+        while True:
+            line = await asyncio.wait_for(reader.readline(), timeout=self.api_config.read_timeout)
+            if line in (b'\r\n', b'\n', b''):
+                break
+            key, _, value = line.decode('latin-1').partition(':')
+            headers[key.strip().lower()] = value.strip()
+            if len(headers) > 100:
+                break
+        parts = request_line.decode('latin-1').split()
+        if len(parts) != 3:
+            return '', '', headers, {}
+        path, _, query = parts[1].partition('?')
+        return parts[0], unquote(path), headers, parse_qs(query)
+
+    def __history_query__(self, path, query):
+        """
+        Run a history query
+        /history/schedules: outcome of every schedule, /history/schedules/<name>: backups of a schedule,
+        /history/unprotected: namespaces without a schedule. Range: days (default 30) or from/to epoch seconds
+        """
+        end = float(query.get('to', [time.time()])[0])
+        start = float(query.get('from', [end - int(query.get('days', [30])[0]) * SECONDS_DAY])[0])
+
+        if path == '/history/schedules':
+            result = self.history.schedule_summary(start, end)
+        elif path.startswith('/history/schedules/'):
+            name = path[len('/history/schedules/'):]
+            result = {'summary': self.history.schedule_summary(start, end, schedule=name).get(name),
+                      'backups': self.history.schedule_backups(name, start, end)}
+        elif path == '/history/unprotected':
+            result = self.history.unprotected_namespaces(start, end)
+        else:
+            return None
+        return {'from': start, 'to': end, 'result': result}
+
+    async def __write_history__(self, method, path, query, writer):
+        try:
+            data = await asyncio.to_thread(self.__history_query__, path, query)
+        except ValueError:
+            await self.__write_response__(writer, 400, {'Content-Type': 'text/plain'}, b'bad range')
+            return
+        if data is None:
+            await self.__write_response__(writer, 404, {'Content-Type': 'text/plain'}, b'not found')
+            return
+        if is_error_result(data['result']):
+            await self.__write_response__(writer, 500, {'Content-Type': 'text/plain'}, b'history error')
+            return
+        body = json.dumps(data, separators=(',', ':'), default=str).encode('utf-8')
+        await self.__write_response__(writer, 200, {'Content-Type': 'application/json',
+                                                    'Cache-Control': 'no-cache'}, body, method == 'HEAD')
+
+    async def handle_request(self, method, path, headers, writer, query=None):
+        """
+        Serve a request from the cache
+        @return: False if the connection must be closed
+        """
+        if method not in ('GET', 'HEAD'):
+            await self.__write_response__(writer, 405 if method else 400, {'Allow': 'GET, HEAD'})
+            return False
+
+        if path == '/events' and method == 'GET':
+            await self.__stream_events__(headers, writer)
+            return False
+
+        if path.startswith('/history/') and self.history is not None:
+            await self.__write_history__(method, path.rstrip('/'), query or {}, writer)
+            return True
+
+        if path == '/healthz':
+            await self.__write_response__(writer, 200, {'Content-Type': 'text/plain'}, b'ok', method == 'HEAD')
+            return True
+
+        if path == '/metrics' and (self.loop_monitor is not None or self.transport_stats is not None):
+            lines = []
+            for source in (self.loop_monitor, self.transport_stats):
+                if source is not None:
+                    lines += source.metrics()
+            body = ('\n'.join(lines) + '\n').encode('utf-8')
+            await self.__write_response__(writer, 200, {'Content-Type': 'text/plain; version=0.0.4',
+                                                        'Cache-Control': 'no-cache'}, body, method == 'HEAD')
+            return True
+
+        if path == '/readyz':
+            # ready when the first snapshot is loaded
+            if self.readiness is None or self.readiness.ready:
+                await self.__write_response__(writer, 200, {'Content-Type': 'text/plain'}, b'ready',
+                                              method == 'HEAD')
+            else:
+                await self.__write_response__(writer, 503, {'Content-Type': 'text/plain'}, b'not ready',
+                                              method == 'HEAD')
+            return True
+
+        document = self.cache.get(path.rstrip('/') or '/status') if self.cache is not None else None
+        if document is None:
+            await self.__write_response__(writer, 404, {'Content-Type': 'text/plain'}, b'not found')
+            return True
+
+        response_headers = {'ETag': document.etag,
+                            'Cache-Control': 'no-cache',
+                            'Vary': 'Accept-Encoding'}
+        if document.etag in [tag.strip() for tag in headers.get('if-none-match', '').split(',')]:
+            await self.__write_response__(writer, 304, response_headers)
+            return True
+
+        response_headers['Content-Type'] = 'application/json'
+        body = document.body
+        if 'gzip' in headers.get('accept-encoding', ''):
+            response_headers['Content-Encoding'] = 'gzip'
+            body = document.body_gzip
+        await self.__write_response__(writer, 200, response_headers, body, method == 'HEAD')
+        return True
+
+    async def __stream_events__(self, headers, writer):
+        """
+        Server-Sent Events stream of the change events
+        """
+        last_event_id = headers.get('last-event-id')
+        queue = None
+        if self.broker is not None:
+            queue = self.broker.subscribe(int(last_event_id) if last_event_id and last_event_id.isdigit() else None)
+        if queue is None:
+            await self.__write_response__(writer, 503, {'Content-Type': 'text/plain'}, b'events not available')
+            return
+
+        self.print_helper.info_if(self.print_debug, "events subscriber connected")
+        try:
+            writer.write(b"HTTP/1.1 200 OK\r\n"
+                         b"Content-Type: text/event-stream\r\n"
+                         b"Cache-Control: no-cache\r\n"
+                         b"Connection: close\r\n\r\n"
+                         b"retry: 5000\n\n")
+            await writer.drain()
+            while not queue.closed:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=self.api_config.sse_heartbeat)
+                except asyncio.TimeoutError:
+                    event = b": keep-alive\n\n"
+                writer.write(event)
+                # a client that does not read is cut off
+                await asyncio.wait_for(writer.drain(), timeout=self.api_config.sse_heartbeat)
+        finally:
+            self.broker.unsubscribe(queue)
+            self.print_helper.info_if(self.print_debug, "events subscriber disconnected")
+
+    async def __handle_connection__(self, reader, writer):
+        try:
+            while True:
+                method, path, headers, query = await self.__read_request__(reader)
+                if method is None:
+                    break
+                keep_alive = await self.handle_request(method, path, headers, writer, query)
+                if not keep_alive or headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.TimeoutError, ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as err:
+            self.print_helper.error_and_exception(f"__handle_connection__", err)
+        finally:
+            writer.close()
+
+    @handle_exceptions_async_method
+    async def run(self):
+        """
+        Main loop
+        """
+        try:
+            server = await asyncio.start_server(self.__handle_connection__,
+                                                host=self.api_config.host,
+                                                port=self.api_config.port)
+            self.print_helper.info(f"status api listening on {self.api_config.host}:{self.api_config.port}")
+            async with server:
+                await server.serve_forever()
+
+        except Exception as err:
+            self.print_helper.error_and_exception(f"run", err)
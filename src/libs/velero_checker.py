@@ -1,9 +1,24 @@
+import asyncio
 import calendar
+import time
 from datetime import datetime
 
 from utils.config import ConfigK8sProcess
 from utils.print_helper import PrintHelper
-from utils.handle_error import handle_exceptions_async_method, handle_exceptions_method
+from utils.handle_error import handle_exceptions_async_method, is_error_result
+from utils.readiness import ReadinessSignal
+from libs.velero_records import BackupPhase, UnscheduledNamespaces, format_epoch
+from libs.status_api import StatusCache, EventBroker
+from libs.history_store import HistoryStore
+from libs.schedule_stats import ScheduleStatsTracker
+from libs.missed_schedule import MissedScheduleDetector
+from libs.shard_coordinator import ShardCoordinator, CLUSTER_SHARD_KEY
+from libs.run_once import build_report
+from libs.notification_dedup import NotificationDeduplicator
+from libs.notification_digest import ChangeDigest, is_failure
+from libs.notification_event import NotificationEvent, Severity, EVENT_REPORT, EVENT_SCHEDULE, EVENT_MISSED, \
+    EVENT_DIGEST, EVENT_ALIVE, EVENT_CONFIG, EVENT_SHARD, DEFAULT_DESTINATION, Destination
+from libs.notification_router import NotificationRouter
 
 
 class VeleroChecker:
@@ -18,7 +33,18 @@ class VeleroChecker:
                  dispatcher_queue=None,
                  dispatcher_max_msg_len=8000,
                  dispatcher_alive_message_hours=24,
-                 k8s_key_config: ConfigK8sProcess = None):
+                 k8s_key_config: ConfigK8sProcess = None,
+                 status_cache: StatusCache = None,
+                 event_broker: EventBroker = None,
+                 history: HistoryStore = None,
+                 shard: ShardCoordinator = None,
+                 run_once=False,
+                 readiness: ReadinessSignal = None,
+                 dedup: NotificationDeduplicator = None,
+                 digest: ChangeDigest = None,
+                 delta_report=False,
+                 full_report_hours=24,
+                 router: NotificationRouter = None):
 
         self.print_helper = PrintHelper('velero_checker', logger)
         self.debug_on = debug_on
@@ -38,7 +64,60 @@ class VeleroChecker:
         self.old_schedule_status = {}
         self.old_backup = {}
 
-        self.alive_message_seconds = dispatcher_alive_message_hours * 3600
+        # snapshot served by the http api
+        self.status_cache = status_cache
+        # change events streamed by the http api
+        self.event_broker = event_broker
+        # history of the backup outcomes
+        self.history = history
+        # replicas coordinator: the notifications of the schedules not owned are sent by the other replicas
+        self.shard = shard
+        # the shard coordination state notified
+        self.shard_degraded = False
+
+        # online statistics of the completed backups of every schedule
+        self.schedule_stats = None
+        if self.k8s_config.anomaly_enable:
+            self.schedule_stats = ScheduleStatsTracker(path=self.k8s_config.anomaly_state_path,
+                                                       min_samples=self.k8s_config.anomaly_min_samples,
+                                                       zscore=self.k8s_config.anomaly_zscore,
+                                                       min_ratio=self.k8s_config.anomaly_min_ratio)
+            loaded = self.schedule_stats.load()
+            if is_error_result(loaded):
+                self.print_helper.error('schedule stats not loaded: %s', loaded['error']['description'])
+
+        # schedules that did not fire: schedule name -> expected activation already notified
+        self.missed_detector = None
+        self.missed_notified = {}
+        if self.k8s_config.missed_schedule_enable:
+            if self.k8s_config.schedule_enable:
+                self.missed_detector = MissedScheduleDetector(
+                    grace_seconds=self.k8s_config.missed_schedule_grace_min * 60)
+            else:
+                # the detection compares the schedules read with SCHEDULE_ENABLE
+                self.print_helper.wrn('MISSED_SCHEDULE_ENABLE needs SCHEDULE_ENABLE: the missed schedules '
+                                      'are not checked')
+
+        # set when the first snapshot is processed
+        self.readiness = readiness
+
+        # repeated reports suppressed within a window before the dispatcher queue
+        self.dedup = dedup
+        # changes merged over a window and sent as one summary, the failures are sent at once
+        self.digest = digest
+
+        # changes only (added, removed, changed) after the first report, the full report every full_report_seconds
+        self.delta_report = delta_report
+        self.full_report_seconds = full_report_hours * 3600
+        self.last_full_report = None
+
+        # destinations of the notifications, the backup report is split by destination
+        self.router = router
+
+        # single cycle: no restart and alive messages
+        self.run_once = run_once
+
+        self.alive_message_seconds = dispatcher_alive_message_hours * 3600 if not run_once else 0
         self.last_send = calendar.timegm(datetime.today().timetuple())
 
         self.cluster_name = ""
@@ -46,8 +125,51 @@ class VeleroChecker:
 
         self.send_config = False
 
-        self.final_message = ""
         self.unique_message = False
+        # destination -> [concatenated message, highest severity] of the summary
+        self.final_messages = {}
+
+        # sequence number of the notifications
+        self.sequence = 0
+
+    def __event__(self, message, severity, kind, destination):
+        self.sequence += 1
+        return NotificationEvent(message=message,
+                                 severity=severity,
+                                 cluster=self.cluster_name,
+                                 sequence=self.sequence,
+                                 kind=kind,
+                                 destination=destination)
+
+    def __routing_active__(self):
+        return self.router is not None and self.router.active
+
+    def __route__(self, severity, destination=None):
+        """
+        Destination of a message without namespaces and schedule, unless already routed
+        """
+        if destination is not None:
+            return destination
+        if not self.__routing_active__():
+            return DEFAULT_DESTINATION
+        return self.router.route((), None, severity, self.cluster_name)
+
+    def __split_by_schedule__(self, items, schedules):
+        """
+        Group the items of the schedule messages by the destination of their schedule in a single pass
+        @param items: iterable of (key, schedule name, severity)
+        @param schedules: schedule name -> ScheduleRecord, for the included namespaces
+        @return: destination -> list of keys
+        """
+        if not self.__routing_active__():
+            return {DEFAULT_DESTINATION: [key for key, name, severity in items]}
+
+        def routed():
+            for key, name, severity in items:
+                schedule = schedules.get(name)
+                yield key, schedule.included_namespaces if schedule is not None else (), name, severity
+
+        return self.router.split(routed(), self.cluster_name)
 
     @handle_exceptions_async_method
     async def __put_in_queue__(self,
@@ -62,27 +184,53 @@ class VeleroChecker:
 
         await queue.put(obj)
 
+    async def __dispatch__(self, event: NotificationEvent):
+        """
+        Put a report in the dispatcher queue unless it repeats a report of the dedup window
+        """
+        if self.dedup is not None:
+            await self.__flush_repeated__()
+            if not self.dedup.admit(event):
+                self.print_helper.info("__dispatch__. repeated message suppressed (total %s)", self.dedup.suppressed)
+                return
+        await self.__put_in_queue__(self.dispatcher_queue,
+                                    event)
+
+    async def __flush_repeated__(self):
+        """
+        Send the suppressed reports of the closed dedup windows
+        """
+        for message in self.dedup.expired():
+            await self.__put_in_queue__(self.dispatcher_queue,
+                                        message)
+
     @handle_exceptions_async_method
-    async def send_to_dispatcher(self, message, force_message=False):
+    async def send_to_dispatcher(self, message, force_message=False, severity=Severity.INFO, kind=EVENT_REPORT,
+                                 destination: Destination = None):
         """
         Send message to dispatcher engine
         @param message: message to send
         @param force_message: if true, put the message into the queue
+        @param severity: priority of the message in the dispatcher queues
+        @param kind: type of message, the messages of the same kind can be coalesced under pressure
+        @param destination: recipients of the message, routed on severity and cluster if None
         """
-        self.print_helper.info(f"send_to_dispatcher. msg len= {len(message)}-unique {self.unique_message} ")
+        self.print_helper.info(f"send_to_dispatcher. msg len= {len(message)}-unique {self.unique_message} "
+                               f"severity {severity}")
         if len(message) > 0:
+            destination = self.__route__(severity, destination)
             if not self.unique_message or force_message:
                 self.last_send = calendar.timegm(datetime.today().timetuple())
-                await self.__put_in_queue__(self.dispatcher_queue,
-                                            message)
+                await self.__dispatch__(self.__event__(message, severity, kind, destination))
             else:
-
-                if len(self.final_message) > 0:
-                    self.print_helper.info(f"send_to_dispatcher. concat message- len({len(self.final_message)})")
-                    self.final_message = f"{self.final_message}\n{'-' * 20}\n{message}"
+                final = self.final_messages.get(destination)
+                if final is not None:
+                    self.print_helper.info(f"send_to_dispatcher. concat message- len({len(final[0])})")
+                    final[0] = f"{final[0]}\n{'-' * 20}\n{message}"
+                    final[1] = min(final[1], severity)
                 else:
                     self.print_helper.info(f"send_to_dispatcher. start message")
-                    self.final_message = f"{message}"
+                    self.final_messages[destination] = [message, severity]
 
     @handle_exceptions_async_method
     async def send_to_dispatcher_summary(self):
@@ -90,16 +238,18 @@ class VeleroChecker:
         Send summary message to dispatcher engine
         """
 
-        self.print_helper.info(f"send_to_dispatcher_summary. message-len= {len(self.final_message)}")
-        # Chck if the final message is not empty
-        if len(self.final_message) > 10:
-            # LS 2023.11.09 add cluster name
-            self.final_message = f"Cluster name: {self.cluster_name}\nStart report\n{self.final_message}\nEnd report"
-            self.last_send = calendar.timegm(datetime.today().timetuple())
-            await self.__put_in_queue__(self.dispatcher_queue,
-                                        self.final_message)
+        # one summary for every destination
+        for destination, (final_message, severity) in self.final_messages.items():
+            self.print_helper.info(f"send_to_dispatcher_summary. message-len= {len(final_message)} "
+                                   f"destination {destination.name}")
+            # Chck if the final message is not empty
+            if len(final_message) > 10:
+                # LS 2023.11.09 add cluster name
+                final_message = f"Cluster name: {self.cluster_name}\nStart report\n{final_message}\nEnd report"
+                self.last_send = calendar.timegm(datetime.today().timetuple())
+                await self.__dispatch__(self.__event__(final_message, severity, EVENT_REPORT, destination))
 
-        self.final_message = ""
+        self.final_messages = {}
         self.unique_message = False
 
     @handle_exceptions_async_method
@@ -116,13 +266,16 @@ class VeleroChecker:
 
                 elif self.k8s_config.schedule_key in data:
                     await self.__process_schedule_report(data[self.k8s_config.schedule_key])
+                    if not self.k8s_config.backup_enable:
+                        self.__set_ready__()
 
                 elif self.k8s_config.backup_key in data:
                     await self.__process_last_backup_report(data[self.k8s_config.backup_key])
+                    self.__set_ready__()
 
                 elif self.k8s_config.disp_msg_key_start in data:
                     self.unique_message = True
-                    self.final_message = ""
+                    self.final_messages = {}
 
                 elif self.k8s_config.disp_msg_key_end in data:
                     await self.send_to_dispatcher_summary()
@@ -131,8 +284,11 @@ class VeleroChecker:
             else:
                 self.print_helper.info(f"__unpack_data.the message is not a type of dict")
 
+            if self.shard is not None and self.shard.degraded != self.shard_degraded:
+                await self.__notify_shard_state__()
+
             # dispatcher alive message
-            if self.alive_message_seconds > 0:
+            if self.alive_message_seconds > 0 and self.__owns__(CLUSTER_SHARD_KEY):
                 diff = calendar.timegm(datetime.today().timetuple()) - self.last_send
 
                 if diff > self.alive_message_seconds or self.force_alive_message:
@@ -142,267 +298,736 @@ class VeleroChecker:
                                                   f"\nThis is an alive message"
                                                   f"\nNo warning/errors were triggered in the last "
                                                   f"{int(self.alive_message_seconds / 3600)} "
-                                                  f"hours ", True)
+                                                  f"hours ", True, Severity.LOW, EVENT_ALIVE)
                     self.force_alive_message = False
 
-        except Exception as err:
-            self.print_helper.error_and_exception(f"__unpack_data", err)
+            if self.digest is not None and self.digest.due():
+                message = self.digest.render()
+                severity = Severity.WARNING if self.digest.has_warnings else Severity.INFO
+                self.digest.reset()
+                if len(message) > 0:
+                    await self.send_to_dispatcher(message, severity=severity, kind=EVENT_DIGEST)
 
-    @handle_exceptions_method
-    def _extract_days_from_str(self, str_number):
-        self.print_helper.info("_extract_days_from_str")
-        value = -1
+            if self.dedup is not None:
+                await self.__flush_repeated__()
 
-        index = str_number.find('d')
-
-        if index != -1:
-            value = int(str_number.strip()[:index])
+        except Exception as err:
+            self.print_helper.error_and_exception(f"__unpack_data", err)
 
-        if value > 0:
-            return value
+    async def __notify_shard_state__(self):
+        """
+        Notify when the shard lease can not be renewed (this replica reports everything) and when it is renewed again
+        """
+        self.shard_degraded = self.shard.degraded
+        if self.shard_degraded:
+            message = (f"Cluster: {self.cluster_name}\nShard coordination degraded: the lease of "
+                       f"{self.shard.identity} is not renewed, this replica reports all the schedules")
         else:
-            return None
-
-    @handle_exceptions_method
-    def _get_backup_error_message(self, message):
-        # self.print_helper.info("_get_backup_error_message")
-        if message == '[]':
-            return ''
+            message = (f"Cluster: {self.cluster_name}\nShard coordination restored: {self.shard.identity} "
+                       f"reports its schedules only")
+        if self.shard_degraded:
+            self.print_helper.wrn(message.replace('\n', ' '))
         else:
-            return f'{message}'
+            self.print_helper.info(message.replace('\n', ' '))
+        await self.send_to_dispatcher(message, True, Severity.WARNING if self.shard_degraded else Severity.INFO,
+                                      EVENT_SHARD)
 
-    @handle_exceptions_method
-    def _extract_days_from_str(self, str_number):
-        # self.print_helper.info("_extract_days_from_str")
-        value = -1
+    def __set_ready__(self):
+        if self.readiness is not None and self.readiness.set_ready():
+            self.print_helper.info('first snapshot loaded: ready after %.2f sec', self.readiness.ready_at)
 
-        index = str_number.find('d')
+    def apply_config(self, snapshot):
+        """
+        Reloaded settings: the last state of schedules and backups is kept, the next cycle is compared with it
+        """
+        self.k8s_config = snapshot.k8s
+        self.dispatcher_max_msg_len = snapshot.dispatcher.max_msg_len
+        if not self.run_once:
+            self.alive_message_seconds = snapshot.dispatcher.alive_message * 3600
+        if self.missed_detector is not None:
+            self.missed_detector.grace_seconds = snapshot.k8s.missed_schedule_grace_min * 60
+        self.delta_report = snapshot.dispatcher.delta_report
+        self.full_report_seconds = snapshot.dispatcher.full_report_hours * 3600
+        if self.digest is not None:
+            self.digest.window_seconds = snapshot.dispatcher.digest_seconds
+            self.digest.max_entries = snapshot.dispatcher.digest_max_entries
+        if self.dedup is not None:
+            self.dedup.window_seconds = snapshot.dispatcher.dedup_seconds
+            self.dedup.max_entries = snapshot.dispatcher.dedup_max_entries
+        if self.router is not None:
+            self.router.set_rules(snapshot.route_rules)
+        if self.schedule_stats is not None:
+            self.schedule_stats.min_samples = snapshot.k8s.anomaly_min_samples
+            self.schedule_stats.zscore = snapshot.k8s.anomaly_zscore
+            self.schedule_stats.min_ratio = snapshot.k8s.anomaly_min_ratio
+
+    def __full_report_due__(self):
+        return (self.last_full_report is None or
+                (self.full_report_seconds > 0 and time.monotonic() - self.last_full_report >= self.full_report_seconds))
+
+    def __backup_delta_message__(self, diff, old_backups, backups, scheduled_ns, unscheduled_ns, counters,
+                                 warnings=''):
+        """
+        Report of the changed backups and namespaces only
+        @param backups: owned backups
+        @param counters: compact header of the counters
+        @param warnings: sections of the full header with the anomalies, failed volumes and expiring backups
+        """
+        point = '\u2022'
+        message = ''
+        if diff is not None:
+            added = [name for name in diff['added'] if name in backups]
+            removed = [name for name in diff['removed']
+                       if self.__owns__(old_backups[name].schedule or CLUSTER_SHARD_KEY)]
+            changed = [name for name in diff['new_values'] if name in backups]
+
+            # a new backup of a schedule replaces the previous one: reported as a single change
+            removed_by_schedule = {old_backups[name].schedule: name for name in removed
+                                   if old_backups[name].schedule is not None}
+            replaced = [(removed_by_schedule[backups[name].schedule], name) for name in added
+                        if backups[name].schedule in removed_by_schedule]
+            replaced_names = {name for pair in replaced for name in pair}
+
+            new_lines = [f'\n\t{name}{f" [{backups[name].schedule}]" if backups[name].schedule else ""} '
+                         f'status={backups[name].phase.value}'
+                         for name in added if name not in replaced_names]
+            if len(new_lines) > 0:
+                message += f'\n{point} Added backups={len(new_lines)}' + ''.join(new_lines)
+            if len(replaced) > 0:
+                message += f'\n{point} New backups of schedules={len(replaced)}'
+                for old_name, new_name in replaced:
+                    message += (f'\n\t{backups[new_name].schedule}: {old_name} {old_backups[old_name].phase.value}'
+                                f' -> {new_name} {backups[new_name].phase.value}')
+            if len(changed) > 0:
+                message += f'\n{point} Changed backups={len(changed)}'
+                for name in changed:
+                    message += f'\n\t{name}'
+                    for field, old_value, new_value in diff['old_values'][name].changed_fields(backups[name]):
+                        message += f'\n\t\t{field}: {old_value} -> {new_value}'
+            removed_lines = [f'\n\t{name}' for name in removed if name not in replaced_names]
+            if len(removed_lines) > 0:
+                message += f'\n{point} Removed backups={len(removed_lines)}' + ''.join(removed_lines)
+
+        if self.__owns__(CLUSTER_SHARD_KEY):
+            if len(unscheduled_ns) > 0:
+                message += f'\n{point} Namespaces without schedule: ' + ', '.join(unscheduled_ns)
+            if len(scheduled_ns) > 0:
+                message += f'\n{point} Namespaces scheduled again: ' + ', '.join(scheduled_ns)
+
+        message += warnings
+        if len(message) == 0:
+            return ''
+        return f'Changes [{counters}]{message}'
 
-        if index != -1:
-            value = int(str_number.strip()[:index])
+    def __digest_active__(self):
+        return self.digest is not None and self.digest.window_seconds > 0
 
-        if value > 0:
-            return value
+    @staticmethod
+    def __digest_failures__(diff, backups):
+        """
+        Failed backups among the added and changed owned backups: their report is sent at once
+        """
+        if diff is None:
+            return []
+        return [name for name in list(diff['new_values']) + diff['added']
+                if name in backups and is_failure(backups[name])]
+
+    def __digest_backup_changes__(self, diff, old_backups, backups, scheduled_ns, unscheduled_ns, warnings):
+        """
+        Add the owned changes of backups and namespaces and the warnings of a report not sent at once to the digest
+        @param backups: owned backups (all or the ones of a destination)
+        @param warnings: (key, text) of the warnings of the backups
+        """
+        if diff is not None:
+            # the previous backup of a schedule is removed before its new backup is added
+            for name in diff['removed']:
+                record = old_backups[name]
+                if self.__owns__(record.schedule or CLUSTER_SHARD_KEY):
+                    self.digest.add_backup(record.schedule or name, record, None)
+            for name in list(diff['new_values']) + diff['added']:
+                record = backups.get(name)
+                if record is not None:
+                    self.digest.add_backup(record.schedule or name, diff['old_values'].get(name), record)
+
+        if self.__owns__(CLUSTER_SHARD_KEY):
+            self.digest.add_namespaces(scheduled_ns, unscheduled_ns)
+        self.digest.add_warnings(warnings)
+
+    def __warning_items__(self, backups, volumes, anomalies):
+        """
+        Warnings of the owned backups for the digest: anomalies, failed volumes and backups in the warning period
+        @return: list of (key, text)
+        """
+        items = [(('anomaly', backup_name), f'{backup_name} [{schedule}] {description}')
+                 for backup_name, schedule, description in anomalies if backup_name in backups]
+        if volumes is not None:
+            items += [(('volumes', name), f'{name} failed volumes {info.failed}/{info.volumes} '
+                                          f'{", ".join(info.failed_names)}')
+                      for name, info in volumes.backups.items() if info.failed > 0 and name in backups]
+        items += [(('expiring', name), f'{name} expires in {record.expire_days}d')
+                  for name, record in backups.items()
+                  if record.expire_days is not None and 0 < record.expire_days < self.k8s_config.EXPIRES_DAYS_WARNING]
+        return items
+
+    def __digest_schedule_changes__(self, diff):
+        for name in diff['removed']:
+            self.digest.add_schedule(name, 'removed')
+        for name in diff['added']:
+            self.digest.add_schedule(name, 'added')
+        for name, old_schedule in diff['old_values'].items():
+            self.digest.add_schedule(name, 'updated', old_schedule.changed_fields(diff['new_values'][name]))
+
+    def __backup_item_severity__(self, record):
+        if is_failure(record):
+            return Severity.CRITICAL
+        if record.expire_days is not None and record.expire_days < self.k8s_config.EXPIRES_DAYS_WARNING:
+            return Severity.WARNING
+        return Severity.INFO
+
+    def __route_backup_report__(self, backups, old_backups, diff, unscheduled, scheduled_ns, unscheduled_ns,
+                                volumes_changed=()):
+        """
+        Split the owned backups, the changes and the namespaces by destination in a single pass
+        @param volumes_changed: backups with changed volume stats, a destination with one of them has changes
+        @return: destination -> (backups, diff, unscheduled, scheduled ns, unscheduled ns, changed)
+        """
+        if not self.__routing_active__():
+            return {DEFAULT_DESTINATION: (backups, diff, unscheduled, scheduled_ns, unscheduled_ns, True)}
+
+        def items():
+            for name, record in backups.items():
+                yield ('backup', name), record.included_namespaces, record.schedule, \
+                    self.__backup_item_severity__(record)
+            for name in diff['removed'] if diff is not None else ():
+                record = old_backups[name]
+                yield ('removed', name), record.included_namespaces, record.schedule, Severity.INFO
+            for namespace in unscheduled.difference:
+                yield ('unscheduled', namespace), (namespace,), None, Severity.WARNING
+            for namespace in scheduled_ns:
+                yield ('scheduled', namespace), (namespace,), None, Severity.INFO
+
+        groups = self.router.split(items(), self.cluster_name)
+        # the default destination always gets the first report; its counters cover only the items not routed
+        groups.setdefault(DEFAULT_DESTINATION, [])
+
+        parts = {}
+        for destination, keys in groups.items():
+            part_backups = {}
+            removed = []
+            part_unscheduled = []
+            part_scheduled_ns = []
+            for kind, name in keys:
+                if kind == 'backup':
+                    part_backups[name] = backups[name]
+                elif kind == 'removed':
+                    removed.append(name)
+                elif kind == 'unscheduled':
+                    part_unscheduled.append(name)
+                else:
+                    part_scheduled_ns.append(name)
+            part_unscheduled_ns = [namespace for namespace in unscheduled_ns if namespace in part_unscheduled]
+
+            part_diff = None
+            changed = len(part_scheduled_ns) + len(part_unscheduled_ns) > 0 or \
+                any(name in part_backups for name in volumes_changed)
+            if diff is not None:
+                part_diff = {'removed': removed,
+                             'added': [name for name in diff['added'] if name in part_backups],
+                             'old_values': {name: value for name, value in diff['old_values'].items()
+                                            if name in part_backups},
+                             'new_values': {name: value for name, value in diff['new_values'].items()
+                                            if name in part_backups}}
+                changed = changed or len(removed) + len(part_diff['added']) + len(part_diff['new_values']) > 0
+            elif len(old_backups) == 0:
+                # first report: every destination with backups or namespaces without schedule
+                changed = destination == DEFAULT_DESTINATION or len(part_backups) + len(part_unscheduled) > 0
+            parts[destination] = (part_backups,
+                                  part_diff,
+                                  UnscheduledNamespaces(difference=tuple(part_unscheduled),
+                                                        counter=len(part_unscheduled),
+                                                        counter_all=unscheduled.counter_all),
+                                  part_scheduled_ns,
+                                  part_unscheduled_ns,
+                                  changed)
+        return parts
+
+    def __backup_report_severity__(self, diff, backups, warning):
+        """
+        Critical if a reported backup (added or changed, all on the first report) failed or has errors
+        @param warning: the report has backups expiring, anomalies, failed volumes or namespaces unscheduled
+        """
+        if diff is not None:
+            reported = [backups[name] for name in list(diff['new_values']) + diff['added'] if name in backups]
         else:
-            return None
+            reported = backups.values()
+        if any(is_failure(record) for record in reported):
+            return Severity.CRITICAL
+        return Severity.WARNING if warning else Severity.INFO
 
-    def __pre_batch_data(self, data):
-        try:
-            self.print_helper.info("_pre_batch_data")
-            if len(data) > 0:
-                for backup_name, backup_info in data['backups'].items():
-                    if 'expire' in backup_info:
-                        if len(backup_info['expire']) > 0:
-                            day = self._extract_days_from_str(str(backup_info['expire']))
-                            if day > self.k8s_config.EXPIRES_DAYS_WARNING:
-                                self.print_helper.debug_if(
-                                        self.debug_on,
-                                        f"_pre_batch_data: "
-                                        f"{backup_name}"
-                                        f" expire from {data['backups'][backup_name]['expire']}"
-                                        f" forced to {self.k8s_config.EXPIRES_DAYS_WARNING}d")
-                                data['backups'][backup_name]['expire'] = f"{self.k8s_config.EXPIRES_DAYS_WARNING}d"
-
-            return data
-        except Exception as err:
-            self.print_helper.error_and_exception(f"__pre_batch_data", err)
-            return data
+    def __owns__(self, key):
+        """
+        Check if this replica sends the notifications of a schedule (or of the cluster wide reports)
+        """
+        return self.shard is None or self.shard.owns(key)
 
-    def __try_to_parse_to_str(self, value):
-        self.print_helper.info_if(self.debug_on,
-                                  "__last_backup_report")
-        try:
-            return str(value)
-        except Exception as err:
-            self.print_helper.error_and_exception(f"__try_to_parse_to_str", err)
-            return value
+    def __owned_backups__(self, backups):
+        """
+        Backups of the owned schedules, the backups without schedule belong to the cluster shard
+        """
+        if self.shard is None:
+            return backups
+        return {name: record for name, record in backups.items()
+                if self.shard.owns(record.schedule or CLUSTER_SHARD_KEY)}
+
+    def __backup_stats_columnar(self, backups):
+        """
+        Compute the report counters from the columnar snapshot of the backups
+        @param backups: last backup for every schedule
+        """
+        # imported here: numpy is loaded only when the columnar stats are enabled
+        from libs.backup_snapshot import BackupSnapshot, PHASE_COMPLETED, PHASE_IN_PROGRESS, PHASE_FAILED, \
+            PHASE_PARTIALLY_FAILED
+
+        snapshot = BackupSnapshot(backups)
+        counts = snapshot.phase_counts()
+        in_progress = snapshot.names_in_phase(PHASE_IN_PROGRESS)
+        failed = snapshot.names_in_phase(PHASE_FAILED)
+        partially_failed = snapshot.names_in_phase(PHASE_PARTIALLY_FAILED)
+        with_errors = snapshot.names_with_errors()
+        with_warnings = snapshot.names_with_warnings()
+        expiring, not_retrieved = snapshot.expiring(self.k8s_config.EXPIRES_DAYS_WARNING)
+
+        if self.debug_on:
+            self.print_helper.debug("__backup_stats_columnar expiry buckets %s age histogram %s",
+                                    snapshot.expiry_buckets(),
+                                    snapshot.age_histogram())
+
+        return (counts[PHASE_COMPLETED],
+                len(in_progress),
+                len(failed),
+                len(partially_failed),
+                len(with_errors),
+                len(with_warnings),
+                len(expiring),
+                not_retrieved,
+                ''.join(f'\n\t{name}' for name in in_progress),
+                ''.join(f'\t{name}' for name in with_errors),
+                ''.join(f'\t{name}' for name in with_warnings),
+                ''.join(f'\n\t{name}' for name in failed),
+                ''.join(f'\n\t{name}' for name in partially_failed),
+                ''.join(f'\n\t{name}' for name in expiring))
+
+    def __backup_report_message__(self, backups, old_backups, diff, unscheduled, old_unscheduled,
+                                  scheduled_ns, unscheduled_ns, volumes, anomalies, difference,
+                                  backups_upd, unscheduled_upd, full_report_due):
+        """
+        Report of the owned backups (all or the ones of a destination)
+        @return: message, True if full report (not delta), True if the report has warnings
+        """
+        message = ''
+
+        # counter
+        backup_count = len(backups)
+        backup_completed = 0
+        backup_in_progress = 0
+        backup_failed = 0
+        backup_partially_failed = 0
+        backup_in_errors = 0
+        backup_in_wrn = 0
+        expired_backup = 0
+        backup_not_retrieved = 0
+
+        anomalies = [anomaly for anomaly in anomalies if anomaly[0] in backups]
+        part_schedules = {record.schedule for record in backups.values()}
+
+        # message strings
+        backup_in_progress_str = ''
+        error_str = ''
+        wrn_str = ''
+        backup_failed_str = ''
+        backup_partially_failed_str = ''
+        backup_expired_str = ''
+
+        point = '\u2022'
+
+        # the details are sent only when the unscheduled namespaces changed and all namespaces are scheduled
+        details_needed = unscheduled_upd and len(unscheduled.difference) == 0
+        columnar = self.k8s_config.backup_stats_columnar
+
+        if not columnar or details_needed:
+            for backup_name, backup_info in backups.items():
+                self.print_helper.debug_if(self.debug_on, 'Backup schedule: %s', backup_name)
+
+                #
+                # build current state string
+                #
+                current_state = str(backup_name) + '\n'
+                # LS 2023.11.26 add
+                current_state += '\t schedule name=' + str(backup_info.schedule) + '\n'
+
+                # add end at field
+                current_state += '\t end at=' + backup_info.completion_timestamp + '\n'
+
+                # add expire field
+                current_state += '\t expire=' + backup_info.expire
+
+                day = backup_info.expire_days
+                if day is None or day <= 0:
+                    backup_not_retrieved += 1
+                    current_state += f'**IS NOT VALID{backup_info.expire}'
+                elif day < self.k8s_config.EXPIRES_DAYS_WARNING:
+                    expired_backup += 1
+                    backup_expired_str += f'\n\t{str(backup_name)}'
+                    current_state += '**WARNING'
+
+                current_state += '\n'
+
+                # add status field
+                phase = backup_info.phase
+                if phase != BackupPhase.UNKNOWN:
+                    current_state += '\t status=' + phase.value + '\n'
+                    if phase == BackupPhase.COMPLETED:
+                        backup_completed += 1
+                    elif phase == BackupPhase.IN_PROGRESS:
+                        backup_in_progress_str += f'\n\t{str(backup_name)}'
+                        backup_in_progress += 1
+                    elif phase == BackupPhase.FAILED:
+                        backup_failed_str += f'\n\t{str(backup_name)}'
+                        backup_failed += 1
+                    elif phase == BackupPhase.PARTIALLY_FAILED:
+                        backup_partially_failed_str += f'\n\t{str(backup_name)}'
+                        backup_partially_failed += 1
+
+                # add error field
+                if backup_info.errors > 0:
+                    error_str += f'\t{str(backup_name)}'
+                    current_state += '\t' + ' error=' + str(backup_info.errors) + ' '
+                    backup_in_errors += 1
+
+                # add warning field
+                if backup_info.warnings > 0:
+                    wrn_str += f'\t{str(backup_name)}'
+                    current_state += '\t' + 'warning=' + str(backup_info.warnings) + '\n'
+                    backup_in_wrn += 1
+
+                # add volumes field
+                volume_info = volumes.backups.get(backup_name) if volumes is not None else None
+                if volume_info is not None:
+                    if not current_state.endswith('\n'):
+                        current_state += '\n'
+                    current_state += (f'\t volumes={volume_info.volumes} failed={volume_info.failed} '
+                                      f'bytes={volume_info.bytes_done}/{volume_info.total_bytes}\n')
+
+                current_state += '\n'
+                message += current_state
+
+        if columnar:
+            (backup_completed, backup_in_progress, backup_failed, backup_partially_failed,
+             backup_in_errors, backup_in_wrn, expired_backup, backup_not_retrieved,
+             backup_in_progress_str, error_str, wrn_str, backup_failed_str,
+             backup_partially_failed_str, backup_expired_str) = self.__backup_stats_columnar(backups)
+
+        message = f'Backup details [{backup_count}/{unscheduled.counter_all}]:\n{message}'
+
+        message_header = (f'{point} Namespaces={unscheduled.counter_all} \n'
+                          f'{point} Unscheduled namespaces={unscheduled.counter}\n'
+                          f'Backups Stats based on last backup for every schedule and backup without schedule'
+                          f'\n{point} Total={backup_count}'
+                          f'\n{point} Completed={backup_completed}'
+                          f'\n{point} Difference={difference}')
+
+        if backup_in_progress > 0:
+            message_header += f'\n{point} In Progress={backup_in_progress}{backup_in_progress_str}'
+        if backup_in_errors > 0:
+            message_header += f'\n{point} With Errors={backup_in_errors}\n{error_str}'
+        if backup_in_wrn > 0:
+            message_header += f'\n{point} With Warnings={backup_in_wrn}\n{wrn_str}'
+        if backup_failed > 0:
+            message_header += f'\n{point} Failed={backup_failed}{backup_failed_str}'
+        if backup_partially_failed > 0:
+            message_header += f'\n{point} Partially Failed={backup_partially_failed}{backup_partially_failed_str}'
+
+        # the warnings are listed also in the delta report
+        warning_sections = ''
+        failed_volumes = []
+        if volumes is not None:
+            failed_volumes = [(name, info) for name, info in volumes.backups.items()
+                              if info.failed > 0 and name in backups]
+            if len(failed_volumes) > 0:
+                warning_sections += f'\n{point} Backups with failed volumes={len(failed_volumes)}'
+                for name, info in failed_volumes:
+                    warning_sections += (f'\n\t{name} {info.failed}/{info.volumes} '
+                                         f'{", ".join(info.failed_names)}')
+            failed_schedules = [(name, info) for name, info in volumes.schedules.items()
+                                if info.failed > 0 and self.__owns__(name)
+                                and (not self.__routing_active__() or name in part_schedules)]
+            if len(failed_schedules) > 0:
+                warning_sections += f'\n{point} Schedules with failed volumes (all backups)'
+                for name, info in failed_schedules:
+                    warning_sections += f'\n\t{name} {info.failed}/{info.volumes}'
+
+        if len(anomalies) > 0:
+            warning_sections += f'\n{point} Anomalies={len(anomalies)}'
+            for backup_name, schedule, description in anomalies:
+                warning_sections += f'\n\t{backup_name} [{schedule}] {description}'
+
+        if expired_backup > 0:
+            warning_sections += (f'\n{point} Number of backups in warning period={expired_backup} '
+                                 f'[expires day less than {self.k8s_config.EXPIRES_DAYS_WARNING}d]'
+                                 f'{backup_expired_str}')
+        message_header += warning_sections
+
+        if len(unscheduled.difference) > 0:
+            str_namespace = ''
+            for name_s in unscheduled.difference:
+                str_namespace += f'\t{name_s}\n'
+            if len(str_namespace) > 0:
+                message = (
+                    f'Namespace without active backup [{unscheduled.counter}/{unscheduled.counter_all}]'
+                    f':\n{str_namespace}')
+
+        if unscheduled_upd and backups_upd:
+            out_message = f"{message_header}\n{message}"
+        elif unscheduled_upd:
+            out_message = f"{message}"
+        else:
+            out_message = f"{message_header}"
+
+        full_report = True
+        if self.delta_report and len(old_backups) > 0 and old_unscheduled is not None \
+                and not full_report_due:
+            full_report = False
+            counters = (f'Total={backup_count} Completed={backup_completed} In Progress={backup_in_progress} '
+                        f'Failed={backup_failed} Partially Failed={backup_partially_failed} '
+                        f'With Errors={backup_in_errors} With Warnings={backup_in_wrn} '
+                        f'Expiring={expired_backup} Unscheduled={unscheduled.counter}/{unscheduled.counter_all}')
+            out_message = self.__backup_delta_message__(diff, old_backups, backups,
+                                                        scheduled_ns, unscheduled_ns, counters, warning_sections)
+
+        warning = expired_backup > 0 or len(anomalies) > 0 or len(failed_volumes) > 0 or len(unscheduled_ns) > 0
+        return out_message, full_report, warning
 
     async def __process_last_backup_report(self, data):
         self.print_helper.info("__last_backup_report")
         try:
-            # LS 2023.11.19 pre-batch raw data for avoiding unuseful message
-            data = self.__pre_batch_data(data)
-
             backups = data['backups']
             unscheduled = data['us_ns']
+            volumes = data.get('volumes')
+
+            # a schedule that stops firing leaves the backups unchanged: checked on every cycle
+            if self.missed_detector is not None:
+                await self.__check_missed_schedules__(backups)
 
             if self.old_backup == data:
                 self.print_helper.info("__last_backup_report. do nothing same data")
                 return
 
+            if self.status_cache is not None:
+                self.status_cache.update_backups(backups, unscheduled)
+
+            if self.history is not None:
+                inserted = await asyncio.to_thread(self.history.record_backups, list(backups.values()))
+                if is_error_result(inserted):
+                    self.print_helper.error('history store error: %s', inserted['error']['description'])
+                else:
+                    self.print_helper.debug_if(self.debug_on, 'history new backups: %s', inserted)
+
             old_backups = {}
-            old_unscheduled = {}
+            old_unscheduled = None
+            old_volumes = None
 
             if self.old_backup is not None and len(self.old_backup) > 0:
                 old_backups = self.old_backup['backups']
                 old_unscheduled = self.old_backup['us_ns']
+                old_volumes = self.old_backup.get('volumes')
 
             backups_upd = False
             unscheduled_upd = False
+            diff = None
+            scheduled_ns = []
+            unscheduled_ns = []
             # LS 2023.11.17 add source of message
             difference = ""
             if backups != old_backups:
-                backups_upd = True
+                # the changes are compared on the owned backups with the current ring: a schedule moved to this
+                # replica is not reported as changed
+                backups_upd = self.shard is None or \
+                    self.__owned_backups__(backups) != self.__owned_backups__(old_backups)
                 self.print_helper.info("__last_backup_report. backup status changed")
-                difference = "bck"
+                if backups_upd:
+                    difference = "bck"
                 # print difference
                 if len(old_backups) > 0:
                     diff = self.find_dict_difference(old_backups, backups)
-                    self.print_helper.info(f'Difference in backups : {diff}')
+                    self.print_helper.info('Difference in backups : %s', diff)
+                    self.__publish_backup_events__(diff, backups)
                 else:
                     self.print_helper.info("__last_backup_report. backup status changed. no old value set")
 
             if unscheduled != old_unscheduled:
-                unscheduled_upd = True
+                unscheduled_upd = self.__owns__(CLUSTER_SHARD_KEY)
                 self.print_helper.info("__last_backup_report. unscheduled namespaces status changed")
-                if len(old_unscheduled) > 0:
-                    diff = self.find_dict_difference(old_unscheduled, unscheduled)
-                    self.print_helper.info(f'Difference in schedules : {diff}')
+                if self.history is not None:
+                    await asyncio.to_thread(self.history.record_unscheduled, unscheduled.difference)
+                if old_unscheduled is not None:
+                    scheduled_ns = sorted(set(old_unscheduled.difference) - set(unscheduled.difference))
+                    unscheduled_ns = sorted(set(unscheduled.difference) - set(old_unscheduled.difference))
+                    self.print_helper.info('Difference in schedules : removed %s added %s',
+                                           scheduled_ns, unscheduled_ns)
+                    self.__publish_namespace_events__(scheduled_ns, unscheduled_ns)
                 else:
                     self.print_helper.info("__last_backup_report. unscheduled status changed. no old value set")
-                if len(difference) > 0:
-                    difference = f"{difference}-sch"
-                else:
+                if unscheduled_upd:
                     difference = f"{difference}-sch"
 
-            message = ''
-
-            # counter
-            backup_count = len(backups)
-            backup_completed = 0
-            backup_in_progress = 0
-            backup_failed = 0
-            backup_partially_failed = 0
-            backup_in_errors = 0
-            backup_in_wrn = 0
-            expired_backup = 0
-            backup_not_retrieved = 0
-
-            # message strings
-            backup_in_progress_str = ''
-            error_str = ''
-            wrn_str = ''
-            backup_failed_str = ''
-            backup_partially_failed_str = ''
-            backup_expired_str = ''
-
-            point = '\u2022'
-
-            for backup_name, backup_info in backups.items():
-                self.print_helper.debug_if(self.debug_on, f'Backup schedule: {backup_name}')
-                # self.print_helper.info(f'--->{backup_name}')
-                # LS 2023.11.26 add condition checker
-                if backup_name != "error" or 'schedule' in backup_info:
-
-
-                    #
-                    # build current state string
-                    #
-                    current_state = str(backup_name) + '\n'
-                    # LS 2023.11.26 add
-                    # current_state += '\t schedule name=' + str(backup_info['schedule']) + '\n'
-                    current_state += '\t schedule name=' + self.__try_to_parse_to_str(backup_info['schedule']) + '\n'
-
-                    # add end at field
-                    if len(backup_info['completion_timestamp']) > 0:
-                        current_state += '\t end at=' + str(backup_info['completion_timestamp']) + '\n'
-
-                    # add expire field
-                    if len(backup_info['expire']) > 0:
-                        current_state += '\t expire=' + str(backup_info['expire'])
-
-                        day = self._extract_days_from_str(str(backup_info['expire']))
-                        if day is None:
-                            backup_not_retrieved += 1
-                            current_state += f'**IS NOT VALID{backup_info["expire"]}'
-                        elif day < self.k8s_config.EXPIRES_DAYS_WARNING:
-                            expired_backup += 1
-                            backup_expired_str += f'\n\t{str(backup_name)}'
-                            current_state += '**WARNING'
-
-                        current_state += '\n'
-
-                    # add status field
-                    if len(backup_info['phase']) > 0:
-                        current_state += '\t status=' + str(backup_info['phase']) + '\n'
-                        if backup_info['phase'].lower() == 'completed':
-                            backup_completed += 1
-                        elif backup_info['phase'].lower() == 'inprogress':
-                            backup_in_progress_str += f'\n\t{str(backup_name)}'
-                            backup_in_progress += 1
-                        elif backup_info['phase'].lower() == 'failed':
-                            backup_failed_str += f'\n\t{str(backup_name)}'
-                            backup_failed += 1
-                        elif backup_info['phase'].lower() == 'partiallyfailed':
-                            backup_partially_failed_str += f'\n\t{str(backup_name)}'
-                            backup_partially_failed += 1
-
-                    # add error field
-                    error = self._get_backup_error_message(str(backup_info['errors']))
-                    if len(error) > 0:
-                        error_str += f'\t{str(backup_name)}'
-                        current_state += '\t' + ' error=' + error + ' '
-                        backup_in_errors += 1
-
-                    # add warning field
-                    wrn = self._get_backup_error_message(str(backup_info['warnings']))
-                    if len(wrn) > 0:
-                        wrn_str += f'\t{str(backup_name)}'
-                        current_state += '\t' + 'warning=' + wrn + '\n'
-                        backup_in_wrn += 1
-
-                    current_state += '\n'
-                    message += current_state
-
-            message = f'Backup details [{backup_count}/{unscheduled["counter_all"]}]:\n{message}'
-
-            message_header = (f'{point} Namespaces={unscheduled["counter_all"]} \n'
-                              f'{point} Unscheduled namespaces={unscheduled["counter"]}\n'
-                              f'Backups Stats based on last backup for every schedule and backup without schedule'
-                              f'\n{point} Total={backup_count}'
-                              f'\n{point} Completed={backup_completed}'
-                              f'\n{point} Difference={difference}')
-
-            if backup_in_progress > 0:
-                message_header += f'\n{point} In Progress={backup_in_progress}{backup_in_progress_str}'
-            if backup_in_errors > 0:
-                message_header += f'\n{point} With Errors={backup_in_errors}\n{error_str}'
-            if backup_in_wrn > 0:
-                message_header += f'\n{point} With Warnings={backup_in_wrn}\n{wrn_str}'
-            if backup_failed > 0:
-                message_header += f'\n{point} Failed={backup_failed}{backup_failed_str}'
-            if backup_partially_failed > 0:
-                message_header += f'\n{point} Partially Failed={backup_partially_failed}{backup_partially_failed_str}'
-
-            if expired_backup > 0:
-                message_header += (f'\n{point} Number of backups in warning period={expired_backup} '
-                                   f'[expires day less than {self.k8s_config.EXPIRES_DAYS_WARNING}d]'
-                                   f'{backup_expired_str}')
-
-            if len(unscheduled['difference']) > 0:
-                str_namespace = ''
-                for name_s in unscheduled['difference']:
-                    str_namespace += f'\t{name_s}\n'
-                if len(str_namespace) > 0:
-                    message = (
-                        f'Namespace without active backup [{unscheduled["counter"]}/{unscheduled["counter_all"]}]'
-                        f':\n{str_namespace}')
-
-            if unscheduled_upd and backups_upd:
-                out_message = f"{message_header}\n{message}"
-            elif unscheduled_upd:
-                out_message = f"{message}"
-            else:
-                out_message = f"{message_header}"
-
-            if len(out_message) > 10:
-                await self.send_to_dispatcher(out_message)
+            # the history, the status cache and the events keep all the backups, the notifications only the owned
+            all_backups = backups
+            backups = self.__owned_backups__(backups)
+
+            anomalies = []
+            if self.schedule_stats is not None:
+                anomalies = [anomaly for anomaly in self.schedule_stats.observe(all_backups.values())
+                             if anomaly[0] in backups]
+                saved = await asyncio.to_thread(self.schedule_stats.save)
+                if is_error_result(saved):
+                    self.print_helper.error('schedule stats not saved: %s', saved['error']['description'])
+
+            full_report_due = self.__full_report_due__()
+            # with the shards a replica does not report the changes of the schedules owned by the others
+            report_needed = self.shard is None or backups_upd or unscheduled_upd
+            # with the digest a report is sent at once only with a failed backup or when the full report is due,
+            # the changes and the warnings of the others are added to the digest
+            digest_mode = report_needed and self.__digest_active__() and len(old_backups) > 0 \
+                and old_unscheduled is not None and not full_report_due
+            failed = self.__digest_failures__(diff, backups) if digest_mode else []
+
+            full_report_sent = False
+            old_volume_backups = old_volumes.backups if old_volumes is not None else {}
+            volume_backups = volumes.backups if volumes is not None else {}
+            volumes_changed = {name for name in set(old_volume_backups) | set(volume_backups)
+                               if old_volume_backups.get(name) != volume_backups.get(name)}
+            parts = self.__route_backup_report__(backups, old_backups, diff, unscheduled, scheduled_ns, unscheduled_ns,
+                                                 volumes_changed)
+            for destination, (part_backups, part_diff, part_unscheduled, part_scheduled_ns, part_unscheduled_ns,
+                              part_changed) in parts.items():
+                if digest_mode and not any(name in part_backups for name in failed):
+                    self.__digest_backup_changes__(part_diff, old_backups, part_backups, part_scheduled_ns,
+                                                   part_unscheduled_ns,
+                                                   self.__warning_items__(part_backups, volumes, anomalies))
+                    self.print_helper.info("__last_backup_report. changes added to the digest")
+                    continue
+                out_message, full_report, warning = self.__backup_report_message__(
+                    part_backups, old_backups, part_diff, part_unscheduled, old_unscheduled,
+                    part_scheduled_ns, part_unscheduled_ns, volumes, anomalies, difference,
+                    backups_upd, unscheduled_upd, full_report_due)
+
+                if len(out_message) > 10 and report_needed and part_changed:
+                    severity = self.__backup_report_severity__(part_diff, part_backups, warning)
+                    await self.send_to_dispatcher(out_message, severity=severity, destination=destination)
+                    full_report_sent = full_report_sent or full_report
+            if full_report_sent:
+                self.last_full_report = time.monotonic()
 
             self.old_backup = data
         except Exception as err:
             # self.print_helper.error(f"consumer error : {err}")
             self.print_helper.error_and_exception(f"__last_backup_report", err)
 
+    async def __check_missed_schedules__(self, backups):
+        """
+        Notify the schedules without a backup for their last expected activation and the schedules resumed
+        """
+        missed_all, errors = self.missed_detector.check(self.old_schedule_status, backups, time.time())
+        for error in errors:
+            self.print_helper.wrn('schedule cron not valid: %s', error)
+        missed = {name: item for name, item in missed_all.items() if self.__owns__(name)}
+
+        point = '\u2022'
+        resumed = [name for name in self.missed_notified if name not in missed_all and self.__owns__(name)]
+        groups = self.__split_by_schedule__(
+            [(('missed', name), name, Severity.WARNING) for name in missed if name not in self.missed_notified] +
+            [(('resumed', name), name, Severity.INFO) for name in resumed],
+            self.old_schedule_status)
+        self.missed_notified = {name: item.expected for name, item in missed.items()}
+
+        # one message for every destination, routed on the schedule names
+        for destination, keys in groups.items():
+            message = ''
+            for kind, name in keys:
+                if kind == 'missed':
+                    item = missed[name]
+                    message += (f'\n{point} {name}{" (paused)" if item.paused else ""}'
+                                f'\n\texpected at={format_epoch(item.expected)}'
+                                f'\n\tlast backup={item.last_backup or "N/A"} at={format_epoch(item.last_time)}')
+            new_missed = len(message) > 0
+            if new_missed:
+                message = f'Missed schedules [grace {self.k8s_config.missed_schedule_grace_min} min]:{message}'
+
+            destination_resumed = [name for kind, name in keys if kind == 'resumed']
+            if len(destination_resumed) > 0:
+                message += '\nSchedules resumed:' + ''.join(f'\n{point} {name}' for name in destination_resumed)
+
+            if len(message) > 0:
+                await self.send_to_dispatcher(message.strip('\n'),
+                                              severity=Severity.WARNING if new_missed else Severity.INFO,
+                                              kind=EVENT_MISSED,
+                                              destination=destination)
+
+    def __publish_backup_events__(self, diff, backups):
+        """
+        Publish the typed events of the backups difference
+        """
+        if self.event_broker is None:
+            return
+        for backup_name in diff['removed']:
+            self.event_broker.publish('backup_removed', {'cluster': self.cluster_name,
+                                                         'backup_name': backup_name})
+        for backup_name in diff['added']:
+            self.event_broker.publish('backup_added', {'cluster': self.cluster_name,
+                                                       'backup': backups[backup_name].to_dict()})
+        for backup_name, old_backup in diff['old_values'].items():
+            new_backup = diff['new_values'][backup_name]
+            if old_backup.phase != new_backup.phase:
+                self.event_broker.publish('backup_phase_changed', {'cluster': self.cluster_name,
+                                                                   'backup_name': backup_name,
+                                                                   'schedule': new_backup.schedule,
+                                                                   'old_phase': old_backup.phase.value,
+                                                                   'new_phase': new_backup.phase.value})
+
+    def __publish_namespace_events__(self, scheduled_ns, unscheduled_ns):
+        """
+        Publish the namespaces that are no longer (or again) covered by a schedule
+        """
+        if self.event_broker is None:
+            return
+        for namespace in unscheduled_ns:
+            self.event_broker.publish('namespace_unscheduled', {'cluster': self.cluster_name,
+                                                                'namespace': namespace})
+        for namespace in scheduled_ns:
+            self.event_broker.publish('namespace_scheduled', {'cluster': self.cluster_name,
+                                                              'namespace': namespace})
+
+    def __publish_schedule_events__(self, diff, data):
+        """
+        Publish the typed events of the schedules difference
+        """
+        if self.event_broker is None or len(self.old_schedule_status) == 0:
+            return
+        for name in diff['removed']:
+            self.event_broker.publish('schedule_removed', {'cluster': self.cluster_name,
+                                                           'schedule': name})
+        for name in diff['added']:
+            self.event_broker.publish('schedule_added', {'cluster': self.cluster_name,
+                                                         'schedule': name,
+                                                         'spec': data[name].to_dict()})
+        for name, old_schedule in diff['old_values'].items():
+            self.event_broker.publish('schedule_updated',
+                                      {'cluster': self.cluster_name,
+                                       'schedule': name,
+                                       'changes': [{'field': field, 'old': old_value, 'new': new_value}
+                                                   for field, old_value, new_value in
+                                                   old_schedule.changed_fields(diff['new_values'][name])]})
+
     @staticmethod
     def find_dict_difference(dict1, dict2):
         # Find keys that are unique to each dictionary
@@ -430,30 +1055,58 @@ class VeleroChecker:
             if self.old_schedule_status == data:
                 self.print_helper.info("__process_schedule_report. do nothing same data")
                 return
-            message = ''
-            diff = self.find_dict_difference(self.old_schedule_status, data)
-
-            if len(diff) > 0:
-                if len(diff['removed']) > 0:
-                    message += 'Removed scheduled:'
-                    for rem in diff['removed']:
-                        message += '\n' + rem
-
-                if len(self.old_schedule_status) > 0 and len(diff['added']) > 0:
-                    message += '\nAdded scheduled:'
-                    for add in diff['added']:
-                        message += '\n' + add
 
-                if len(diff['old_values']) > 0:
-                    message += '\nUpdate scheduled:'
-                    for schedule_name in diff['old_values']:
-                        message += "\nname:" + schedule_name
-                        for field in diff['old_values'][schedule_name]:
-                            if diff['old_values'][schedule_name][field] != diff['new_values'][schedule_name][field]:
-                                message += (f"\n{field}: from {diff['old_values'][schedule_name][field]} "
-                                            f"to {diff['new_values'][schedule_name][field]}")
-
-            await self.send_to_dispatcher(message)
+            if self.status_cache is not None:
+                self.status_cache.update_schedules(data)
+            diff = self.find_dict_difference(self.old_schedule_status, data)
+            self.__publish_schedule_events__(diff, data)
+
+            if self.shard is not None:
+                diff = {'removed': [name for name in diff['removed'] if self.shard.owns(name)],
+                        'added': [name for name in diff['added'] if self.shard.owns(name)],
+                        'old_values': {name: value for name, value in diff['old_values'].items()
+                                       if self.shard.owns(name)},
+                        'new_values': {name: value for name, value in diff['new_values'].items()
+                                       if self.shard.owns(name)}}
+
+            if self.__digest_active__() and len(self.old_schedule_status) > 0:
+                self.__digest_schedule_changes__(diff)
+            else:
+                # one message for every destination, routed on the schedule names and namespaces
+                schedules = {**self.old_schedule_status, **data}
+                groups = self.__split_by_schedule__(
+                    [(('removed', name), name, Severity.WARNING) for name in diff['removed']] +
+                    [(('added', name), name, Severity.INFO) for name in diff['added']] +
+                    [(('updated', name), name, Severity.INFO) for name in diff['old_values']],
+                    schedules)
+                for destination, keys in groups.items():
+                    removed = [name for kind, name in keys if kind == 'removed']
+                    added = [name for kind, name in keys if kind == 'added']
+                    updated = [name for kind, name in keys if kind == 'updated']
+                    message = ''
+                    if len(removed) > 0:
+                        message += 'Removed scheduled:'
+                        for rem in removed:
+                            message += '\n' + rem
+
+                    if len(self.old_schedule_status) > 0 and len(added) > 0:
+                        message += '\nAdded scheduled:'
+                        for add in added:
+                            message += '\n' + add
+
+                    if len(updated) > 0:
+                        message += '\nUpdate scheduled:'
+                        for schedule_name in updated:
+                            message += "\nname:" + schedule_name
+                            old_schedule = diff['old_values'][schedule_name]
+                            for field, old_value, new_value in old_schedule.changed_fields(
+                                    diff['new_values'][schedule_name]):
+                                message += f"\n{field}: from {old_value} to {new_value}"
+
+                    await self.send_to_dispatcher(message.strip('\n'),
+                                                  severity=Severity.WARNING if len(removed) > 0 else Severity.INFO,
+                                                  kind=EVENT_SCHEDULE,
+                                                  destination=destination)
 
             self.old_schedule_status = data
 
@@ -471,15 +1124,31 @@ class VeleroChecker:
         nodes_name = data[self.k8s_config.cluster_name_key]
 
         self.print_helper.info(f"cluster name {nodes_name}")
-        if nodes_name is not None:
+        # the run once mode does not notify the restart
+        if nodes_name is not None and not self.run_once:
             self.print_helper.info_if(self.debug_on, f"Flush last message")
             # LS 2023.11.04 Send configuration separately
             if self.send_config:
-                await self.send_to_dispatcher(f"Cluster name= {nodes_name}")
+                await self.send_to_dispatcher(f"Cluster name= {nodes_name}", severity=Severity.LOW, kind=EVENT_CONFIG)
             else:
                 await self.send_active_configuration(f"Cluster name= {nodes_name}")
 
         self.cluster_name = nodes_name
+        if self.status_cache is not None:
+            self.status_cache.cluster_name = nodes_name
+
+    def run_once_report(self):
+        """
+        Report of the last processed cycle
+        @return: report dict, exit code
+        """
+        last_backup = self.old_backup if self.old_backup is not None and len(self.old_backup) > 0 else None
+        return build_report(self.cluster_name,
+                            self.old_schedule_status if self.k8s_config.schedule_enable else None,
+                            last_backup['backups'] if last_backup is not None else None,
+                            last_backup['us_ns'] if last_backup is not None else None,
+                            self.missed_notified,
+                            self.k8s_config.EXPIRES_DAYS_WARNING)
 
     @handle_exceptions_async_method
     async def send_active_configuration(self, sub_title=None):
@@ -505,7 +1174,7 @@ class VeleroChecker:
             msg = "Error init config class"
 
         msg = f"{title}\n\n{msg}"
-        await self.send_to_dispatcher(msg)
+        await self.send_to_dispatcher(msg, severity=Severity.LOW, kind=EVENT_CONFIG)
 
     @handle_exceptions_async_method
     async def run(self):
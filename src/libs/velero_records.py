@@ -0,0 +1,216 @@
+import sys
+from dataclasses import dataclass, field, fields
+from datetime import datetime, timezone
+from enum import Enum
+
+
+class BackupPhase(str, Enum):
+    """
+    Velero backup phases
+    """
+    UNKNOWN = ''
+    NEW = 'New'
+    FAILED_VALIDATION = 'FailedValidation'
+    IN_PROGRESS = 'InProgress'
+    WAITING_FOR_PLUGIN_OPERATIONS = 'WaitingForPluginOperations'
+    WAITING_FOR_PLUGIN_OPERATIONS_PARTIALLY_FAILED = 'WaitingForPluginOperationsPartiallyFailed'
+    FINALIZING = 'Finalizing'
+    FINALIZING_PARTIALLY_FAILED = 'FinalizingPartiallyFailed'
+    COMPLETED = 'Completed'
+    PARTIALLY_FAILED = 'PartiallyFailed'
+    FAILED = 'Failed'
+    DELETING = 'Deleting'
+
+    def __str__(self):
+        return self.value
+
+    @classmethod
+    def parse(cls, value):
+        if not value:
+            return cls.UNKNOWN
+        try:
+            return cls(value)
+        except ValueError:
+            return _PHASES_LOWER.get(str(value).lower(), cls.UNKNOWN)
+
+
+_PHASES_LOWER = {phase.value.lower(): phase for phase in BackupPhase}
+
+TERMINAL_PHASES = frozenset((BackupPhase.COMPLETED,
+                             BackupPhase.PARTIALLY_FAILED,
+                             BackupPhase.FAILED,
+                             BackupPhase.FAILED_VALIDATION))
+
+K8S_TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+def intern_str(value):
+    """
+    Intern repeated names (namespaces, schedules): one string object shared by all the records
+    """
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def parse_k8s_time(value):
+    """
+    Convert a k8s timestamp to a naive datetime, None if it is not a timestamp
+    """
+    if not isinstance(value, str) or len(value) < 19:
+        return None
+    try:
+        return datetime.fromisoformat(value[:19])
+    except ValueError:
+        return None
+
+
+def to_epoch(value: datetime):
+    return value.replace(tzinfo=timezone.utc).timestamp() if value is not None else None
+
+
+def format_epoch(value):
+    if value is None:
+        return 'N/A'
+    return datetime.fromtimestamp(value, tz=timezone.utc).strftime(K8S_TIME_FORMAT)
+
+
+@dataclass(frozen=True, slots=True)
+class BackupRecord:
+    """
+    Last state of a backup. Times are epoch seconds (UTC), expire_days is capped to the warning threshold.
+    Start time and item counts are not compared: the progress of a running backup is not a change of state
+    """
+    backup_name: str
+    phase: BackupPhase
+    namespace: str
+    errors: int
+    warnings: int
+    schedule: str | None
+    expiration: float | None
+    completion: float | None
+    expire_days: int | None
+    in_progress: bool = False
+    start: float | None = field(default=None, compare=False)
+    items_backed_up: int = field(default=0, compare=False)
+    total_items: int = field(default=0, compare=False)
+    # spec.includedNamespaces, used by the notification routes
+    included_namespaces: tuple = field(default=(), compare=False)
+
+    @property
+    def duration(self):
+        if self.start is None or self.completion is None:
+            return None
+        return self.completion - self.start
+
+    @property
+    def completion_timestamp(self):
+        return format_epoch(self.completion)
+
+    @property
+    def time_expires(self):
+        return format_epoch(self.expiration)
+
+    @property
+    def expire(self):
+        if self.expire_days is not None:
+            return f"{self.expire_days}d"
+        return 'in progress' if self.in_progress else 'N/A'
+
+    def to_dict(self):
+        return {'backup_name': self.backup_name,
+                'phase': self.phase.value,
+                'namespace': self.namespace,
+                'errors': self.errors,
+                'warnings': self.warnings,
+                'schedule': self.schedule,
+                'expiration': self.time_expires,
+                'completion_timestamp': self.completion_timestamp,
+                'expire': self.expire}
+
+    def changed_fields(self, other):
+        """
+        Reported fields with a different value
+        @return: list of (field name, old value, new value)
+        """
+        changes = []
+        for name, old_value, new_value in (('status', self.phase.value, other.phase.value),
+                                           ('errors', self.errors, other.errors),
+                                           ('warnings', self.warnings, other.warnings),
+                                           ('end at', self.completion_timestamp, other.completion_timestamp),
+                                           ('expire', self.expire, other.expire)):
+            if old_value != new_value:
+                changes.append((name, old_value, new_value))
+        return changes
+
+
+@dataclass(frozen=True, slots=True)
+class ScheduleRecord:
+    """
+    Velero schedule spec fields monitored by the watchdog
+    """
+    name: str
+    included_namespaces: tuple
+    included_resources: tuple
+    default_volumes_to_fs_backup: bool
+    cron_time: str
+    paused: bool = False
+    created: float | None = field(default=None, compare=False)
+    excluded_namespaces: tuple = ()
+    # ((match labels pairs), (key, operator, values)) for labelSelector and every orLabelSelectors
+    label_selectors: tuple = ()
+
+    def to_dict(self):
+        return {'included_namespaces': list(self.included_namespaces),
+                'included_resources': list(self.included_resources),
+                'default_volumes_to_fs_backup': self.default_volumes_to_fs_backup,
+                'cron_time': self.cron_time,
+                'paused': self.paused,
+                'excluded_namespaces': list(self.excluded_namespaces),
+                'label_selectors': [{'match_labels': dict(match_labels),
+                                     'match_expressions': [{'key': key, 'operator': operator, 'values': list(values)}
+                                                           for key, operator, values in expressions]}
+                                    for match_labels, expressions in self.label_selectors]}
+
+    def changed_fields(self, other):
+        """
+        Fields with a different value
+        @return: list of (field name, old value, new value)
+        """
+        changes = []
+        for item in fields(self):
+            if not item.compare:
+                continue
+            old_value = getattr(self, item.name)
+            new_value = getattr(other, item.name)
+            if old_value != new_value:
+                changes.append((item.name,
+                                list(old_value) if isinstance(old_value, tuple) else old_value,
+                                list(new_value) if isinstance(new_value, tuple) else new_value))
+        return changes
+
+
+def selector_key(selector):
+    """
+    Hashable form of a k8s label selector: ((key, value) pairs, (key, operator, values) expressions)
+    """
+    if not selector:
+        return None
+    match_labels = tuple(sorted((selector.get('matchLabels') or {}).items()))
+    expressions = tuple(sorted((expression['key'], expression['operator'],
+                                tuple(sorted(expression.get('values') or ())))
+                               for expression in selector.get('matchExpressions') or ()))
+    return match_labels, expressions
+
+
+@dataclass(frozen=True, slots=True)
+class UnscheduledNamespaces:
+    """
+    Namespaces without a schedule
+    """
+    difference: tuple
+    counter: int
+    counter_all: int
+
+    def to_dict(self):
+        return {'difference': list(self.difference),
+                'counter': self.counter,
+                'counter_all': self.counter_all}
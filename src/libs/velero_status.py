@@ -1,16 +1,25 @@
 import re
+import time
 from datetime import datetime
 from kubernetes import client, config
+from kubernetes.client.exceptions import ApiException
 from collections import OrderedDict
 
 from utils.print_helper import PrintHelper
-from utils.handle_error import handle_exceptions_method
+from utils.handle_error import handle_exceptions_method, is_error_result
+from utils.circuit_breaker import CircuitBreaker
+from utils.transport_stats import TransportStats
+from utils.json_stream import JsonListStream, CHUNK_SIZE
+from libs.namespace_coverage import NamespaceCoverageIndex
+from libs.volume_stats import VolumeAggregator
+from libs.velero_records import BackupRecord, BackupPhase, ScheduleRecord, UnscheduledNamespaces, \
+    intern_str, parse_k8s_time, to_epoch, selector_key
 
 
 class VeleroStatus:
 
     @handle_exceptions_method
-    def __init__(self, k8s_config, debug_on, logger, print_helper):
+    def __init__(self, k8s_config, debug_on, logger, print_helper, transport_stats: TransportStats = None):
 
         self.print_helper = PrintHelper('velero_status', logger)
         self.print_debug = debug_on
@@ -19,16 +28,144 @@ class VeleroStatus:
 
         self.debug = debug_on
 
+        # dedicated client: its connection pool is kept open and reused by all the cycles
+        configuration = client.Configuration()
         if k8s_config.k8s_in_cluster_mode:
-            config.load_incluster_config()
+            config.load_incluster_config(client_configuration=configuration)
         else:
-            config.load_kube_config(config_file=k8s_config.k8s_config_file)
-        self.v1 = client.CoreV1Api()
-        self.client = client.CustomObjectsApi()
+            config.load_kube_config(config_file=k8s_config.k8s_config_file, client_configuration=configuration)
+        configuration.connection_pool_maxsize = k8s_config.pool_maxsize
+        self.api_client = client.ApiClient(configuration)
+        self._set_gzip(k8s_config.gzip_enable)
+        self.v1 = client.CoreV1Api(self.api_client)
+        self.client = client.CustomObjectsApi(self.api_client)
+        self.transport_stats = transport_stats
+        self.stream_decode = k8s_config.stream_decode
+        # decoded bytes of the last streamed response
+        self.stream_bytes = 0
         self.expires_day_warning = k8s_config.EXPIRES_DAYS_WARNING
 
         self.ignored_namespace = k8s_config.ignore_namespace
 
+        # one circuit breaker for every resource kind
+        self.breakers = {kind: CircuitBreaker(kind,
+                                              failure_threshold=k8s_config.breaker_failures,
+                                              backoff_seconds=k8s_config.breaker_backoff_sec,
+                                              max_backoff_seconds=k8s_config.breaker_max_backoff_sec,
+                                              min_timeout=k8s_config.request_timeout_min,
+                                              max_timeout=k8s_config.request_timeout_max,
+                                              connect_timeout=k8s_config.connect_timeout)
+                         for kind in ('namespaces', 'schedules', 'backups', 'volumes')}
+
+        self.volume_stats_enable = k8s_config.volume_stats_enable
+        self.volume_stats_page_size = k8s_config.volume_stats_page_size
+        # last aggregate, kept when a cycle can not read the volumes
+        self.last_volume_report = None
+
+        # namespace -> schedules covering it, updated with the changes of namespaces and schedules
+        self.coverage = NamespaceCoverageIndex()
+
+    def apply_config(self, k8s_config):
+        """
+        Reloaded settings: the api clients, the breakers state and the namespace coverage are kept
+        """
+        self.expires_day_warning = k8s_config.EXPIRES_DAYS_WARNING
+        self.ignored_namespace = k8s_config.ignore_namespace
+        for breaker in self.breakers.values():
+            breaker.failure_threshold = k8s_config.breaker_failures
+            breaker.backoff_seconds = k8s_config.breaker_backoff_sec
+            breaker.max_backoff_seconds = k8s_config.breaker_max_backoff_sec
+            breaker.min_timeout = k8s_config.request_timeout_min
+            breaker.max_timeout = k8s_config.request_timeout_max
+            breaker.connect_timeout = k8s_config.connect_timeout
+        self._set_gzip(k8s_config.gzip_enable)
+        self.stream_decode = k8s_config.stream_decode
+        self.volume_stats_enable = k8s_config.volume_stats_enable
+        self.volume_stats_page_size = k8s_config.volume_stats_page_size
+
+    def _set_gzip(self, enable):
+        """
+        Ask compressed responses: the lists of backups are large json documents
+        """
+        if enable:
+            self.api_client.set_default_header('Accept-Encoding', 'gzip')
+        else:
+            self.api_client.default_headers.pop('Accept-Encoding', None)
+
+    def _record_transport(self, kind, seconds, failed=False):
+        """
+        Bytes and latency of the last call
+        """
+        if self.transport_stats is None:
+            return
+        if failed:
+            self.transport_stats.record_error(kind, seconds)
+            return
+        response = self.api_client.last_response
+        wire_bytes = body_bytes = 0
+        if response is not None:
+            if hasattr(response, 'urllib3_response'):
+                # RESTResponse of a preloaded call
+                wire_bytes = response.urllib3_response.tell()
+                body_bytes = len(response.data) if response.data is not None else 0
+            else:
+                # urllib3 response of a streamed call
+                wire_bytes = response.tell()
+                body_bytes = self.stream_bytes
+        self.transport_stats.record(kind, seconds, wire_bytes, body_bytes)
+        self.print_helper.debug_if(self.print_debug, "_call_api.%s %.3f sec wire=%s body=%s bytes",
+                                   kind, seconds, wire_bytes, body_bytes)
+
+    @staticmethod
+    def _retry_after(error: ApiException):
+        if error.headers is None:
+            return None
+        value = error.headers.get('Retry-After')
+        try:
+            return float(value) if value is not None else None
+        except ValueError:
+            return None
+
+    def _call_api(self, kind, fn, *args, **kwargs):
+        """
+        Invoke a k8s api through the circuit breaker of the resource kind
+        @param kind: resource kind
+        @param fn: api function
+        @return: the api response or None if the circuit is open
+        """
+        breaker = self.breakers[kind]
+        if not breaker.allow_request():
+            self.print_helper.wrn("_call_api.%s circuit open, skip the request. retry in %s sec (last error %s)",
+                                  kind, breaker.remaining_seconds(), breaker.last_error)
+            return None
+
+        start = time.monotonic()
+        self.api_client.last_response = None
+        self.stream_bytes = 0
+        try:
+            response = fn(*args, _request_timeout=breaker.request_timeout(), **kwargs)
+        except ApiException as e:
+            self._record_transport(kind, time.monotonic() - start, failed=True)
+            if e.status == 429 or e.status >= 500:
+                breaker.record_failure(f"{e.status} {e.reason}",
+                                       self._retry_after(e) if e.status == 429 else None,
+                                       time.monotonic() - start)
+                self.print_helper.wrn("_call_api.%s api server error %s, circuit %s",
+                                      kind, e.status, breaker.state)
+            else:
+                breaker.record_success(time.monotonic() - start)
+            raise
+        except Exception as e:
+            # timeouts and connection errors
+            self._record_transport(kind, time.monotonic() - start, failed=True)
+            breaker.record_failure(str(e), None, time.monotonic() - start)
+            self.print_helper.wrn("_call_api.%s request failed, circuit %s", kind, breaker.state)
+            raise
+
+        self._record_transport(kind, time.monotonic() - start)
+        breaker.record_success(time.monotonic() - start)
+        return response
+
     @handle_exceptions_method
     def _filter_ignored_namespace(self, keys_list, regex_list):
         self.print_helper.debug_if(self.debug, '_filter_ignored_namespace...')
@@ -54,21 +191,30 @@ class VeleroStatus:
             if not match_found:
                 filtered_keys.append(key)
             else:
-                self.print_helper.debug_if(self.debug, f'_filter_ignored_namespace discard : {key}')
+                self.print_helper.debug_if(self.debug, '_filter_ignored_namespace discard : %s', key)
 
         self.print_helper.debug_if(self.debug, f'_filter_ignored_namespace: {loop-len(filtered_keys)}')
 
         return filtered_keys
 
     @handle_exceptions_method
-    def _get_k8s_namespace(self):
+    def _get_k8s_namespace(self, with_labels=False):
+        """
+        @param with_labels: return a dict namespace -> labels instead of the list of names
+        """
         self.print_helper.debug_if(self.debug, '_get_namespace_list...')
 
         # Get namespaces list
-        namespace_list = self.v1.list_namespace()
+        namespace_list = self._call_api('namespaces', self.v1.list_namespace)
+        if namespace_list is None:
+            return None
 
         # Extract namespace list
-        namespaces = [namespace.metadata.name for namespace in namespace_list.items]
+        namespaces = [intern_str(namespace.metadata.name) for namespace in namespace_list.items]
+        labels = {}
+        if with_labels:
+            labels = {name: namespace.metadata.labels or {}
+                      for name, namespace in zip(namespaces, namespace_list.items)}
         all_nm = 0
         ignored_nm = 0
         if len(namespaces) > 0:
@@ -85,6 +231,8 @@ class VeleroStatus:
                                f"after filter: {len(namespaces)} "
                                f"ignored : {ignored_nm}")
 
+        if with_labels:
+            return {name: labels[name] for name in namespaces}
         return namespaces
 
     @handle_exceptions_method
@@ -96,7 +244,10 @@ class VeleroStatus:
         group = 'velero.io'
         version = 'v1'
         plural = 'schedules'
-        schedule_list = custom_api.list_namespaced_custom_object(group, version, namespace, plural)
+        schedule_list = self._call_api('schedules', custom_api.list_namespaced_custom_object,
+                                       group, version, namespace, plural)
+        if schedule_list is None:
+            return None
 
         schedules = {}
 
@@ -105,27 +256,101 @@ class VeleroStatus:
                 included_namespaces, \
                 included_resources, \
                 default_volumes_to_fs_backup, \
-                cron_time = self._extract_resources_from_schedule(schedule)
-            schedules[schedule_name] = {
-                'included_namespaces': included_namespaces,
-                'included_resources': included_resources,
-                'default_volumes_to_fs_backup': default_volumes_to_fs_backup,
-                'cron_time': cron_time
-            }
+                cron_time, \
+                excluded_namespaces, \
+                label_selectors = self._extract_resources_from_schedule(schedule)
+            schedule_name = intern_str(schedule_name)
+            schedules[schedule_name] = ScheduleRecord(
+                name=schedule_name,
+                included_namespaces=tuple(intern_str(nm) for nm in included_namespaces),
+                included_resources=tuple(intern_str(res) for res in included_resources),
+                default_volumes_to_fs_backup=bool(default_volumes_to_fs_backup),
+                cron_time=intern_str(cron_time),
+                paused=bool((schedule.get('spec') or {}).get('paused', False)),
+                created=to_epoch(parse_k8s_time(schedule['metadata'].get('creationTimestamp'))),
+                excluded_namespaces=tuple(intern_str(nm) for nm in excluded_namespaces),
+                label_selectors=tuple(label_selectors))
         return schedules
 
     @handle_exceptions_method
     def get_k8s_last_backup_status(self, namespace='velero'):
         backups = self._get_k8s_last_backup_status(namespace=namespace)
-        difference, counter, counter_all = self._get_unscheduled_namespaces()
-
-        unscheduled = {'difference': difference,
-                       'counter': counter,
-                       'counter_all': counter_all}
-        data = {'backups': backups, 'us_ns': unscheduled}
+        if backups is None or is_error_result(backups):
+            return backups
+        unscheduled = self._get_unscheduled_namespaces()
+        if unscheduled is None or is_error_result(unscheduled):
+            return unscheduled
+        difference, counter, counter_all = unscheduled
+
+        data = {'backups': backups,
+                'us_ns': UnscheduledNamespaces(difference=tuple(difference),
+                                               counter=counter,
+                                               counter_all=counter_all)}
+
+        if self.volume_stats_enable:
+            volumes = self.get_k8s_volume_stats(set(backups.keys()), set(self.coverage.schedule_names),
+                                                namespace=namespace)
+            if volumes is None or is_error_result(volumes):
+                self.print_helper.wrn('get_k8s_last_backup_status. volume stats not available, keep the last one')
+            else:
+                self.last_volume_report = volumes
+            data['volumes'] = self.last_volume_report
 
         return data
 
+    def _list_pages(self, kind, group, version, namespace, plural, page_size):
+        """
+        List a custom resource page by page (limit/continue), one page in memory at a time
+        @return: generator of the items of every page, a None page if the circuit is open
+        """
+        continue_token = None
+        while True:
+            kwargs = {'limit': page_size}
+            if continue_token:
+                kwargs['_continue'] = continue_token
+            page = self._call_api(kind, self.client.list_namespaced_custom_object,
+                                  group, version, namespace, plural, **kwargs)
+            if page is None:
+                yield None
+                return
+            yield page.get('items', [])
+            continue_token = (page.get('metadata') or {}).get('continue')
+            if not continue_token:
+                return
+
+    @handle_exceptions_method
+    def get_k8s_volume_stats(self, backup_names, schedule_names, namespace='velero'):
+        """
+        Aggregate the PodVolumeBackups and DataUploads per backup and per schedule, streaming the pages
+        @param backup_names: backups kept with their own aggregate (the reported ones)
+        @param schedule_names: schedules aggregated over all their backups
+        @return: VolumeReport, None if the circuit is open
+        """
+        for attempt in range(2):
+            aggregator = VolumeAggregator(backup_names, schedule_names)
+            try:
+                for plural, version in (('podvolumebackups', 'v1'), ('datauploads', 'v2alpha1')):
+                    try:
+                        for items in self._list_pages('volumes', 'velero.io', version, namespace, plural,
+                                                      self.volume_stats_page_size):
+                            if items is None:
+                                return None
+                            for item in items:
+                                aggregator.add_item(item)
+                    except ApiException as e:
+                        # data mover not installed (velero < 1.12)
+                        if e.status != 404:
+                            raise
+                self.print_helper.debug_if(self.debug, 'get_k8s_volume_stats. items %s backups %s schedules %s',
+                                           aggregator.items, len(aggregator.backups), len(aggregator.schedules))
+                return aggregator.result()
+            except ApiException as e:
+                # continue token expired: the list is restarted once from the beginning
+                if e.status == 410 and attempt == 0:
+                    self.print_helper.wrn('get_k8s_volume_stats. list expired, restart')
+                    continue
+                raise
+
     @handle_exceptions_method
     def _get_k8s_last_backup_status(self, namespace='velero'):
 
@@ -135,97 +360,143 @@ class VeleroStatus:
         group = 'velero.io'
         version = 'v1'
         plural = 'backups'
-        backup_list = custom_api.list_namespaced_custom_object(group, version, namespace, plural)
+        if self.stream_decode:
+            return self._call_api('backups', self._stream_last_backups, group, version, namespace, plural)
 
+        backup_list = self._call_api('backups', custom_api.list_namespaced_custom_object,
+                                     group, version, namespace, plural)
+        if backup_list is None:
+            return None
+        return self._reduce_backup_items(backup_list.get('items', []))
+
+    def _reduce_backup_items(self, items):
+        """
+        Last backup for every schedule and the backups without schedule
+        @param items: iterable of the backup items of the k8s api
+        """
         last_backup_info = OrderedDict()
+        latest_by_schedule = {}
+        now = datetime.now()
 
         # Extract last backup for every schedule
-        for backup in backup_list.get('items', []):
-            if backup.get('metadata', {}).get('labels').get('velero.io/schedule-name'):
-                schedule_name = backup['metadata']['labels']['velero.io/schedule-name']
-            else:
-                schedule_name = None
-
-            # print(f'***\n{backup}\n*****\n')
-            # LS 2023.11.26 add namespace
-            nm = ''
-            if 'namespace' in backup:
-                nm = backup['namespace']
-
-            if backup['status'] != {}:
-                if 'phase' in backup['status']:
-                    phase = backup['status']['phase']
-                else:
-                    phase = ''
-                errors = backup['status'].get('errors', [])
-                warnings = backup['status'].get('warnings', [])
-                backup_name = backup['metadata']['name']
-
-                time_expires = ''
-                if 'phase' in backup['status']:
-                    time_expires = backup['status'].get('expiration', "N/A")
-                    time_expire__str = str(
-                        (datetime.strptime(time_expires, '%Y-%m-%dT%H:%M:%SZ') - datetime.now()).days) + 'd'
-                else:
-                    if 'progress' in backup['status']:
-                        time_expire__str = 'in progress'
-                    else:
-                        time_expire__str = 'N/A'
-
-                if 'completionTimestamp' in backup['status']:
-                    completion_timestamp = backup['status'].get('completionTimestamp')
-                else:
-                    completion_timestamp = 'N/A'
-
-                backup_same_schedule_name = None
-                schedules = []
-                backup_same_schedule_data = {}
-                if schedule_name is not None:
-                    schedules = [last_backup_info[item]["schedule"] for item in dict(last_backup_info)]
-                    backup_same_schedule_name = next(
-                        (item for item in last_backup_info if last_backup_info[item]["schedule"] == schedule_name),
-                        None)
-                    if backup_same_schedule_name is not None:
-                        backup_same_schedule_data = last_backup_info[backup_same_schedule_name]
-
-                if schedule_name is None \
-                        or (schedule_name is not None and schedule_name not in schedules) \
-                        or (schedule_name is not None and backup_same_schedule_data is not None and backup_name >
-                            backup_same_schedule_data['backup_name']):
-
-                    if backup_same_schedule_name is not None:
-                        del last_backup_info[backup_same_schedule_name]
-                    last_backup_info[backup_name] = {
-                        'backup_name': backup_name,
-                        'phase': phase,
-                        'namespace': nm,
-                        'errors': errors,
-                        'warnings': warnings,
-                        'time_expires': time_expires,
-                        'schedule': schedule_name,
-                        'completion_timestamp': completion_timestamp,
-                        'expire': time_expire__str
-                    }
+        for backup in items:
+            record = self._backup_record(backup, now)
+            if record is not None:
+                self._reduce_last_backup(last_backup_info, latest_by_schedule, record)
 
         return last_backup_info
 
-    @handle_exceptions_method
-    def _get_scheduled_namespaces(self):
-        all_ns = []
-        schedules = self.get_k8s_velero_schedules()
-        for schedule in schedules:
-            all_ns = all_ns + schedules[schedule]['included_namespaces']
-        return all_ns
+    def _stream_last_backups(self, group, version, namespace, plural, _request_timeout=None):
+        """
+        List the backups without preloading the response: the items are decoded one at a time from the socket
+        and reduced at once, the read of the body is part of the call (timeout and circuit breaker)
+        """
+        response = self.client.list_namespaced_custom_object(group, version, namespace, plural,
+                                                             _preload_content=False,
+                                                             _request_timeout=_request_timeout)
+        completed = False
+        try:
+            stream = JsonListStream(response.stream(CHUNK_SIZE, decode_content=True))
+            last_backup_info = self._reduce_backup_items(stream.items())
+            self.stream_bytes = stream.body_bytes
+            completed = True
+            return last_backup_info
+        finally:
+            if not completed:
+                # partially read: the connection can not be reused
+                response.close()
+            response.release_conn()
+
+    def _backup_record(self, backup, now):
+        """
+        Build the record of a backup item, None if the backup has no status
+        @param backup: backup item of the k8s api
+        @param now: reference time for the expiration days
+        """
+        status = backup.get('status') or {}
+        if status == {}:
+            return None
+
+        metadata = backup['metadata']
+        schedule_name = (metadata.get('labels') or {}).get('velero.io/schedule-name') or None
+
+        # LS 2023.11.26 add namespace
+        nm = backup.get('namespace', '')
+
+        expiration = None
+        expire_days = None
+        if 'phase' in status:
+            expiration = parse_k8s_time(status.get('expiration'))
+            if expiration is not None:
+                expire_days = (expiration - now).days
+                # above the threshold the value is forced to the threshold:
+                # it avoids unuseful messages when only the expiration days change
+                if expire_days > self.expires_day_warning:
+                    expire_days = self.expires_day_warning
+
+        errors = status.get('errors', 0)
+        warnings = status.get('warnings', 0)
+        progress = status.get('progress') or {}
+        spec = backup.get('spec') or {}
+
+        return BackupRecord(backup_name=metadata['name'],
+                            phase=BackupPhase.parse(status.get('phase')),
+                            namespace=intern_str(nm),
+                            errors=errors if isinstance(errors, int) else len(errors),
+                            warnings=warnings if isinstance(warnings, int) else len(warnings),
+                            schedule=intern_str(schedule_name),
+                            expiration=to_epoch(expiration),
+                            completion=to_epoch(parse_k8s_time(status.get('completionTimestamp'))),
+                            expire_days=expire_days,
+                            in_progress='phase' not in status and 'progress' in status,
+                            start=to_epoch(parse_k8s_time(status.get('startTimestamp'))),
+                            items_backed_up=progress.get('itemsBackedUp', 0),
+                            total_items=progress.get('totalItems', 0),
+                            included_namespaces=tuple(intern_str(namespace)
+                                                      for namespace in spec.get('includedNamespaces') or ()))
+
+    @staticmethod
+    def _reduce_last_backup(last_backup_info, latest_by_schedule, record: BackupRecord):
+        """
+        Keep the backups without schedule and the last backup (greatest name) for every schedule
+        @param last_backup_info: backup name -> record
+        @param latest_by_schedule: schedule name -> backup name in last_backup_info
+        @param record: new backup record
+        """
+        if record.schedule is None:
+            last_backup_info[record.backup_name] = record
+            return
+
+        current = latest_by_schedule.get(record.schedule)
+        if current is None or record.backup_name > current:
+            if current is not None:
+                del last_backup_info[current]
+            last_backup_info[record.backup_name] = record
+            latest_by_schedule[record.schedule] = record.backup_name
 
     @handle_exceptions_method
     def _get_unscheduled_namespaces(self):
-        namespaces = self._get_k8s_namespace()
-        all_included_namespaces = self._get_scheduled_namespaces()
+        namespaces = self._get_k8s_namespace(with_labels=True)
+        if namespaces is None or is_error_result(namespaces):
+            return namespaces
+        schedules = self.get_k8s_velero_schedules()
+        if schedules is None or is_error_result(schedules):
+            return schedules
+
+        schedules_changed = self.coverage.update_schedules(schedules)
+        namespaces_changed = self.coverage.update_namespaces(namespaces)
+        self.print_helper.debug_if(self.debug, '_get_unscheduled_namespaces. changed schedules %s namespaces %s',
+                                   schedules_changed, namespaces_changed)
 
-        difference = list(set(namespaces) - set(all_included_namespaces))
-        difference.sort()
+        difference = self.coverage.unprotected()
         return difference, len(difference), len(namespaces)
 
+    def get_schedules_covering(self, namespace):
+        """
+        Schedules that include a namespace (as of the last cycle)
+        """
+        return self.coverage.covering(namespace)
+
     @handle_exceptions_method
     def _get_backup_error_message(self, message):
         if message == '[]':
@@ -255,12 +526,20 @@ class VeleroStatus:
             included_resources = []
             default_volumes_to_fs_backup = []
             cron_time = ''
+            excluded_namespaces = []
+            label_selectors = []
             if 'spec' in schedule:
                 cron_time = schedule['spec']['schedule']
                 included_resources = schedule['spec'].get('includedResources', [])
                 included_namespaces = schedule['spec']['template'].get('includedNamespaces', [])
                 default_volumes_to_fs_backup = schedule['spec']['template'].get('defaultVolumesToFsBackup', [])
-
-            return schedule_name, included_namespaces, included_resources, default_volumes_to_fs_backup, cron_time
+                excluded_namespaces = schedule['spec']['template'].get('excludedNamespaces') or []
+                label_selectors = [selector_key(selector) for selector in
+                                   [schedule['spec']['template'].get('labelSelector')] +
+                                   (schedule['spec']['template'].get('orLabelSelectors') or [])
+                                   if selector]
+
+            return (schedule_name, included_namespaces, included_resources, default_volumes_to_fs_backup, cron_time,
+                    excluded_namespaces, label_selectors)
         except Exception as e:
             self.print_helper.error(f"run.{e}")
@@ -0,0 +1,156 @@
+from dataclasses import dataclass, field
+
+from libs.velero_records import intern_str, parse_k8s_time, to_epoch
+
+# PodVolumeBackup and DataUpload phases
+VOLUME_FAILED_PHASES = frozenset(('Failed', 'Canceled'))
+VOLUME_COMPLETED_PHASES = frozenset(('Completed',))
+
+# failed volumes listed for every backup, the others are only counted
+MAX_FAILED_NAMES = 5
+
+
+def schedule_of_backup(backup_name, schedule_names):
+    """
+    Schedule of a backup from its name (<schedule>-yyyymmddhhmmss), None for the backups without schedule
+    @param schedule_names: existing schedules
+    """
+    prefix, _, suffix = backup_name.rpartition('-')
+    if prefix in schedule_names and len(suffix) >= 14 and suffix.isdigit():
+        return prefix
+    return None
+
+
+@dataclass(frozen=True, slots=True)
+class VolumeStats:
+    """
+    Aggregate of the volume backups (PodVolumeBackups and DataUploads).
+    Bytes and times are not compared: the progress of a running upload is not a change of state
+    """
+    volumes: int
+    completed: int
+    failed: int
+    failed_names: tuple
+    bytes_done: int = field(default=0, compare=False)
+    total_bytes: int = field(default=0, compare=False)
+    start: float | None = field(default=None, compare=False)
+    completion: float | None = field(default=None, compare=False)
+
+    @property
+    def duration(self):
+        if self.start is None or self.completion is None:
+            return None
+        return self.completion - self.start
+
+    def to_dict(self):
+        return {'volumes': self.volumes,
+                'completed': self.completed,
+                'failed': self.failed,
+                'failed_names': list(self.failed_names),
+                'bytes_done': self.bytes_done,
+                'total_bytes': self.total_bytes,
+                'duration': self.duration}
+
+
+@dataclass(frozen=True, slots=True)
+class VolumeReport:
+    """
+    Volume backups aggregated for every reported backup and for every schedule (all its backups)
+    """
+    backups: dict
+    schedules: dict
+
+
+class VolumeAccumulator:
+    """
+    Running aggregate of the volume backups of a backup or of a schedule, O(1) memory
+    """
+    __slots__ = ('volumes', 'completed', 'failed', 'failed_names', 'bytes_done', 'total_bytes', 'start',
+                 'completion')
+
+    def __init__(self):
+        self.volumes = 0
+        self.completed = 0
+        self.failed = 0
+        self.failed_names = []
+        self.bytes_done = 0
+        self.total_bytes = 0
+        self.start = None
+        self.completion = None
+
+    def add(self, name, phase, bytes_done, total_bytes, start, completion):
+        self.volumes += 1
+        if phase in VOLUME_COMPLETED_PHASES:
+            self.completed += 1
+        elif phase in VOLUME_FAILED_PHASES:
+            self.failed += 1
+            if len(self.failed_names) < MAX_FAILED_NAMES:
+                self.failed_names.append(name)
+        self.bytes_done += bytes_done
+        self.total_bytes += total_bytes
+        if start is not None and (self.start is None or start < self.start):
+            self.start = start
+        if completion is not None and (self.completion is None or completion > self.completion):
+            self.completion = completion
+
+    def freeze(self):
+        return VolumeStats(volumes=self.volumes,
+                           completed=self.completed,
+                           failed=self.failed,
+                           failed_names=tuple(self.failed_names),
+                           bytes_done=self.bytes_done,
+                           total_bytes=self.total_bytes,
+                           start=self.start,
+                           completion=self.completion)
+
+
+class VolumeAggregator:
+    """
+    Streaming aggregation of the volume backup items, page by page.
+    Every item updates the accumulator of its backup (only the reported backups are kept)
+    and of its schedule (all the backups); the item itself is not retained
+    """
+
+    def __init__(self, backup_names, schedule_names):
+        self.backup_names = backup_names
+        self.schedule_names = schedule_names
+        self.backups = {}
+        self.schedules = {}
+        self.items = 0
+
+    def add_item(self, item):
+        metadata = item.get('metadata') or {}
+        backup_name = (metadata.get('labels') or {}).get('velero.io/backup-name')
+        if backup_name is None:
+            return
+        self.items += 1
+
+        status = item.get('status') or {}
+        progress = status.get('progress') or {}
+        spec = item.get('spec') or {}
+        # PodVolumeBackup: pod/volume, DataUpload: source pvc
+        name = (f"{(spec.get('pod') or {}).get('name', '')}/{spec['volume']}" if 'volume' in spec
+                else spec.get('sourcePVC', metadata.get('name', '')))
+        values = (name,
+                  status.get('phase', ''),
+                  progress.get('bytesDone', 0) or 0,
+                  progress.get('totalBytes', 0) or 0,
+                  to_epoch(parse_k8s_time(status.get('startTimestamp'))),
+                  to_epoch(parse_k8s_time(status.get('completionTimestamp'))))
+
+        if backup_name in self.backup_names:
+            accumulator = self.backups.get(backup_name)
+            if accumulator is None:
+                accumulator = self.backups[intern_str(backup_name)] = VolumeAccumulator()
+            accumulator.add(*values)
+
+        schedule = schedule_of_backup(backup_name, self.schedule_names)
+        if schedule is not None:
+            accumulator = self.schedules.get(schedule)
+            if accumulator is None:
+                accumulator = self.schedules[intern_str(schedule)] = VolumeAccumulator()
+            accumulator.add(*values)
+
+    def result(self):
+        return VolumeReport(backups={name: value.freeze() for name, value in self.backups.items()},
+                            schedules={name: value.freeze() for name, value in self.schedules.items()})
@@ -1,15 +1,34 @@
+import argparse
 import asyncio
 import os
+import signal
+import sys
+from types import MappingProxyType
 
 from utils.print_helper import PrintHelper, LLogger
 from utils.config import ConfigProgram
 from utils.config import ConfigK8sProcess
 from utils.config import ConfigDispatcher
+from utils.config import ConfigStatusApi
+from utils.config import ConfigShard
 from libs.kubernetes_status_run import KubernetesStatusRun
 from libs.velero_checker import VeleroChecker
 from libs.dispatcher import Dispatcher
 from libs.dispatcher_telegram import DispatcherTelegram
 from libs.dispatcher_email import DispatcherEmail
+from libs.status_api import StatusCache, StatusApiServer, EventBroker
+from libs.history_store import HistoryStore
+from libs.shard_coordinator import ShardCoordinator
+from libs.run_once import write_report, EXIT_ERROR
+from utils.readiness import ReadinessSignal
+from libs.loop_monitor import LoopLagMonitor
+from utils.transport_stats import TransportStats
+from libs.config_reloader import ConfigReloader
+from libs.notification_dedup import NotificationDeduplicator
+from libs.notification_digest import ChangeDigest
+from libs.notification_event import NotificationQueue
+from libs.notification_router import NotificationRouter, compile_routes
+from utils.config_snapshot import ConfigSnapshot, read_config_source
 from utils.handle_error import handle_exceptions_async_method
 from utils.version import __version__
 from utils.version import __date__
@@ -21,13 +40,60 @@ debug_on = True
 print_helper = PrintHelper('K8s', None)
 
 
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description='Velero watchdog')
+    parser.add_argument('--once', action='store_true',
+                        help='run a single collection, check and dispatch cycle, write the JSON report and exit '
+                             'with the worst state (0 ok, 1 warning, 2 failed, 3 error)')
+    parser.add_argument('--output', default='-', help='file of the JSON report of --once ("-" is stdout)')
+    return parser
+
+
+async def run_once_cycle(k8s_stat_read: KubernetesStatusRun,
+                         velero_stat_checker: VeleroChecker,
+                         dispatchers,
+                         queues,
+                         output):
+    """
+    Single cycle: the stop signal (None) follows the data through the queues, every stage stops after
+    the previous one has drained its queue
+    :param dispatchers: main dispatcher, then the channels
+    :param queues: queue of the main dispatcher, then the queues of the channels
+    :param output: report file or '-'
+    """
+    dispatcher_main, *channels = dispatchers
+    queue_dispatcher, *queues_channels = queues
+
+    checker_task = asyncio.create_task(velero_stat_checker.run())
+    dispatcher_tasks = [asyncio.create_task(dispatcher.run()) for dispatcher in dispatchers]
+
+    await k8s_stat_read.run_once()
+    await checker_task
+
+    await queue_dispatcher.put(None)
+    await dispatcher_tasks[0]
+    for queue in queues_channels:
+        await queue.put(None)
+    await asyncio.gather(*dispatcher_tasks[1:])
+
+    report, exit_code = velero_stat_checker.run_once_report()
+    write_report(report, output)
+    print_helper.info("run once completed state=%s exit code=%s", report['state'], exit_code)
+    return exit_code
+
+
 # entry point coroutine
 @handle_exceptions_async_method
 async def main_start(seconds=1800,
                      load_kube_config=False,
                      config_file=None,
                      disp_class: ConfigDispatcher = None,
-                     k8s_class: ConfigK8sProcess = None):
+                     k8s_class: ConfigK8sProcess = None,
+                     api_class: ConfigStatusApi = None,
+                     shard_class: ConfigShard = None,
+                     run_once=False,
+                     output='-',
+                     config_snapshot: ConfigSnapshot = None):
     """
 
     :param seconds: time to scrapy the k8s system
@@ -35,20 +101,61 @@ async def main_start(seconds=1800,
     :param config_file: optional config file
     :param disp_class: class dispatcher configuration
     :param k8s_class: class k8s configuration
+    :param api_class: class status api configuration
+    :param shard_class: class shard configuration
+    :param run_once: single cycle, return the exit code
+    :param output: report file of the single cycle
+    :param config_snapshot: startup config of the mounted source (None if the reload is disabled)
     """
     # create the shared queue
     queue = asyncio.Queue()
-    queue_dispatcher = asyncio.Queue()
-    queue_dispatcher_telegram = asyncio.Queue()
-    queue_dispatcher_mail = asyncio.Queue()
+    # notifications by severity: the failures are sent before the reports and the alive messages
+    queue_dispatcher = NotificationQueue(disp_class.queue_pressure)
+    queue_dispatcher_telegram = NotificationQueue(disp_class.queue_pressure)
+    queue_dispatcher_mail = NotificationQueue(disp_class.queue_pressure)
+
+    status_cache = StatusCache(k8s_class.cluster_name)
+    readiness = ReadinessSignal(k8s_class.ready_file)
+    history = None
+    if k8s_class.history_enable:
+        history = HistoryStore(path=k8s_class.history_path,
+                               raw_days=k8s_class.history_raw_days,
+                               retention_days=k8s_class.history_retention_days)
+
+    event_broker = None
+    if api_class is not None and api_class.enable:
+        event_broker = EventBroker(queue_size=api_class.sse_queue_size,
+                                   max_subscribers=api_class.sse_max_clients)
+
+    # created also with the window 0 (disabled): a config reload can enable them
+    dedup = None
+    digest = None
+    if not run_once:
+        dedup = NotificationDeduplicator(window_seconds=disp_class.dedup_seconds,
+                                         max_entries=disp_class.dedup_max_entries)
+        digest = ChangeDigest(window_seconds=disp_class.digest_seconds,
+                              max_entries=disp_class.digest_max_entries)
+
+    shard = None
+    if shard_class is not None and shard_class.enable and not run_once:
+        shard = ShardCoordinator(debug_on=debug_on,
+                                 logger=logger,
+                                 shard_config=shard_class,
+                                 k8s_key_config=k8s_class)
 
+    router = NotificationRouter(disp_class.routes)
+    for error in router.errors:
+        print_helper.error("notification route not valid: %s", error)
+
+    transport_stats = TransportStats()
     k8s_stat_read = KubernetesStatusRun(kube_load_method=load_kube_config,
                                         kube_config_file=config_file,
                                         debug_on=debug_on,
                                         logger=logger,
                                         queue=queue,
                                         cycles_seconds=seconds,
-                                        k8s_key_config=k8s_class)
+                                        k8s_key_config=k8s_class,
+                                        transport_stats=transport_stats)
 
     velero_stat_checker = VeleroChecker(debug_on=debug_on,
                                         logger=logger,
@@ -56,7 +163,18 @@ async def main_start(seconds=1800,
                                         dispatcher_queue=queue_dispatcher,
                                         dispatcher_max_msg_len=disp_class.max_msg_len,
                                         dispatcher_alive_message_hours=disp_class.alive_message,
-                                        k8s_key_config=k8s_class
+                                        k8s_key_config=k8s_class,
+                                        status_cache=status_cache,
+                                        event_broker=event_broker,
+                                        history=history,
+                                        shard=shard,
+                                        run_once=run_once,
+                                        readiness=readiness,
+                                        dedup=dedup,
+                                        digest=digest,
+                                        delta_report=disp_class.delta_report,
+                                        full_report_hours=disp_class.full_report_hours,
+                                        router=router
                                         )
 
     dispatcher_main = Dispatcher(debug_on=debug_on,
@@ -82,40 +200,117 @@ async def main_start(seconds=1800,
                                       k8s_key_config=k8s_class
                                       )
 
+    if run_once:
+        return await run_once_cycle(k8s_stat_read,
+                                    velero_stat_checker,
+                                    [dispatcher_main, dispatcher_telegram, dispatcher_mail],
+                                    [queue_dispatcher, queue_dispatcher_telegram, queue_dispatcher_mail],
+                                    output)
+
+    tasks = [k8s_stat_read,
+             velero_stat_checker,
+             dispatcher_main,
+             dispatcher_telegram,
+             dispatcher_mail]
+
+    loop_monitor = None
+    if k8s_class.loop_monitor_enable:
+        loop_monitor = LoopLagMonitor(debug_on=debug_on,
+                                      logger=logger,
+                                      interval_ms=k8s_class.loop_monitor_interval_ms,
+                                      stall_threshold_ms=k8s_class.loop_stall_threshold_ms)
+        tasks.append(loop_monitor)
+
+    if api_class is not None and api_class.enable:
+        tasks.append(StatusApiServer(debug_on=debug_on,
+                                     logger=logger,
+                                     cache=status_cache,
+                                     broker=event_broker,
+                                     history=history,
+                                     readiness=readiness,
+                                     loop_monitor=loop_monitor,
+                                     transport_stats=transport_stats,
+                                     api_config=api_class))
+
+    if shard is not None:
+        tasks.append(shard)
+
+    if config_snapshot is not None:
+        tasks.append(ConfigReloader(debug_on=debug_on,
+                                    logger=logger,
+                                    path=k8s_class.config_reload_path,
+                                    reload_seconds=k8s_class.config_reload_sec,
+                                    snapshot=config_snapshot,
+                                    targets=[k8s_stat_read,
+                                             velero_stat_checker,
+                                             dispatcher_main,
+                                             dispatcher_telegram,
+                                             dispatcher_mail]))
+
+    # a pod stop sends SIGTERM: the tasks are cancelled and the finally block runs (lease release)
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    except NotImplementedError:
+        print_helper.wrn("SIGTERM handler not supported")
+
     try:
         while True:
             print_helper.info("try to restart the service")
 
             # run the producer and consumers
-            await asyncio.gather(k8s_stat_read.run(),
-                                 velero_stat_checker.run(),
-                                 dispatcher_main.run(),
-                                 dispatcher_telegram.run(),
-                                 dispatcher_mail.run())
+            await asyncio.gather(*[task.run() for task in tasks])
 
             print_helper.info("the service is not in run")
 
     except KeyboardInterrupt:
         print_helper.wrn("user request stop")
         pass
+    except asyncio.CancelledError:
+        print_helper.wrn("stop requested (SIGTERM)")
     except Exception as e:
         print_helper.error_and_exception(f"main_start", e)
+    finally:
+        # the other replicas take the shards without waiting for the lease expiration
+        if shard is not None:
+            shard.release()
 
 
 if __name__ == "__main__":
+    args = build_arg_parser().parse_args()
+    if args.once:
+        # stdout is reserved to the JSON report: the setup messages and the logs go to stderr
+        sys.stdout = sys.stderr
+
     print(f"INFO    [SYSTEM] start application version {__version__} release date {__date__}")
     path_script = os.path.dirname(os.path.realpath(__file__))
     config_prg = ConfigProgram(debug_on=debug_on)
+    # the mounted ConfigMap wins over the environment (envFrom is not updated in a running pod)
+    config_reload_path = config_prg.config_reload_path()
+    if len(config_reload_path) > 0 and os.path.exists(config_reload_path):
+        config_prg.overrides = read_config_source(config_reload_path)
     debug_on = config_prg.internal_debug_enable()
     clk8s_setup = ConfigK8sProcess(config_prg)
 
     clk8s_setup_disp = ConfigDispatcher(config_prg)
 
+    clk8s_setup_api = ConfigStatusApi(config_prg)
+
+    clk8s_setup_shard = ConfigShard(config_prg)
+
     # kube config method
     k8s_load_kube_config_method = config_prg.k8s_load_kube_config_method()
     kube_config_file = config_prg.k8s_config_file()
     loop_seconds = config_prg.process_run_sec()
 
+    startup_snapshot = None
+    if len(clk8s_setup.config_reload_path) > 0 and not args.once:
+        startup_snapshot = ConfigSnapshot(version=1,
+                                          values=MappingProxyType(dict(config_prg.overrides)),
+                                          k8s=clk8s_setup,
+                                          dispatcher=clk8s_setup_disp,
+                                          cycle_seconds=loop_seconds,
+                                          route_rules=compile_routes(clk8s_setup_disp.routes)[0])
+
     logger = init_logger.init_logger_from_config(cl_config=config_prg)
 
     print_helper.set_logger(logger)
@@ -125,9 +320,16 @@ if __name__ == "__main__":
         print_helper.info("start Check service")
 
     print_helper.info("start Watchdog")
-    asyncio.run(main_start(loop_seconds,
-                           k8s_load_kube_config_method,
-                           kube_config_file,
-                           clk8s_setup_disp,
-                           clk8s_setup
-                           ))
+    result = asyncio.run(main_start(loop_seconds,
+                                    k8s_load_kube_config_method,
+                                    kube_config_file,
+                                    clk8s_setup_disp,
+                                    clk8s_setup,
+                                    clk8s_setup_api,
+                                    clk8s_setup_shard,
+                                    run_once=args.once,
+                                    output=args.output,
+                                    config_snapshot=startup_snapshot
+                                    ))
+    if args.once:
+        sys.exit(result if isinstance(result, int) else EXIT_ERROR)
@@ -0,0 +1,64 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from utils.cron import CronExpression, CronError, ZoneInfo, parse_duration
+
+
+def epoch(*args):
+    return datetime(*args, tzinfo=timezone.utc).timestamp()
+
+
+@pytest.mark.parametrize('expression, before, expected', [
+    ('0 * * * *', epoch(2024, 5, 10, 12, 30), epoch(2024, 5, 10, 12, 0)),
+    ('0 * * * *', epoch(2024, 5, 10, 12, 0), epoch(2024, 5, 10, 12, 0)),
+    ('*/15 * * * *', epoch(2024, 5, 10, 12, 44, 59), epoch(2024, 5, 10, 12, 30)),
+    ('30 2 * * *', epoch(2024, 5, 10, 1, 0), epoch(2024, 5, 9, 2, 30)),
+    ('0 3 1 * *', epoch(2024, 3, 1, 2, 0), epoch(2024, 2, 1, 3, 0)),
+    ('0 0 * * sun', epoch(2024, 5, 10, 12, 0), epoch(2024, 5, 5, 0, 0)),
+    ('0 0 * * 7', epoch(2024, 5, 10, 12, 0), epoch(2024, 5, 5, 0, 0)),
+    ('0 1 * feb-mar *', epoch(2024, 5, 10), epoch(2024, 3, 31, 1, 0)),
+    ('@daily', epoch(2024, 1, 1, 0, 0, 1), epoch(2024, 1, 1)),
+    ('@yearly', epoch(2024, 5, 10), epoch(2024, 1, 1)),
+])
+def test_previous_fire(expression, before, expected):
+    assert CronExpression(expression).previous_fire(before) == expected
+
+
+def test_day_of_month_or_weekday():
+    # both day fields restricted: the 15th or any monday
+    cron = CronExpression('0 0 15 * mon')
+    assert cron.previous_fire(epoch(2024, 5, 16, 12)) == epoch(2024, 5, 15)
+    assert cron.previous_fire(epoch(2024, 5, 14, 12)) == epoch(2024, 5, 13)
+
+
+def test_never_matching_expression():
+    assert CronExpression('0 0 31 2 *').previous_fire(epoch(2024, 5, 10)) is None
+
+
+@pytest.mark.skipif(ZoneInfo is None, reason='zoneinfo not available')
+def test_time_zone_prefix():
+    cron = CronExpression('CRON_TZ=Europe/Rome 0 2 * * *')
+    # 02:00 in Rome is 00:00 UTC in summer time
+    assert cron.previous_fire(epoch(2024, 7, 1, 12)) == epoch(2024, 7, 1, 0)
+
+
+def test_every_has_no_previous_fire():
+    cron = CronExpression('@every 1h30m')
+    assert cron.interval == 5400
+    assert cron.previous_fire(epoch(2024, 5, 10)) is None
+
+
+def test_parse_duration():
+    assert parse_duration('1h30m') == 5400
+    assert parse_duration('90s') == 90
+    assert parse_duration('500ms') == 0.5
+
+
+@pytest.mark.parametrize('expression', [
+    '', '* * * *', '60 * * * *', '* 24 * * *', '* * 0 * *', '*/0 * * * *', '5-1 * * * *',
+    '@every', '@every 1d', '@every 0s', 'TZ=Nowhere/City * * * * *',
+])
+def test_invalid_expressions(expression):
+    with pytest.raises(CronError):
+        CronExpression(expression)
@@ -0,0 +1,42 @@
+from utils.hash_ring import ConsistentHashRing
+
+KEYS = [f"namespace-{index}" for index in range(2000)]
+
+
+def test_empty_ring_has_no_owner():
+    assert ConsistentHashRing().owner('key') is None
+
+
+def test_every_key_has_one_stable_owner():
+    ring = ConsistentHashRing(['a', 'b', 'c'])
+    owners = {key: ring.owner(key) for key in KEYS}
+    assert set(owners.values()) == {'a', 'b', 'c'}
+    # same members in another order, another replica: same owners
+    other = ConsistentHashRing(['c', 'a', 'b'])
+    assert all(other.owner(key) == owner for key, owner in owners.items())
+
+
+def test_keys_are_spread_on_the_members():
+    ring = ConsistentHashRing(['a', 'b', 'c', 'd'])
+    counts = {}
+    for key in KEYS:
+        counts[ring.owner(key)] = counts.get(ring.owner(key), 0) + 1
+    assert min(counts.values()) > len(KEYS) / 4 * 0.5
+
+
+def test_member_leaving_moves_only_its_keys():
+    ring = ConsistentHashRing(['a', 'b', 'c'])
+    smaller = ConsistentHashRing(['a', 'b'])
+    for key in KEYS:
+        if ring.owner(key) != 'c':
+            assert smaller.owner(key) == ring.owner(key)
+        else:
+            assert smaller.owner(key) in ('a', 'b')
+
+
+def test_member_joining_takes_about_its_share():
+    ring = ConsistentHashRing(['a', 'b', 'c'])
+    larger = ConsistentHashRing(['a', 'b', 'c', 'd'])
+    moved = [key for key in KEYS if ring.owner(key) != larger.owner(key)]
+    assert all(larger.owner(key) == 'd' for key in moved)
+    assert len(moved) < len(KEYS) / 4 * 1.5
@@ -0,0 +1,84 @@
+import sqlite3
+
+import pytest
+
+from libs.history_store import HistoryStore, SECONDS_DAY
+from libs.velero_records import BackupRecord, BackupPhase
+
+NOW = 1700000000.0
+
+
+def record(name, phase=BackupPhase.COMPLETED, completion=NOW - 3600, schedule='daily', items=10):
+    return BackupRecord(backup_name=name, phase=phase, namespace='velero', errors=0, warnings=0,
+                        schedule=schedule, expiration=None, completion=completion, expire_days=None,
+                        start=completion - 60, items_backed_up=items, total_items=items)
+
+
+@pytest.fixture
+def store(tmp_path):
+    history = HistoryStore(path=str(tmp_path / 'history.db'), raw_days=10, retention_days=100)
+    history.last_compaction = NOW
+    yield history
+    history.close()
+
+
+def test_insert_once_and_roll_up(store):
+    assert store.record_backups([record('a'), record('b', BackupPhase.FAILED)], now=NOW) == 2
+    assert store.record_backups([record('a'), record('b', BackupPhase.FAILED)], now=NOW) == 0
+
+    summary = store.schedule_summary(NOW - SECONDS_DAY, NOW)['daily']
+    assert summary['total'] == 2
+    assert summary['completed'] == 1
+    assert summary['failed'] == 1
+    assert summary['avg_duration'] == 60.0
+
+
+def test_not_terminal_backups_are_not_stored(store):
+    assert store.record_backups([record('a', BackupPhase.IN_PROGRESS)], now=NOW) == 0
+    assert store.schedule_summary(NOW - SECONDS_DAY, NOW) == {}
+
+
+def test_compacted_backup_is_not_counted_again(store):
+    old = record('old', completion=NOW - 20 * SECONDS_DAY)
+    store.record_backups([old], now=NOW - 20 * SECONDS_DAY)
+    start, end = NOW - 21 * SECONDS_DAY, NOW
+
+    assert store.compact(now=NOW) == 1
+    assert store.schedule_backups('daily', start, end) == []
+    # the backup is still listed by velero after its raw row is compacted
+    assert store.record_backups([old], now=NOW) == 0
+    assert store.schedule_summary(start, end)['daily']['total'] == 1
+
+
+def test_compact_keeps_the_rollups_in_retention(store):
+    store.record_backups([record('old', completion=NOW - 20 * SECONDS_DAY)], now=NOW - 20 * SECONDS_DAY)
+    store.record_backups([record('older', completion=NOW - 200 * SECONDS_DAY)], now=NOW - 200 * SECONDS_DAY)
+    store.compact(now=NOW)
+
+    summary = store.schedule_summary(NOW - 300 * SECONDS_DAY, NOW)
+    assert summary['daily']['total'] == 1
+
+
+def test_unscheduled_gaps(store):
+    store.record_unscheduled(['a', 'b'], now=NOW - 100)
+    store.record_unscheduled(['b'], now=NOW)
+
+    gaps = store.unprotected_namespaces(NOW - 200, NOW + 1)
+    assert gaps == {'a': [[NOW - 100, NOW]], 'b': [[NOW - 100, None]]}
+
+
+def test_failed_write_is_rolled_back(store):
+    store.connection.execute('DROP TABLE namespace_gaps')
+    store.connection.execute('CREATE TABLE namespace_gaps (namespace TEXT)')
+
+    assert 'error' in store.record_unscheduled(['a'], now=NOW)
+    assert not store.connection.in_transaction
+    # the connection is still usable
+    assert store.record_backups([record('a')], now=NOW) == 1
+
+
+def test_database_is_created_in_a_new_folder(tmp_path):
+    path = tmp_path / 'folder' / 'history.db'
+    history = HistoryStore(path=str(path))
+    history.close()
+    assert sqlite3.connect(str(path)).execute('SELECT COUNT(*) FROM backups').fetchone() == (0,)
@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+from utils.json_stream import JsonListStream
+
+DOCUMENT = {
+    'apiVersion': 'velero.io/v1',
+    'kind': 'BackupList',
+    'metadata': {'resourceVersion': '123', 'continue': ''},
+    'items': [{'metadata': {'name': f"daily-{index}", 'labels': {'team': 'café ☃'}},
+               'status': {'phase': 'Completed', 'progress': {'itemsBackedUp': index * 10}}}
+              for index in range(5)] + [12345, 'text', None, [], {}],
+    'trailer': [1.5, True],
+}
+
+
+def chunked(data: bytes, size):
+    return [data[start:start + size] for start in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 64, 100000])
+def test_items_and_fields_from_any_chunk_size(size):
+    body = json.dumps(DOCUMENT, ensure_ascii=False, indent=1).encode('utf-8')
+    stream = JsonListStream(chunked(body, size))
+
+    assert list(stream.items()) == DOCUMENT['items']
+    assert stream.fields == {key: value for key, value in DOCUMENT.items() if key != 'items'}
+    assert stream.body_bytes == len(body)
+
+
+@pytest.mark.parametrize('body, items, fields', [
+    (b'{}', [], {}),
+    (b'{"items": []}', [], {}),
+    (b' { "items" : [ 1 , 2 ] , "kind" : "List" } ', [1, 2], {'kind': 'List'}),
+    (b'{"items": null}', [], {'items': None}),
+])
+def test_small_documents(body, items, fields):
+    stream = JsonListStream(chunked(body, 1) + [b''])
+    assert list(stream.items()) == items
+    assert stream.fields == fields
+
+
+def test_items_are_decoded_lazily():
+    consumed = []
+
+    def chunks():
+        for chunk in (b'{"items": [', b'{"a": 1},', b'{"a": 2}', b']}'):
+            consumed.append(chunk)
+            yield chunk
+
+    items = JsonListStream(chunks()).items()
+    assert next(items) == {'a': 1}
+    assert len(consumed) < 4
+
+
+@pytest.mark.parametrize('body', [b'', b'[1, 2]', b'{"items": [1, 2}', b'{"items": [1, 2]', b'{"items": [{"a": ]}'])
+def test_invalid_documents(body):
+    with pytest.raises(ValueError):
+        list(JsonListStream(chunked(body, 3)).items())
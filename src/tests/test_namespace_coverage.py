@@ -0,0 +1,82 @@
+import random
+
+from libs.namespace_coverage import CoverageRule, NamespaceCoverageIndex
+from libs.velero_records import ScheduleRecord
+
+
+def schedule(name, included=(), excluded=(), label_selectors=()):
+    return ScheduleRecord(name=name, included_namespaces=tuple(included), included_resources=(),
+                          default_volumes_to_fs_backup=False, cron_time='0 0 * * *',
+                          excluded_namespaces=tuple(excluded), label_selectors=tuple(label_selectors))
+
+
+def test_rule_velero_semantics():
+    assert CoverageRule().covers('app', {})
+    assert CoverageRule(('*',)).covers('app', {})
+    assert CoverageRule(('app-*',)).covers('app-1', {})
+    assert not CoverageRule(('app-*',)).covers('db', {})
+    assert not CoverageRule(('*',), ('kube-*',)).covers('kube-system', {})
+    assert not CoverageRule(('app',), ('app',)).covers('app', {})
+
+
+def test_selectors_do_not_filter_namespaces():
+    index = NamespaceCoverageIndex()
+    index.update_namespaces({'app': {}, 'db': {'team': 'db'}})
+    index.update_schedules({'labelled': schedule('labelled', ['app'], label_selectors=[{'app': 'web'}])})
+
+    assert index.covering('app') == ['labelled']
+    assert index.unprotected() == ['db']
+
+
+def test_incremental_updates():
+    index = NamespaceCoverageIndex()
+    assert index.update_namespaces({'app': {}, 'db': {}, 'kube-system': {}}) == 3
+    assert index.unprotected() == ['app', 'db', 'kube-system']
+
+    assert index.update_schedules({'apps': schedule('apps', ['app', 'web'])}) == 1
+    assert index.unprotected() == ['db', 'kube-system']
+
+    # the namespace listed by the schedule is covered when it is created
+    index.update_namespaces({'app': {}, 'db': {}, 'kube-system': {}, 'web': {}})
+    assert index.covering('web') == ['apps']
+
+    # an unchanged selection is not evaluated again
+    assert index.update_schedules({'apps': schedule('apps', ['app', 'web'])}) == 0
+    assert index.update_schedules({'apps': schedule('apps', ['app', 'web']),
+                                   'all': schedule('all', excluded=['kube-*'])}) == 1
+    assert index.covering('app') == ['all', 'apps']
+    assert index.unprotected() == ['kube-system']
+
+    assert index.update_schedules({'all': schedule('all', excluded=['kube-*'])}) == 1
+    assert index.covering('web') == ['all']
+
+    assert index.update_schedules({}) == 1
+    assert index.unprotected() == ['app', 'db', 'kube-system', 'web']
+
+    assert index.update_namespaces({'db': {}}) == 3
+    assert index.unprotected() == ['db']
+    assert index.covering('app') == []
+
+
+def test_index_matches_a_full_evaluation():
+    generator = random.Random(7)
+    names = [f"ns-{index}" for index in range(12)] + ['kube-system', 'kube-public']
+    specs = [((), ()), (('ns-1', 'ns-2'), ()), (('ns-1*',), ()), (('*',), ('kube-*',)), (('kube-system',), ())]
+    index = NamespaceCoverageIndex()
+    for _ in range(200):
+        namespaces = {name: {} for name in names if generator.random() < 0.7}
+        schedules = {f"s-{number}": schedule(f"s-{number}", *generator.choice(specs))
+                     for number in range(4) if generator.random() < 0.6}
+        if generator.random() < 0.5:
+            index.update_namespaces(namespaces)
+            index.update_schedules(schedules)
+        else:
+            index.update_schedules(schedules)
+            index.update_namespaces(namespaces)
+
+        for namespace in namespaces:
+            expected = sorted(name for name, record in schedules.items()
+                              if CoverageRule(record.included_namespaces, record.excluded_namespaces)
+                              .covers(namespace, {}))
+            assert index.covering(namespace) == expected
+        assert index.unprotected() == sorted(name for name in namespaces if not index.covering(name))
@@ -0,0 +1,69 @@
+from libs.notification_dedup import NotificationDeduplicator, fingerprint, normalize_message
+from libs.notification_event import NotificationEvent, Destination
+
+WINDOW = 900
+
+
+def test_volatile_fields_are_ignored():
+    first = "backup daily-20240101120000 end at 2024-01-01 12:05:00 expire=29d bytes=10/100"
+    second = "backup daily-20240102120000 end at 2024-01-02 12:04:10 expire=28d bytes=90/100"
+    assert normalize_message(first) == normalize_message(second)
+    assert fingerprint(first) == fingerprint(second)
+    assert fingerprint(first) != fingerprint("backup daily-20240101120000 failed")
+
+
+def test_repeat_within_the_window_is_suppressed():
+    dedup = NotificationDeduplicator(window_seconds=WINDOW)
+    assert dedup.admit("report", now=0)
+    assert not dedup.admit("report", now=1)
+    assert not dedup.admit("report", now=WINDOW - 1)
+    assert dedup.admit("other report", now=2)
+    assert dedup.suppressed == 2
+
+
+def test_flush_sends_the_last_version_once():
+    dedup = NotificationDeduplicator(window_seconds=WINDOW)
+    dedup.admit("expire=10d", now=0)
+    dedup.admit("expire=9d", now=10)
+    dedup.admit("single", now=20)
+
+    assert dedup.expired(now=WINDOW - 1) == []
+    assert dedup.expired(now=WINDOW + 20) == ["expire=9d\n(repeated 1 times)"]
+    assert dedup.expired(now=WINDOW * 3) == []
+    assert len(dedup.entries) == 0
+
+
+def test_new_window_after_the_expiry():
+    dedup = NotificationDeduplicator(window_seconds=WINDOW)
+    dedup.admit("report", now=0)
+    assert dedup.admit("report", now=WINDOW)
+    assert not dedup.admit("report", now=WINDOW + 1)
+
+
+def test_max_entries_flushes_the_oldest():
+    dedup = NotificationDeduplicator(window_seconds=WINDOW, max_entries=2)
+    for now, message in enumerate(("a", "a", "b", "c")):
+        dedup.admit(message, now=now)
+    assert dedup.expired(now=4) == ["a\n(repeated 1 times)"]
+    assert list(entry.last_message for entry in dedup.entries.values()) == ["b", "c"]
+
+
+def test_disabled_window():
+    dedup = NotificationDeduplicator(window_seconds=0)
+    assert dedup.admit("report", now=0)
+    assert dedup.admit("report", now=1)
+    assert dedup.expired(now=2) == []
+
+
+def test_events_are_deduplicated_per_destination():
+    team = Destination(name='team', telegram_chat_id='-100')
+    dedup = NotificationDeduplicator(window_seconds=WINDOW)
+    assert dedup.admit(NotificationEvent("report"), now=0)
+    assert dedup.admit(NotificationEvent("report", destination=team), now=1)
+    assert not dedup.admit(NotificationEvent("report", destination=team, sequence=5), now=2)
+
+    [repeated] = dedup.expired(now=WINDOW + 1)
+    assert isinstance(repeated, NotificationEvent)
+    assert repeated.destination == team
+    assert repeated.sequence == 5
+    assert repeated.message == "report\n(repeated 1 times)"
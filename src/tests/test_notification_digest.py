@@ -0,0 +1,103 @@
+from libs.notification_digest import ChangeDigest, is_failure
+from libs.velero_records import BackupRecord, BackupPhase
+
+
+def record(name, phase=BackupPhase.COMPLETED, errors=0):
+    return BackupRecord(backup_name=name, phase=phase, namespace='velero', errors=errors, warnings=0,
+                        schedule='daily', expiration=None, completion=1700000000.0, expire_days=None)
+
+
+def test_failures_bypass_the_digest():
+    assert is_failure(record('b', BackupPhase.PARTIALLY_FAILED))
+    assert is_failure(record('b', errors=1))
+    assert not is_failure(record('b'))
+    assert not is_failure(None)
+
+
+def test_backup_changes_are_merged():
+    digest = ChangeDigest(window_seconds=600)
+    first, second, third = record('daily-1'), record('daily-2', BackupPhase.IN_PROGRESS), record('daily-2')
+    digest.add_backup('daily', first, second, now=0)
+    digest.add_backup('daily', second, third, now=10)
+
+    assert len(digest) == 1
+    assert digest.render() == ('Digest of the last 10 min [2 changes]\n'
+                               '• Backups changed=1\n'
+                               '\tdaily: daily-1 Completed -> daily-2 Completed')
+
+
+def test_backup_back_to_the_first_state_cancels():
+    digest = ChangeDigest()
+    first, second = record('daily-1'), record('daily-2')
+    digest.add_backup('daily', first, second, now=0)
+    digest.add_backup('daily', second, first, now=1)
+    assert len(digest) == 0
+
+    digest.add_backup('manual', None, record('manual'), now=2)
+    digest.add_backup('manual', record('manual'), None, now=3)
+    assert len(digest) == 0
+    assert digest.render() == ''
+
+
+def test_schedule_added_and_removed_cancels():
+    digest = ChangeDigest()
+    digest.add_schedule('daily', 'added', now=0)
+    digest.add_schedule('daily', 'updated', [('ttl', '24h', '48h')], now=1)
+    digest.add_schedule('daily', 'removed', now=2)
+    assert len(digest) == 0
+
+
+def test_schedule_updates_keep_first_and_last_value():
+    digest = ChangeDigest(window_seconds=60)
+    digest.add_schedule('daily', 'updated', [('ttl', '24h', '48h'), ('paused', False, True)], now=0)
+    digest.add_schedule('daily', 'updated', [('ttl', '48h', '72h'), ('paused', True, False)], now=1)
+    assert digest.render() == ('Digest of the last 1 min [2 changes]\n'
+                               '• Schedules changed=1\n'
+                               '\tdaily: updated\n'
+                               '\t\tttl: from 24h to 72h')
+
+    digest.add_schedule('daily', 'updated', [('ttl', '72h', '24h')], now=2)
+    assert digest.render() == ''
+
+
+def test_namespaces_cancel_each_other():
+    digest = ChangeDigest()
+    digest.add_namespaces(scheduled=[], unscheduled=['app', 'db'], now=0)
+    digest.add_namespaces(scheduled=['app'], unscheduled=[], now=1)
+    assert digest.unscheduled == {'db'}
+    assert digest.scheduled == set()
+    assert digest.has_warnings
+
+
+def test_warnings_keep_the_last_text():
+    digest = ChangeDigest(window_seconds=60)
+    assert not digest.has_warnings
+    digest.add_warnings([(('expiring', 'daily-1'), 'daily-1 expire=3d')], now=0)
+    digest.add_warnings([(('expiring', 'daily-1'), 'daily-1 expire=2d')], now=1)
+    assert digest.has_warnings
+    assert digest.render().endswith('• Warnings=1\n\tdaily-1 expire=2d')
+
+    digest.reset()
+    assert len(digest) == 0
+    assert not digest.has_warnings
+
+
+def test_window():
+    digest = ChangeDigest(window_seconds=600)
+    assert not digest.due(now=1000)
+    digest.add_schedule('daily', 'added', now=100)
+    assert not digest.due(now=699)
+    assert digest.due(now=700)
+    digest.reset()
+    assert not digest.due(now=1000)
+
+
+def test_entries_above_the_limit_are_counted():
+    digest = ChangeDigest(max_entries=2)
+    for name in ('a', 'b', 'c'):
+        digest.add_schedule(name, 'added', now=0)
+    digest.add_warnings([(('expiring', 'x'), 'x')], now=0)
+
+    assert len(digest) == 2
+    assert digest.dropped == 2
+    assert digest.render().endswith('Changes not listed (max 2)=2')
@@ -0,0 +1,111 @@
+import asyncio
+
+from libs.notification_event import (NotificationEvent, NotificationQueue, Severity, Destination,
+                                     COALESCE_SEPARATOR, EVENT_SCHEDULE)
+
+
+def drain(queue):
+    items = []
+    while not queue.empty():
+        items.append(queue.get_nowait())
+    return items
+
+
+def event(message, severity=Severity.INFO, sequence=0, **kwargs):
+    return NotificationEvent(message, severity=severity, sequence=sequence, **kwargs)
+
+
+def test_severity_first_then_sequence_and_stop_last():
+    queue = NotificationQueue()
+    queue.put_nowait(event('low', Severity.LOW, 1))
+    queue.put_nowait(event('info 3', Severity.INFO, 3))
+    queue.put_nowait(None)
+    queue.put_nowait(event('info 2', Severity.INFO, 2))
+    queue.put_nowait(event('critical', Severity.CRITICAL, 4))
+    queue.put_nowait(event('warning', Severity.WARNING, 5))
+
+    items = drain(queue)
+    assert items[-1] is None
+    assert [item.message for item in items[:-1]] == ['critical', 'warning', 'info 2', 'info 3', 'low']
+
+
+def test_no_coalescing_below_the_pressure():
+    queue = NotificationQueue(pressure_size=3)
+    for sequence in range(3):
+        queue.put_nowait(event(f"info {sequence}", sequence=sequence))
+    assert queue.qsize() == 3
+    assert queue.coalesced == 0
+
+
+def test_info_messages_are_appended_under_pressure():
+    queue = NotificationQueue(pressure_size=2)
+    for sequence in range(4):
+        queue.put_nowait(event(f"info {sequence}", sequence=sequence))
+
+    assert queue.coalesced == 2
+    assert [item.message for item in drain(queue)] == \
+        ['info 0', COALESCE_SEPARATOR.join(['info 1', 'info 2', 'info 3'])]
+
+
+def test_low_message_replaces_the_pending_one():
+    queue = NotificationQueue(pressure_size=1)
+    queue.put_nowait(event('alive 1', Severity.LOW, 1))
+    queue.put_nowait(event('alive 2', Severity.LOW, 2))
+    assert [item.message for item in drain(queue)] == ['alive 2']
+
+
+def test_only_the_same_group_is_coalesced():
+    team = Destination(name='team', telegram_chat_id='-100')
+    queue = NotificationQueue(pressure_size=1)
+    queue.put_nowait(event('report', sequence=1))
+    queue.put_nowait(event('critical', Severity.CRITICAL, 2))
+    queue.put_nowait(event('warning', Severity.WARNING, 3))
+    queue.put_nowait(event('warning', Severity.WARNING, 4))
+    queue.put_nowait(event('schedule', sequence=5, kind=EVENT_SCHEDULE))
+    queue.put_nowait(event('team', sequence=6, destination=team))
+    queue.put_nowait(event('other cluster', sequence=7, cluster='other'))
+
+    assert queue.qsize() == 7
+    assert queue.coalesced == 0
+
+
+def test_sent_message_is_not_coalesced():
+    queue = NotificationQueue(pressure_size=1)
+    queue.put_nowait(event('info 1', sequence=1))
+    queue.put_nowait(event('critical', Severity.CRITICAL, 2))
+    assert queue.get_nowait().message == 'critical'
+    assert queue.get_nowait().message == 'info 1'
+    queue.put_nowait(event('info 2', sequence=3))
+    queue.put_nowait(event('info 3', sequence=4))
+    assert [item.message for item in drain(queue)] == [f"info 2{COALESCE_SEPARATOR}info 3"]
+
+
+def test_preempts():
+    queue = NotificationQueue()
+    assert not queue.preempts(event('info'))
+    queue.put_nowait(event('warning', Severity.WARNING))
+    assert queue.preempts(event('info'))
+    assert not queue.preempts(event('critical', Severity.CRITICAL))
+
+
+def test_stop_follows_the_pending_notifications():
+    async def run():
+        queue = NotificationQueue()
+        received = []
+
+        async def consumer():
+            while True:
+                item = await queue.get()
+                queue.task_done()
+                if item is None:
+                    return
+                received.append(item.message)
+
+        task = asyncio.create_task(consumer())
+        await queue.put(event('info', sequence=1))
+        await queue.put(None)
+        await queue.put(event('critical', Severity.CRITICAL, 2))
+        await task
+        return received
+
+    assert asyncio.run(run()) == ['critical', 'info']
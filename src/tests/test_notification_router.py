@@ -0,0 +1,71 @@
+import pytest
+
+from libs.notification_event import DEFAULT_DESTINATION, Severity
+from libs.notification_router import NotificationRouter, compile_routes, parse_route
+
+ROUTES = [
+    'name=payments namespace=payments-*,billing severity=warning telegram_chat_id=-100',
+    'name=nightly schedule=nightly-* email=ops@example.com;dba@example.com',
+    'name=staging cluster=staging-* telegram_chat_id=-200 telegram_token=token',
+]
+
+
+def test_parse_route():
+    rule = parse_route(ROUTES[0])
+    assert rule.destination.name == 'payments'
+    assert rule.destination.telegram_chat_id == '-100'
+    assert rule.severity == Severity.WARNING
+    assert rule.matches(('billing',), None, Severity.CRITICAL, '')
+    assert not rule.matches(('billing',), None, Severity.INFO, '')
+    assert not rule.matches(('payment',), None, Severity.CRITICAL, '')
+
+    assert parse_route('email=a@b.com', index=4).destination.name == 'route-4'
+
+
+@pytest.mark.parametrize('text', [None, 'namespace=app', 'team=a email=a@b.com', 'email',
+                                  'severity=urgent email=a@b.com'])
+def test_invalid_route(text):
+    with pytest.raises(ValueError):
+        parse_route(text)
+
+
+def test_invalid_routes_are_skipped():
+    rules, errors = compile_routes(['namespace=app', ROUTES[1]])
+    assert [rule.destination.name for rule in rules] == ['nightly']
+    assert errors == ['route 1: no telegram_chat_id or email']
+
+
+def test_first_matching_route():
+    router = NotificationRouter(ROUTES)
+    assert router.errors == []
+    assert router.active
+
+    assert router.route(('payments-eu',), 'nightly-db', Severity.CRITICAL).name == 'payments'
+    assert router.route(('payments-eu',), 'nightly-db', Severity.INFO).name == 'nightly'
+    assert router.route(('app',), None, Severity.INFO, 'staging-1').name == 'staging'
+    assert router.route(('app',), None, Severity.INFO, 'prod') is DEFAULT_DESTINATION
+    # the namespace pattern matches any namespace of the item
+    assert router.route(('app', 'billing'), None, Severity.WARNING).name == 'payments'
+
+
+def test_no_routes():
+    router = NotificationRouter()
+    assert not router.active
+    assert router.route(('payments',), None, Severity.CRITICAL) is DEFAULT_DESTINATION
+
+
+def test_split_keeps_the_order_of_the_items():
+    router = NotificationRouter(ROUTES)
+    groups = router.split([('a', ('payments-1',), None, Severity.CRITICAL),
+                           ('b', ('app',), None, Severity.INFO),
+                           ('c', ('app',), 'nightly-1', Severity.INFO),
+                           ('d', ('billing',), None, Severity.WARNING)])
+    assert {destination.name: keys for destination, keys in groups.items()} == \
+        {'payments': ['a', 'd'], 'default': ['b'], 'nightly': ['c']}
+
+
+def test_set_rules_clears_the_cache():
+    router = NotificationRouter(ROUTES)
+    assert router.route(('billing',), None, Severity.CRITICAL).name == 'payments'
+    router.set_rules(compile_routes([ROUTES[1]])[0])
+    assert router.route(('billing',), None, Severity.CRITICAL) is DEFAULT_DESTINATION
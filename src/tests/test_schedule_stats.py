@@ -0,0 +1,85 @@
+import pytest
+
+from libs.schedule_stats import RunningStats, ScheduleStatsTracker
+from libs.velero_records import BackupRecord, BackupPhase
+
+NOW = 1700000000.0
+
+
+def record(name, duration=600, items=100, phase=BackupPhase.COMPLETED, schedule='daily'):
+    return BackupRecord(backup_name=name, phase=phase, namespace='velero', errors=0, warnings=0,
+                        schedule=schedule, expiration=None, completion=NOW, expire_days=None,
+                        start=NOW - duration, items_backed_up=items, total_items=items)
+
+
+def history(count, **kwargs):
+    return [record(f"daily-{index:03d}", **kwargs) for index in range(count)]
+
+
+def test_running_stats_warm_up_uses_cumulative_mean():
+    stats = RunningStats()
+    for value in (10, 20, 30):
+        stats.update(value, alpha=0.1)
+    assert stats.count == 3
+    assert stats.mean == pytest.approx(20)
+
+
+def test_running_stats_needs_min_samples():
+    stats = RunningStats()
+    for value in (100, 100, 100):
+        stats.update(value, alpha=0.1)
+    assert not stats.is_anomaly(1000, min_samples=5, zscore=3, min_ratio=0.5)
+    assert stats.is_anomaly(1000, min_samples=3, zscore=3, min_ratio=0.5)
+
+
+def test_small_deviation_is_not_an_anomaly():
+    stats = RunningStats(count=10, mean=100, variance=0)
+    # beyond zscore (std 0) but within min_ratio of the mean
+    assert not stats.is_anomaly(140, min_samples=5, zscore=3, min_ratio=0.5)
+    assert stats.is_anomaly(160, min_samples=5, zscore=3, min_ratio=0.5)
+
+
+def test_observe_reports_slow_and_small_backups():
+    tracker = ScheduleStatsTracker(path='', min_samples=5)
+    assert tracker.observe(history(10)) == []
+
+    anomalies = tracker.observe([record('daily-100', duration=3000, items=10)])
+    assert [(name, schedule) for name, schedule, _ in anomalies] == [('daily-100', 'daily'), ('daily-100', 'daily')]
+    assert anomalies[0][2] == 'duration 3000s, usual 600s'
+    assert anomalies[1][2] == 'items 10, usual 100'
+
+
+def test_observe_counts_every_backup_once():
+    tracker = ScheduleStatsTracker(path='')
+    records = history(3)
+    tracker.observe(records)
+    tracker.observe(records)
+
+    stats = tracker.schedules['daily']
+    assert stats.duration.count == 3
+    assert stats.last_backup == 'daily-002'
+
+
+def test_observe_skips_failed_and_unscheduled_backups():
+    tracker = ScheduleStatsTracker(path='')
+    tracker.observe([record('a', phase=BackupPhase.FAILED), record('b', schedule=None)])
+    assert tracker.schedules == {}
+    assert not tracker.changed
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / 'stats' / 'schedule_stats.json')
+    tracker = ScheduleStatsTracker(path=path)
+    assert tracker.save() is False
+    tracker.observe(history(4))
+    assert tracker.save() is True
+
+    loaded = ScheduleStatsTracker(path=path)
+    assert loaded.load() == 1
+    stats = loaded.schedules['daily']
+    assert stats.last_backup == 'daily-003'
+    assert stats.duration.to_list() == tracker.schedules['daily'].duration.to_list()
+
+
+def test_load_missing_file(tmp_path):
+    assert ScheduleStatsTracker(path=str(tmp_path / 'missing.json')).load() == 0
@@ -0,0 +1,65 @@
+import argparse
+import asyncio
+import random
+import time
+
+from utils.config import ConfigK8sProcess
+from libs.velero_checker import VeleroChecker
+from libs.velero_records import BackupRecord, BackupPhase, UnscheduledNamespaces
+
+
+def generate_backups(count, seed=None):
+    """
+    Generate the last backup report data as returned by VeleroStatus.get_k8s_last_backup_status
+    """
+    rnd = random.Random(seed)
+    now = time.time()
+    backups = {}
+    for index in range(count):
+        name = f"schedule-{index:06d}-20231128171000"
+        phase = rnd.choices([BackupPhase.COMPLETED, BackupPhase.PARTIALLY_FAILED, BackupPhase.FAILED,
+                             BackupPhase.IN_PROGRESS], weights=[90, 5, 2, 3])[0]
+        expire_days = rnd.randint(1, 30)
+        backups[name] = BackupRecord(backup_name=name,
+                                     phase=phase,
+                                     namespace='',
+                                     errors=rnd.randint(1, 5) if phase in (BackupPhase.FAILED,
+                                                                           BackupPhase.PARTIALLY_FAILED) else 0,
+                                     warnings=rnd.randint(1, 5) if rnd.random() < 0.05 else 0,
+                                     schedule=f"schedule-{index:06d}",
+                                     expiration=now + expire_days * 86400 + 3600,
+                                     completion=now - rnd.randint(1, 200) * 3600,
+                                     expire_days=expire_days)
+    return {'backups': backups,
+            'us_ns': UnscheduledNamespaces(difference=('ns-1',), counter=1, counter_all=count)}
+
+
+async def run_report(data, columnar):
+    k8s_config = ConfigK8sProcess()
+    k8s_config.EXPIRES_DAYS_WARNING = 20
+    k8s_config.backup_stats_columnar = columnar
+    queue = asyncio.Queue()
+    checker = VeleroChecker(debug_on=False, dispatcher_queue=queue, k8s_key_config=k8s_config)
+
+    start = time.perf_counter()
+    await checker._VeleroChecker__process_last_backup_report(data)
+    elapsed = time.perf_counter() - start
+    return elapsed, queue.get_nowait().message if not queue.empty() else ''
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the dict loop and the columnar backup statistics')
+    parser.add_argument('--backups', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    data = generate_backups(args.backups, args.seed)
+    loop_time, loop_message = asyncio.run(run_report(data, False))
+    columnar_time, columnar_message = asyncio.run(run_report(data, True))
+
+    print(f"INFO    [Bench] backups={args.backups} dict loop={loop_time:.3f}s columnar={columnar_time:.3f}s "
+          f"speed-up={loop_time / columnar_time:.1f}x same report={loop_message == columnar_message}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SRC_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def profile_imports(module):
+    """
+    Import a module in a new interpreter with -X importtime
+    @return: total microseconds, dict module -> (self us, cumulative us)
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=SRC_FOLDER, capture_output=True, text=True, check=True)
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules.get(module, (0, 0))[1], modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import time profile of the watchdog (python -X importtime)')
+    parser.add_argument('--module', default='main', help='module to import (from the src folder)')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help='modules listed by cumulative time')
+    parser.add_argument('--json', default=None, help='write the results to a JSON file (to track the changes)')
+    args = parser.parse_args()
+
+    totals = []
+    cumulative = {}
+    for _ in range(args.runs):
+        total, modules = profile_imports(args.module)
+        totals.append(total)
+        for name, (_, cumulative_us) in modules.items():
+            cumulative.setdefault(name, []).append(cumulative_us)
+
+    medians = {name: statistics.median(values) for name, values in cumulative.items()}
+    print(f"INFO    [BenchStartup] import {args.module}: runs={args.runs} "
+          f"median={statistics.median(totals) / 1000:.1f} ms min={min(totals) / 1000:.1f} ms")
+    for name, value in sorted(medians.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"INFO    [BenchStartup] {value / 1000:8.1f} ms  {name}")
+
+    heavy = [name for name in ('kubernetes', 'requests', 'smtplib', 'numpy', 'sqlite3') if name in cumulative]
+    print(f"INFO    [BenchStartup] heavy modules imported at startup: {', '.join(heavy) or 'none'}")
+
+    if args.json is not None:
+        with open(args.json, 'w') as file:
+            json.dump({'module': args.module,
+                       'runs': args.runs,
+                       'median_ms': statistics.median(totals) / 1000,
+                       'modules_ms': {name: value / 1000 for name, value in medians.items()}}, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+import random
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+
+
+class FakeClusterState:
+    """
+    In-memory cluster generated from fixtures: namespaces, velero schedules, backups and their
+    volume backups (PodVolumeBackups or DataUploads), coordination leases of the watchdog replicas.
+    Every change bumps a global resource version and is appended to a bounded event log
+    that feeds the watch streams
+    """
+
+    def __init__(self,
+                 namespaces=100,
+                 schedules=20,
+                 backups_per_schedule=10,
+                 unscheduled_backups=5,
+                 unscheduled_ratio=0.1,
+                 volumes_per_backup=0,
+                 velero_namespace='velero',
+                 event_history=10000,
+                 seed=None):
+        self.random = random.Random(seed)
+        self.lock = threading.Condition()
+        self.velero_namespace = velero_namespace
+        self.volumes_per_backup = volumes_per_backup
+
+        self.resource_version = 1
+        self.events = deque(maxlen=event_history)
+
+        # kind -> OrderedDict(name -> object)
+        self.objects = {'namespaces': OrderedDict(),
+                        'schedules': OrderedDict(),
+                        'backups': OrderedDict(),
+                        'podvolumebackups': OrderedDict(),
+                        'datauploads': OrderedDict(),
+                        'leases': OrderedDict()}
+
+        self.backup_counter = 0
+        self.__generate__(namespaces, schedules, backups_per_schedule, unscheduled_backups, unscheduled_ratio)
+
+    @staticmethod
+    def __format_time__(value: datetime):
+        return value.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    def __next_rv__(self):
+        self.resource_version += 1
+        return str(self.resource_version)
+
+    def __metadata__(self, name, namespace=None, labels=None):
+        metadata = {'name': name,
+                    'uid': f"{name}-{self.random.getrandbits(32):08x}",
+                    'resourceVersion': self.__next_rv__(),
+                    'creationTimestamp': self.__format_time__(datetime.utcnow()),
+                    'labels': labels or {}}
+        if namespace is not None:
+            metadata['namespace'] = namespace
+        return metadata
+
+    def __generate__(self, namespaces, schedules, backups_per_schedule, unscheduled_backups, unscheduled_ratio):
+        ns_names = [self.velero_namespace] + [f"ns-{index:05d}" for index in range(namespaces)]
+        for name in ns_names:
+            self.objects['namespaces'][name] = {'apiVersion': 'v1',
+                                                'kind': 'Namespace',
+                                                'metadata': self.__metadata__(name),
+                                                'status': {'phase': 'Active'}}
+
+        # part of the namespaces stays without any schedule
+        covered = ns_names[1:][:max(0, int(namespaces * (1 - unscheduled_ratio)))]
+        for index in range(schedules):
+            schedule_name = f"schedule-{index:04d}"
+            included = covered[index::schedules] if schedules > 0 else []
+            self.objects['schedules'][schedule_name] = self.__new_schedule__(schedule_name, included)
+            for _ in range(backups_per_schedule):
+                self.__add_backup__(schedule_name, included, phase='Completed')
+
+        for _ in range(unscheduled_backups):
+            self.__add_backup__(None, [self.random.choice(ns_names)], phase='Completed')
+
+    def __new_schedule__(self, name, included_namespaces):
+        return {'apiVersion': 'velero.io/v1',
+                'kind': 'Schedule',
+                'metadata': self.__metadata__(name, self.velero_namespace),
+                'spec': {'schedule': f"{self.random.randint(0, 59)} {self.random.randint(0, 23)} * * *",
+                         'template': {'includedNamespaces': list(included_namespaces),
+                                      'defaultVolumesToFsBackup': self.random.random() < 0.5,
+                                      'ttl': '720h0m0s'}},
+                'status': {'phase': 'Enabled'}}
+
+    def __add_backup__(self, schedule_name, included_namespaces, phase):
+        self.backup_counter += 1
+        now = datetime.utcnow()
+        prefix = schedule_name if schedule_name is not None else 'manual'
+        name = f"{prefix}-{now.strftime('%Y%m%d%H%M%S')}{self.backup_counter:07d}"
+
+        labels = {'velero.io/storage-location': 'default'}
+        if schedule_name is not None:
+            labels['velero.io/schedule-name'] = schedule_name
+
+        total_items = self.random.randint(10, 5000)
+        status = {'phase': phase,
+                  'version': 1,
+                  'startTimestamp': self.__format_time__(now - timedelta(minutes=self.random.randint(1, 60))),
+                  'expiration': self.__format_time__(now + timedelta(days=self.random.randint(1, 30))),
+                  'progress': {'totalItems': total_items,
+                               'itemsBackedUp': total_items if phase != 'InProgress' else 0}}
+        if phase != 'InProgress':
+            status['completionTimestamp'] = self.__format_time__(now)
+
+        backup = {'apiVersion': 'velero.io/v1',
+                  'kind': 'Backup',
+                  'metadata': self.__metadata__(name, self.velero_namespace, labels),
+                  'spec': {'includedNamespaces': list(included_namespaces)},
+                  'status': status}
+        self.objects['backups'][name] = backup
+        self.events.append((self.resource_version, 'backups', 'ADDED', backup))
+        for index in range(self.volumes_per_backup):
+            self.__add_volume__(name, index, included_namespaces[0] if included_namespaces else 'default', phase)
+        return backup
+
+    def __add_volume__(self, backup_name, index, namespace, backup_phase):
+        """
+        File system backups use a PodVolumeBackup, the others a DataUpload (data mover)
+        """
+        phase = backup_phase
+        if backup_phase in ('PartiallyFailed', 'Failed'):
+            phase = self.random.choice(['Completed', 'Failed'])
+        total_bytes = self.random.randint(1, 10) * 1024 * 1024 * 1024
+        now = datetime.utcnow()
+        status = {'phase': phase,
+                  'startTimestamp': self.__format_time__(now - timedelta(minutes=self.random.randint(1, 30))),
+                  'progress': {'totalBytes': total_bytes,
+                               'bytesDone': total_bytes if phase == 'Completed' else total_bytes // 2}}
+        if phase != 'InProgress':
+            status['completionTimestamp'] = self.__format_time__(now)
+
+        labels = {'velero.io/backup-name': backup_name}
+        if index % 2 == 0:
+            kind = 'podvolumebackups'
+            item = {'apiVersion': 'velero.io/v1',
+                    'kind': 'PodVolumeBackup',
+                    'metadata': self.__metadata__(f"{backup_name}-{index}", self.velero_namespace, labels),
+                    'spec': {'pod': {'kind': 'Pod', 'namespace': namespace, 'name': f"pod-{index}"},
+                             'volume': f"data-{index}"},
+                    'status': status}
+        else:
+            kind = 'datauploads'
+            item = {'apiVersion': 'velero.io/v2alpha1',
+                    'kind': 'DataUpload',
+                    'metadata': self.__metadata__(f"{backup_name}-{index}", self.velero_namespace, labels),
+                    'spec': {'sourceNamespace': namespace, 'sourcePVC': f"pvc-{index}"},
+                    'status': status}
+        self.objects[kind][item['metadata']['name']] = item
+
+    def __complete_volumes__(self, backup_name, backup_phase):
+        for kind in ('podvolumebackups', 'datauploads'):
+            for index in range(self.volumes_per_backup):
+                item = self.objects[kind].get(f"{backup_name}-{index}")
+                if item is None:
+                    continue
+                phase = 'Completed' if backup_phase == 'Completed' else self.random.choice(['Completed', 'Failed'])
+                item['status']['phase'] = phase
+                item['status']['completionTimestamp'] = self.__format_time__(datetime.utcnow())
+                if phase == 'Completed':
+                    item['status']['progress']['bytesDone'] = item['status']['progress']['totalBytes']
+
+    def __delete_volumes__(self, backup_name):
+        for kind in ('podvolumebackups', 'datauploads'):
+            for index in range(self.volumes_per_backup):
+                self.objects[kind].pop(f"{backup_name}-{index}", None)
+
+    def mutate(self):
+        """
+        Apply one random change: start a backup, complete or fail one in progress, delete the oldest one
+        """
+        with self.lock:
+            backups = self.objects['backups']
+            in_progress = [name for name, item in backups.items() if item['status']['phase'] == 'InProgress']
+            choice = self.random.random()
+
+            if in_progress and choice < 0.5:
+                backup = backups[self.random.choice(in_progress)]
+                backup['status']['phase'] = self.random.choices(['Completed', 'PartiallyFailed', 'Failed'],
+                                                                weights=[90, 7, 3])[0]
+                backup['status']['completionTimestamp'] = self.__format_time__(datetime.utcnow())
+                backup['status']['progress']['itemsBackedUp'] = backup['status']['progress']['totalItems']
+                if backup['status']['phase'] != 'Completed':
+                    backup['status']['errors'] = self.random.randint(1, 10)
+                backup['metadata']['resourceVersion'] = self.__next_rv__()
+                self.events.append((self.resource_version, 'backups', 'MODIFIED', backup))
+                self.__complete_volumes__(backup['metadata']['name'], backup['status']['phase'])
+            elif choice < 0.9 or len(backups) == 0:
+                schedules = list(self.objects['schedules'].values())
+                if len(schedules) > 0:
+                    schedule = self.random.choice(schedules)
+                    self.__add_backup__(schedule['metadata']['name'],
+                                        schedule['spec']['template']['includedNamespaces'],
+                                        phase='InProgress')
+            else:
+                name, backup = backups.popitem(last=False)
+                self.__delete_volumes__(name)
+                backup['metadata']['resourceVersion'] = self.__next_rv__()
+                self.events.append((self.resource_version, 'backups', 'DELETED', backup))
+
+            self.lock.notify_all()
+
+    def oldest_event_rv(self):
+        with self.lock:
+            if len(self.events) == 0:
+                return self.resource_version
+            return self.events[0][0]
+
+    def list(self, kind, start=0, limit=None):
+        """
+        Return a page of objects of a kind
+        @param kind: plural name (namespaces, schedules, backups, podvolumebackups, datauploads)
+        @param start: offset of the first item
+        @param limit: max number of items (None means all)
+        @return: items, next offset (None when the list is complete), resource version
+        """
+        with self.lock:
+            values = list(self.objects[kind].values())
+            end = len(values) if limit is None else min(len(values), start + limit)
+            next_start = end if end < len(values) else None
+            return values[start:end], next_start, str(self.resource_version)
+
+    def get_lease(self, name):
+        with self.lock:
+            return self.objects['leases'].get(name)
+
+    def list_leases(self, labels=None):
+        """
+        @param labels: dict of the labels to match (equality selector)
+        """
+        with self.lock:
+            return [lease for lease in self.objects['leases'].values()
+                    if all(lease['metadata'].get('labels', {}).get(key) == value
+                           for key, value in (labels or {}).items())], str(self.resource_version)
+
+    def write_lease(self, name, lease, create):
+        """
+        Create or replace a lease, with the optimistic concurrency of the api server
+        @return: http code, stored lease
+        """
+        with self.lock:
+            current = self.objects['leases'].get(name)
+            if create and current is not None:
+                return 409, current
+            if not create:
+                if current is None:
+                    return 404, None
+                resource_version = (lease.get('metadata') or {}).get('resourceVersion')
+                if resource_version and resource_version != current['metadata']['resourceVersion']:
+                    return 409, current
+            metadata = dict(lease.get('metadata') or {})
+            metadata['name'] = name
+            metadata['resourceVersion'] = self.__next_rv__()
+            stored = dict(lease, metadata=metadata)
+            self.objects['leases'][name] = stored
+            return (201 if create else 200), stored
+
+    def delete_lease(self, name):
+        with self.lock:
+            return self.objects['leases'].pop(name, None)
+
+    def events_after(self, kind, resource_version):
+        with self.lock:
+            return [(event_type, obj) for rv, event_kind, event_type, obj in self.events
+                    if rv > resource_version and event_kind == kind]
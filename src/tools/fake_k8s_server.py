@@ -0,0 +1,423 @@
+import argparse
+import base64
+import gzip
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from tools.fake_k8s_fixtures import FakeClusterState
+
+# responses compressed by the api server when the client accepts gzip
+GZIP_MIN_BYTES = 128 * 1024
+
+class FaultInjector:
+    """
+    Define latency and error injection for the fake api server
+    """
+
+    def __init__(self,
+                 latency_ms=0,
+                 latency_jitter_ms=0,
+                 error_410_rate=0.0,
+                 error_429_rate=0.0,
+                 error_5xx_rate=0.0,
+                 retry_after_sec=1,
+                 max_page_size=0):
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.error_410_rate = error_410_rate
+        self.error_429_rate = error_429_rate
+        self.error_5xx_rate = error_5xx_rate
+        self.retry_after_sec = retry_after_sec
+        self.max_page_size = max_page_size
+        self.random = random.Random()
+
+    def delay(self):
+        if self.latency_ms > 0 or self.latency_jitter_ms > 0:
+            time.sleep(max(0.0, self.latency_ms + self.random.uniform(0, self.latency_jitter_ms)) / 1000)
+
+    def pick_error(self, continue_request=False):
+        """
+        Return the http code of the error to inject or None
+        """
+        value = self.random.random()
+        if value < self.error_429_rate:
+            return 429
+        value -= self.error_429_rate
+        if value < self.error_5xx_rate:
+            return self.random.choice([500, 503, 504])
+        value -= self.error_5xx_rate
+        if continue_request and value < self.error_410_rate:
+            return 410
+        return None
+
+
+class FakeApiRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serve the subset of the Kubernetes API used by the watchdog
+    """
+    protocol_version = 'HTTP/1.1'
+
+    routes = [
+        (re.compile(r'^/api/v1/namespaces$'), 'namespaces'),
+        (re.compile(r'^/apis/velero\.io/v1/namespaces/(?P<namespace>[^/]+)/'
+                    r'(?P<plural>schedules|backups|podvolumebackups)$'), None),
+        (re.compile(r'^/apis/velero\.io/v2alpha1/namespaces/(?P<namespace>[^/]+)/(?P<plural>datauploads)$'), None),
+    ]
+
+    lease_route = re.compile(r'^/apis/coordination\.k8s\.io/v1/namespaces/(?P<namespace>[^/]+)/leases'
+                             r'(?:/(?P<name>[^/]+))?$')
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+    def __send_json__(self, code, body, headers=None):
+        payload = json.dumps(body).encode('utf-8')
+        gzip_payload = (len(payload) >= GZIP_MIN_BYTES
+                        and 'gzip' in self.headers.get('Accept-Encoding', ''))
+        if gzip_payload:
+            # the real api server compresses the large responses (APIResponseCompression)
+            payload = gzip.compress(payload, compresslevel=1)
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        if gzip_payload:
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def __send_status__(self, code, reason, message, headers=None):
+        self.__send_json__(code, {'kind': 'Status',
+                                  'apiVersion': 'v1',
+                                  'status': 'Failure',
+                                  'message': message,
+                                  'reason': reason,
+                                  'code': code}, headers)
+
+    def __resolve_kind__(self, path):
+        for regex, kind in self.routes:
+            match = regex.match(path)
+            if match:
+                return kind or match.group('plural')
+        return None
+
+    @staticmethod
+    def __encode_continue__(resource_version, start):
+        raw = json.dumps({'rv': int(resource_version), 'start': start}).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii')
+
+    @staticmethod
+    def __decode_continue__(token):
+        return json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+
+    def __read_body__(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def __lease__(self, method, match, query):
+        """
+        Leases of the watchdog replicas: get, list (equality label selector), create, replace, delete
+        """
+        state = self.server.state
+        name = match.group('name')
+        if name is None:
+            if method == 'GET':
+                labels = dict(term.split('=', 1) for term in query.get('labelSelector', '').split(',') if '=' in term)
+                items, resource_version = state.list_leases(labels)
+                self.__send_json__(200, {'apiVersion': 'coordination.k8s.io/v1',
+                                         'kind': 'LeaseList',
+                                         'metadata': {'resourceVersion': resource_version},
+                                         'items': items})
+                return
+            if method == 'POST':
+                body = self.__read_body__()
+                name = (body.get('metadata') or {}).get('name')
+                code, lease = state.write_lease(name, body, create=True)
+                if code == 409:
+                    self.__send_status__(409, 'AlreadyExists', f"leases \"{name}\" already exists")
+                else:
+                    self.__send_json__(code, lease)
+                return
+        elif method == 'GET':
+            lease = state.get_lease(name)
+            if lease is None:
+                self.__send_status__(404, 'NotFound', f"leases \"{name}\" not found")
+            else:
+                self.__send_json__(200, lease)
+            return
+        elif method == 'PUT':
+            code, lease = state.write_lease(name, self.__read_body__(), create=False)
+            if code == 404:
+                self.__send_status__(404, 'NotFound', f"leases \"{name}\" not found")
+            elif code == 409:
+                self.__send_status__(409, 'Conflict', f"the object has been modified; please apply your changes "
+                                                      f"to the latest version and try again")
+            else:
+                self.__send_json__(code, lease)
+            return
+        elif method == 'DELETE':
+            if state.delete_lease(name) is None:
+                self.__send_status__(404, 'NotFound', f"leases \"{name}\" not found")
+            else:
+                self.__send_json__(200, {'kind': 'Status', 'apiVersion': 'v1', 'status': 'Success'})
+            return
+        self.__send_status__(405, 'MethodNotAllowed', f"method {method} not allowed")
+
+    def __mutate__(self, method):
+        url = urlparse(self.path)
+        match = self.lease_route.match(url.path)
+        if match is None:
+            self.__send_status__(405, 'MethodNotAllowed', f"method {method} not allowed")
+            return
+        self.__lease__(method, match, {key: values[0] for key, values in parse_qs(url.query).items()})
+
+    def do_POST(self):
+        self.__mutate__('POST')
+
+    def do_PUT(self):
+        self.__mutate__('PUT')
+
+    def do_DELETE(self):
+        self.__mutate__('DELETE')
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        match = self.lease_route.match(url.path)
+        if match is not None:
+            self.__lease__('GET', match, query)
+            return
+        kind = self.__resolve_kind__(url.path)
+        if kind is None:
+            self.__send_status__(404, 'NotFound', f"the server could not find the requested resource {url.path}")
+            return
+
+        faults = self.server.faults
+        state = self.server.state
+        faults.delay()
+
+        continue_token = query.get('continue')
+        error = faults.pick_error(continue_request=continue_token is not None)
+        if error == 429:
+            self.__send_status__(429, 'TooManyRequests', 'too many requests, please try again later',
+                                 {'Retry-After': str(faults.retry_after_sec)})
+            return
+        if error is not None and error >= 500:
+            self.__send_status__(error, 'InternalError', 'injected server error')
+            return
+
+        if query.get('watch', '').lower() in ('true', '1'):
+            self.__watch__(kind, query)
+            return
+
+        start = 0
+        if continue_token:
+            token = self.__decode_continue__(continue_token)
+            if error == 410 or token['rv'] < state.oldest_event_rv():
+                self.__send_status__(410, 'Expired', 'The provided continue parameter is too old')
+                return
+            start = token['start']
+
+        limit = int(query['limit']) if query.get('limit') else None
+        if faults.max_page_size > 0:
+            limit = min(limit or faults.max_page_size, faults.max_page_size)
+
+        items, next_start, resource_version = state.list(kind, start, limit)
+        metadata = {'resourceVersion': resource_version}
+        if next_start is not None:
+            metadata['continue'] = self.__encode_continue__(resource_version, next_start)
+
+        list_kind = 'NamespaceList' if kind == 'namespaces' else f"{kind[:-1].capitalize()}List"
+        self.__send_json__(200, {'apiVersion': 'v1' if kind == 'namespaces' else 'velero.io/v1',
+                                 'kind': list_kind,
+                                 'metadata': metadata,
+                                 'items': items})
+
+    def __write_chunk__(self, obj):
+        data = json.dumps(obj).encode('utf-8') + b'\n'
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b'\r\n')
+        self.wfile.flush()
+
+    def __watch__(self, kind, query):
+        state = self.server.state
+        timeout = int(query.get('timeoutSeconds', 30))
+        resource_version = int(query.get('resourceVersion') or state.resource_version)
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        try:
+            if resource_version < state.oldest_event_rv() - 1:
+                self.__write_chunk__({'type': 'ERROR',
+                                      'object': {'kind': 'Status', 'apiVersion': 'v1', 'status': 'Failure',
+                                                 'message': f"too old resource version: {resource_version}",
+                                                 'reason': 'Expired', 'code': 410}})
+            else:
+                deadline = time.monotonic() + timeout
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    with state.lock:
+                        events = state.events_after(kind, resource_version)
+                        if not events:
+                            state.lock.wait(timeout=min(remaining, 1))
+                            continue
+                        resource_version = state.resource_version
+                    for event_type, obj in events:
+                        self.__write_chunk__({'type': event_type, 'object': obj})
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class FakeApiServer:
+    """
+    Fake Kubernetes api server with generated Velero fixtures
+    """
+
+    def __init__(self,
+                 state: FakeClusterState,
+                 faults: FaultInjector = None,
+                 host='127.0.0.1',
+                 port=8001,
+                 mutations_per_sec=0.0,
+                 verbose=False):
+        self.state = state
+        self.faults = faults if faults is not None else FaultInjector()
+        self.mutations_per_sec = mutations_per_sec
+
+        self.httpd = ThreadingHTTPServer((host, port), FakeApiRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.state = self.state
+        self.httpd.faults = self.faults
+        self.httpd.verbose = verbose
+
+        self.stop_event = threading.Event()
+        self.threads = []
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __mutation_loop__(self):
+        while not self.stop_event.wait(1 / self.mutations_per_sec):
+            self.state.mutate()
+
+    def start(self):
+        """
+        Start the server (and the mutation generator) in background threads
+        """
+        self.threads.append(threading.Thread(target=self.httpd.serve_forever, daemon=True))
+        if self.mutations_per_sec > 0:
+            self.threads.append(threading.Thread(target=self.__mutation_loop__, daemon=True))
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def write_kubeconfig(self, path):
+        """
+        Write a kubeconfig file pointing to the fake server
+        @param path: destination file
+        """
+        content = (f"apiVersion: v1\n"
+                   f"kind: Config\n"
+                   f"clusters:\n"
+                   f"- name: fake\n"
+                   f"  cluster:\n"
+                   f"    server: {self.url}\n"
+                   f"users:\n"
+                   f"- name: fake\n"
+                   f"  user:\n"
+                   f"    token: fake-token\n"
+                   f"contexts:\n"
+                   f"- name: fake\n"
+                   f"  context:\n"
+                   f"    cluster: fake\n"
+                   f"    user: fake\n"
+                   f"current-context: fake\n")
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        with open(path, 'w') as file:
+            file.write(content)
+        return path
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description='Fake Kubernetes api server serving generated Velero fixtures')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--kubeconfig', default='./fake-kubeconfig', help='kubeconfig file to write')
+    parser.add_argument('--namespaces', type=int, default=100)
+    parser.add_argument('--schedules', type=int, default=20)
+    parser.add_argument('--backups-per-schedule', type=int, default=10)
+    parser.add_argument('--unscheduled-backups', type=int, default=5)
+    parser.add_argument('--unscheduled-ratio', type=float, default=0.1)
+    parser.add_argument('--volumes-per-backup', type=int, default=0, help='PodVolumeBackups and DataUploads')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--mutations-per-sec', type=float, default=0.0)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--latency-jitter-ms', type=float, default=0)
+    parser.add_argument('--error-410-rate', type=float, default=0.0, help='rate of 410 on continue requests')
+    parser.add_argument('--error-429-rate', type=float, default=0.0)
+    parser.add_argument('--error-5xx-rate', type=float, default=0.0)
+    parser.add_argument('--retry-after-sec', type=int, default=1)
+    parser.add_argument('--max-page-size', type=int, default=0, help='force paging (0 honors only limit)')
+    parser.add_argument('--verbose', action='store_true')
+    return parser
+
+
+def main():
+    args = build_arg_parser().parse_args()
+
+    print(f"INFO    [FakeApi] generate fixtures: namespaces={args.namespaces} schedules={args.schedules} "
+          f"backups per schedule={args.backups_per_schedule}")
+    state = FakeClusterState(namespaces=args.namespaces,
+                             schedules=args.schedules,
+                             backups_per_schedule=args.backups_per_schedule,
+                             unscheduled_backups=args.unscheduled_backups,
+                             unscheduled_ratio=args.unscheduled_ratio,
+                             volumes_per_backup=args.volumes_per_backup,
+                             seed=args.seed)
+    faults = FaultInjector(latency_ms=args.latency_ms,
+                           latency_jitter_ms=args.latency_jitter_ms,
+                           error_410_rate=args.error_410_rate,
+                           error_429_rate=args.error_429_rate,
+                           error_5xx_rate=args.error_5xx_rate,
+                           retry_after_sec=args.retry_after_sec,
+                           max_page_size=args.max_page_size)
+    server = FakeApiServer(state,
+                           faults,
+                           host=args.host,
+                           port=args.port,
+                           mutations_per_sec=args.mutations_per_sec,
+                           verbose=args.verbose).start()
+    server.write_kubeconfig(args.kubeconfig)
+    print(f"INFO    [FakeApi] listening on {server.url} kubeconfig={args.kubeconfig}")
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print("INFO    [FakeApi] stop")
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import argparse
+import os
+import tempfile
+import time
+
+from tools.fake_k8s_fixtures import FakeClusterState
+from tools.fake_k8s_server import FakeApiServer, FaultInjector, build_arg_parser
+from utils.config import ConfigK8sProcess
+
+
+def run_cycles(k8s_config: ConfigK8sProcess, cycles):
+    """
+    Run the collection cycles of the watchdog and return the elapsed time of every cycle
+    """
+    # imported here: the kubernetes client must read the kubeconfig written by the fake server
+    from libs.velero_status import VeleroStatus
+
+    velero_stat = VeleroStatus(k8s_config, False, None, None)
+    timings = []
+    for _ in range(cycles):
+        start = time.perf_counter()
+        schedules = velero_stat.get_k8s_velero_schedules()
+        backups = velero_stat.get_k8s_last_backup_status()
+        timings.append(time.perf_counter() - start)
+        if 'error' in schedules or 'error' in backups:
+            print(f"ERROR   [LoadTest] cycle in error schedules={schedules.get('error')} "
+                  f"backups={backups.get('error')}")
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(parents=[build_arg_parser()], add_help=False,
+                                     description='Run watchdog collection cycles against the fake api server')
+    parser.add_argument('--cycles', type=int, default=5)
+    args = parser.parse_args()
+
+    state = FakeClusterState(namespaces=args.namespaces,
+                             schedules=args.schedules,
+                             backups_per_schedule=args.backups_per_schedule,
+                             unscheduled_backups=args.unscheduled_backups,
+                             unscheduled_ratio=args.unscheduled_ratio,
+                             volumes_per_backup=args.volumes_per_backup,
+                             seed=args.seed)
+    faults = FaultInjector(latency_ms=args.latency_ms,
+                           latency_jitter_ms=args.latency_jitter_ms,
+                           error_410_rate=args.error_410_rate,
+                           error_429_rate=args.error_429_rate,
+                           error_5xx_rate=args.error_5xx_rate,
+                           retry_after_sec=args.retry_after_sec,
+                           max_page_size=args.max_page_size)
+    server = FakeApiServer(state,
+                           faults,
+                           host=args.host,
+                           port=args.port,
+                           mutations_per_sec=args.mutations_per_sec,
+                           verbose=args.verbose).start()
+
+    kubeconfig = os.path.join(tempfile.mkdtemp(), 'kubeconfig')
+    server.write_kubeconfig(kubeconfig)
+
+    k8s_config = ConfigK8sProcess()
+    k8s_config.k8s_in_cluster_mode = False
+    k8s_config.k8s_config_file = kubeconfig
+    k8s_config.EXPIRES_DAYS_WARNING = 29
+    k8s_config.volume_stats_enable = args.volumes_per_backup > 0
+
+    try:
+        timings = run_cycles(k8s_config, args.cycles)
+    finally:
+        server.stop()
+
+    timings.sort()
+    print(f"INFO    [LoadTest] backups={len(state.objects['backups'])} "
+          f"namespaces={len(state.objects['namespaces'])} cycles={len(timings)}")
+    print(f"INFO    [LoadTest] cycle seconds min={timings[0]:.3f} "
+          f"median={timings[len(timings) // 2]:.3f} max={timings[-1]:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import argparse
+import os
+import tempfile
+
+from tools.fake_k8s_fixtures import FakeClusterState
+from tools.fake_k8s_server import FakeApiServer
+from utils.config import ConfigK8sProcess, ConfigShard
+
+
+def ownership(coordinators, keys):
+    """
+    @return: key -> identities of the replicas that own the key
+    """
+    return {key: [coordinator.identity for coordinator in coordinators if coordinator.owns(key)] for key in keys}
+
+
+def sync_all(coordinators, rounds=2):
+    # the second round sees the leases written by the replicas synchronized after
+    for _ in range(rounds):
+        for coordinator in coordinators:
+            coordinator.sync()
+
+
+def check(step, coordinators, keys, previous=None):
+    owners = ownership(coordinators, keys)
+    not_owned = sum(1 for identities in owners.values() if len(identities) == 0)
+    duplicated = sum(1 for identities in owners.values() if len(identities) > 1)
+    moved = 0
+    if previous is not None:
+        moved = sum(1 for key in keys if owners[key] != previous[key])
+    loads = sorted(sum(1 for identities in owners.values() if coordinator.identity in identities)
+                   for coordinator in coordinators)
+    print(f"INFO    [ShardChurn] {step}: replicas={len(coordinators)} keys={len(keys)} "
+          f"moved={moved} ({moved / len(keys):.1%}) not owned={not_owned} duplicated={duplicated} "
+          f"load min={loads[0]} max={loads[-1]}")
+    return owners
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the schedules moved between the watchdog replicas '
+                                                 'when a replica leaves or joins (fake api server)')
+    parser.add_argument('--replicas', type=int, default=3)
+    parser.add_argument('--schedules', type=int, default=1000)
+    parser.add_argument('--vnodes', type=int, default=64)
+    parser.add_argument('--port', type=int, default=8001)
+    args = parser.parse_args()
+
+    state = FakeClusterState(namespaces=1, schedules=0, backups_per_schedule=0, unscheduled_backups=0)
+    server = FakeApiServer(state, port=args.port).start()
+    kubeconfig = os.path.join(tempfile.mkdtemp(), 'kubeconfig')
+    server.write_kubeconfig(kubeconfig)
+
+    k8s_config = ConfigK8sProcess()
+    k8s_config.k8s_in_cluster_mode = False
+    k8s_config.k8s_config_file = kubeconfig
+
+    # imported here: the kubernetes client must read the kubeconfig written by the fake server
+    from libs.shard_coordinator import ShardCoordinator, CLUSTER_SHARD_KEY
+
+    def new_coordinator(index):
+        shard_config = ConfigShard()
+        shard_config.enable = True
+        shard_config.identity = f"watchdog-{index}"
+        shard_config.namespace = 'velero'
+        shard_config.vnodes = args.vnodes
+        return ShardCoordinator(debug_on=False, shard_config=shard_config, k8s_key_config=k8s_config)
+
+    keys = [f"schedule-{index}" for index in range(args.schedules)] + [CLUSTER_SHARD_KEY]
+    try:
+        coordinators = [new_coordinator(index) for index in range(args.replicas)]
+        sync_all(coordinators)
+        owners = check('start', coordinators, keys)
+
+        leaving = coordinators.pop()
+        leaving.release()
+        sync_all(coordinators)
+        owners = check(f"{leaving.identity} left", coordinators, keys, owners)
+
+        coordinators.append(new_coordinator(args.replicas))
+        sync_all(coordinators)
+        check(f"{coordinators[-1].identity} joined", coordinators, keys, owners)
+        print(f"INFO    [ShardChurn] ideal moved on leave/join={1 / args.replicas:.1%}")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
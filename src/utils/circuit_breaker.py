@@ -0,0 +1,108 @@
+import random
+import time
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for the calls of one resource kind.
+    CLOSED: calls are allowed. OPEN: calls are skipped until the backoff expires.
+    HALF_OPEN: one probe call is allowed, its result closes or re-opens the circuit.
+    The read timeout follows the observed latency (smoothed value + 4 * deviation, as TCP RTO)
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self,
+                 name,
+                 failure_threshold=2,
+                 backoff_seconds=30,
+                 max_backoff_seconds=1800,
+                 min_timeout=5,
+                 max_timeout=120,
+                 connect_timeout=10):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.connect_timeout = connect_timeout
+
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened = 0
+        self.open_until = 0.0
+        self.last_error = None
+
+        self.latency_avg = None
+        self.latency_dev = 0.0
+
+        self.random = random.Random()
+
+    def allow_request(self):
+        """
+        Check if a call can be issued now
+        """
+        if self.state == self.OPEN:
+            if time.monotonic() < self.open_until:
+                return False
+            # backoff expired: let one probe pass
+            self.state = self.HALF_OPEN
+            return True
+        return True
+
+    def remaining_seconds(self):
+        return max(0, int(self.open_until - time.monotonic()))
+
+    def request_timeout(self):
+        """
+        Return the (connect, read) timeout for the next call
+        """
+        if self.latency_avg is None:
+            read_timeout = self.max_timeout
+        else:
+            read_timeout = self.latency_avg + 4 * self.latency_dev
+            read_timeout = min(self.max_timeout, max(self.min_timeout, read_timeout))
+        return self.connect_timeout, read_timeout
+
+    def __observe_latency__(self, seconds):
+        if self.latency_avg is None:
+            self.latency_avg = seconds
+            self.latency_dev = seconds / 2
+        else:
+            self.latency_dev = 0.75 * self.latency_dev + 0.25 * abs(self.latency_avg - seconds)
+            self.latency_avg = 0.875 * self.latency_avg + 0.125 * seconds
+
+    def record_success(self, latency_seconds=None):
+        if latency_seconds is not None:
+            self.__observe_latency__(latency_seconds)
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened = 0
+        self.last_error = None
+
+    def record_failure(self, error=None, retry_after=None, latency_seconds=None):
+        """
+        Register a failed call
+        @param error: description of the error
+        @param retry_after: seconds requested by the server (429 Retry-After), opens the circuit immediately
+        @param latency_seconds: elapsed time of the call
+        """
+        if latency_seconds is not None:
+            self.__observe_latency__(latency_seconds)
+        self.failures += 1
+        self.last_error = error
+
+        if retry_after is not None or self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.__open__(retry_after)
+
+    def __open__(self, retry_after=None):
+        # jittered exponential backoff, never shorter than the server request
+        backoff = min(self.max_backoff_seconds, self.backoff_seconds * (2 ** self.opened))
+        backoff = self.random.uniform(backoff / 2, backoff)
+        if retry_after is not None:
+            backoff = max(backoff, retry_after)
+        self.opened += 1
+        self.state = self.OPEN
+        self.open_until = time.monotonic() + backoff
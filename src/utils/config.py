@@ -1,24 +1,31 @@
 from dotenv import load_dotenv
 import os
+import socket
 from utils.handle_error import handle_exceptions_static_method, handle_exceptions_method
 
+SERVICE_ACCOUNT_NAMESPACE_FILE = '/var/run/secrets/kubernetes.io/serviceaccount/namespace'
+
 
 # class syntax
 class ConfigProgram:
-    def __init__(self, path_env=None, debug_on=True):
+    def __init__(self, path_env=None, debug_on=True, overrides: dict = None):
         self.debug_on = debug_on
+        # values of the mounted config (hot reload), they win over the environment
+        self.overrides = overrides or {}
         res = load_dotenv(dotenv_path=path_env)
         print(f"INFO    [Env] Load env={res}")
 
     @handle_exceptions_static_method
     def load_key(self, key, default, print_out: bool = True, mask_value: bool = False):
-        value = os.getenv(key)
+        value = self.overrides.get(key)
+        if value is None:
+            value = os.getenv(key)
         if value is None or \
                 len(value) == 0:
             value = default
 
         if print_out:
-            if mask_value and len(value) > 2:
+            if mask_value and value is not None and len(value) > 2:
                 index = int(len(value) / 2)
                 partial = '*' * index
                 if self.debug_on:
@@ -68,6 +75,33 @@ class ConfigProgram:
         return int(self.load_key('LOG_LEVEL',
                                  '20'))
 
+    @handle_exceptions_method
+    def logger_async_enable(self):
+        res = self.load_key('LOG_ASYNC', 'False')
+        return True if res.lower() == "true" or res.lower() == "1" else False
+
+    @handle_exceptions_method
+    def logger_compress_rotated(self):
+        res = self.load_key('LOG_COMPRESS_ROTATED', 'False')
+        return True if res.lower() == "true" or res.lower() == "1" else False
+
+    @handle_exceptions_method
+    def logger_json_format(self):
+        res = self.load_key('LOG_JSON', 'False')
+        return True if res.lower() == "true" or res.lower() == "1" else False
+
+    @handle_exceptions_method
+    def logger_sampling_seconds(self):
+        res = self.load_key('LOG_SAMPLING_SEC',
+                            '0')
+        return max(0, int(res))
+
+    @handle_exceptions_method
+    def logger_sampling_burst(self):
+        res = self.load_key('LOG_SAMPLING_BURST',
+                            '1')
+        return max(1, int(res))
+
     @handle_exceptions_method
     def process_run_sec(self):
         res = self.load_key('PROCESS_CYCLE_SEC',
@@ -125,6 +159,119 @@ class ConfigProgram:
 
         return n_hours
 
+    @handle_exceptions_method
+    def notification_dedup_seconds(self):
+        res = self.load_key('NOTIFICATION_DEDUP_SEC',
+                            '0')
+        return max(0, int(res))
+
+    @handle_exceptions_method
+    def notification_dedup_max_entries(self):
+        res = self.load_key('NOTIFICATION_DEDUP_MAX_ENTRIES',
+                            '256')
+        return max(1, int(res))
+
+    @handle_exceptions_method
+    def notification_digest_seconds(self):
+        res = self.load_key('NOTIFICATION_DIGEST_SEC',
+                            '0')
+        return max(0, int(res))
+
+    @handle_exceptions_method
+    def notification_digest_max_entries(self):
+        res = self.load_key('NOTIFICATION_DIGEST_MAX_ENTRIES',
+                            '500')
+        return max(1, int(res))
+
+    @handle_exceptions_method
+    def notification_delta_report(self):
+        res = self.load_key('NOTIFICATION_DELTA_REPORT', 'False')
+        return True if res.lower() == "true" or res.lower() == "1" else False
+
+    @handle_exceptions_method
+    def notification_full_report_hours(self):
+        res = self.load_key('NOTIFICATION_FULL_REPORT_HOURS',
+                            '24')
+        return max(0, int(res))
+
+    @handle_exceptions_method
+    def notification_queue_pressure(self):
+        res = self.load_key('NOTIFICATION_QUEUE_PRESSURE',
+                            '5')
+        return max(0, int(res))
+
+    @handle_exceptions_method
+    def notification_routes(self):
+        """
+        Route definitions NOTIFICATION_ROUTE_1..9, read until the first missing
+        """
+        routes = []
+        for i in range(1, 10):
+            res = self.load_key(f'NOTIFICATION_ROUTE_{i}', '', mask_value=True)
+            if not isinstance(res, str) or len(res) == 0:
+                break
+            routes.append(res)
+        return routes
+
+    @handle_exceptions_method
+    def status_api_enable(self):
+        res = self.load_key('HTTP_API_ENABLE', 'False')
+        return True if res.lower() == "true" or res.lower() == "1" else False
+
+    @handle_exceptions_method
+    def status_api_host(self):
+        return self.load_key('HTTP_API_HOST', '0.0.0.0')
+
+    @handle_exceptions_method
+    def status_api_port(self):
+        res = self.load_key('HTTP_API_PORT',
+                            '8080')
+        return int(res)
+
+    @handle_exceptions_method
+    def status_api_sse_queue_size(self):
+        res = self.load_key('HTTP_API_SSE_QUEUE_SIZE',
+                            '100')
+        return max(1, int(res))
+
+    @handle_exceptions_method
+    def status_api_sse_max_clients(self):
+        res = self.load_key('HTTP_API_SSE_MAX_CLIENTS',
+                            '100')
+        return max(1, int(res))
+
+    @handle_exceptions_method
+    def shard_enable(self):
+        res = self.load_key('SHARD_ENABLE', 'False')
+        return True if res.lower() == "true" or res.lower() == "1" else False
+
+    @handle_exceptions_method
+    def shard_identity(self):
+        # the pod name given by the downward api, or the host name (the pod name in k8s)
+        return self.load_key('SHARD_IDENTITY', os.getenv('POD_NAME') or socket.gethostname())
+
+    @handle_exceptions_method
+    def shard_namespace(self):
+        default = os.getenv('POD_NAMESPACE')
+        if default is None or len(default) == 0:
+            default = 'default'
+            if os.path.isfile(SERVICE_ACCOUNT_NAMESPACE_FILE):
+                with open(SERVICE_ACCOUNT_NAMESPACE_FILE) as file:
+                    default = file.read().strip() or default
+        return self.load_key('SHARD_NAMESPACE', default)
+
+    @handle_exceptions_method
+    def shard_lease_duration_sec(self):
+        res = self.load_key('SHARD_LEASE_DURATION_SEC',
+                            '30')
+        return max(5, int(res))
+
+    @handle_exceptions_method
+    def shard_renew_sec(self):
+        res = self.load_key('SHARD_RENEW_SEC',
+                            '10')
+        return max(1, int(res))
+
     @handle_exceptions_method
     def email_enable(self):
         res = self.load_key('EMAIL_ENABLE', 'False')
@@ -190,6 +337,166 @@ class ConfigProgram:
             res = '20'
         return int(res)
 
+    @handle_exceptions_method
+    def k8s_breaker_failures(self):
+        res = self.load_key('K8S_BREAKER_FAILURES',
+                            '2')
+        return max(1, int(res))
+
+    @handle_exceptions_method
+    def k8s_breaker_backoff_sec(self):
+        res = self.load_key('K8S_BREAKER_BACKOFF_SEC',
+                            '30')
+        return max(1, int(res))
+
+    @handle_exceptions_method
+    def k8s_breaker_max_backoff_sec(self):
+        res = self.load_key('K8S_BREAKER_MAX_BACKOFF_SEC',
+                            '1800')
+        return max(1, int(res))
+
+    @handle_exceptions_method
+    def k8s_request_timeout_min(self):
+        res = self.load_key('K8S_REQUEST_TIMEOUT_MIN_SEC',
+                            '5')
+        return max(1, int(res))
+
+    @handle_exceptions_method
+    def k8s_request_timeout_max(self):
+        res = self.load_key('K8S_REQUEST_TIMEOUT_MAX_SEC',
+                            '120')
+        return max(1, int(res))
+
+    @handle_exceptions_method
+    def k8s_connect_timeout(self):
+        res = self.load_key('K8S_CONNECT_TIMEOUT_SEC',
+                            '10')
+        return max(1, int(res))
+
+    @handle_exceptions_method
+    def k8s_pool_maxsize(self):
+        res = self.load_key('K8S_POOL_MAXSIZE',
+                            '10')
+        return max(1, int(res))
+
+    @handle_exceptions_method
+    def k8s_stream_decode(self):
+        res = self.load_key('K8S_STREAM_DECODE', 'True')
+        return True if res.lower() == "true" or res.lower() == "1" else False
+
+    @handle_exceptions_method
+    def k8s_gzip_enable(self):
+        res = self.load_key('K8S_GZIP_ENABLE', 'True')
+        return True if res.lower() == "true" or res.lower() == "1" else False
+
+    @handle_exceptions_method
+    def velero_backup_stats_columnar(self):
+        res = self.load_key('BACKUP_STATS_COLUMNAR', 'False')
+        return True if res.lower() == "true" or res.lower() == "1" else False
+
+    @handle_exceptions_method
+    def history_enable(self):
+        res = self.load_key('HISTORY_ENABLE', 'False')
+        return True if res.lower() == "true" or res.lower() == "1" else False
+
+    @handle_exceptions_method
+    def history_path(self):
+        return self.load_key('HISTORY_DB_PATH',
+                             './logs/history.db')
+
+    @handle_exceptions_method
+    def history_raw_days(self):
+        res = self.load_key('HISTORY_RAW_DAYS',
+                            '90')
+        return max(1, int(res))
+
+    @handle_exceptions_method
+    def history_retention_days(self):
+        res = self.load_key('HISTORY_RETENTION_DAYS',
+                            '400')
+        return max(1, int(res))
+
+    @handle_exceptions_method
+    def anomaly_enable(self):
+        res = self.load_key('ANOMALY_ENABLE', 'False')
+        return True if res.lower() == "true" or res.lower() == "1" else False
+
+    @handle_exceptions_method
+    def anomaly_state_path(self):
+        return self.load_key('ANOMALY_STATE_PATH',
+                             './logs/schedule_stats.json')
+
+    @handle_exceptions_method
+    def anomaly_min_samples(self):
+        res = self.load_key('ANOMALY_MIN_SAMPLES',
+                            '5')
+        return max(2, int(res))
+
+    @handle_exceptions_method
+    def anomaly_zscore(self):
+        res = self.load_key('ANOMALY_ZSCORE',
+                            '3')
+        return float(res)
+
+    @handle_exceptions_method
+    def anomaly_min_ratio(self):
+        res = self.load_key('ANOMALY_MIN_RATIO',
+                            '0.5')
+        return float(res)
+
+    @handle_exceptions_method
+    def missed_schedule_enable(self):
+        res = self.load_key('MISSED_SCHEDULE_ENABLE', 'False')
+        return True if res.lower() == "true" or res.lower() == "1" else False
+
+    @handle_exceptions_method
+    def missed_schedule_grace_min(self):
+        res = self.load_key('MISSED_SCHEDULE_GRACE_MIN',
+                            '60')
+        return max(0, int(res))
+
+    @handle_exceptions_method
+    def volume_stats_enable(self):
+        res = self.load_key('VOLUME_STATS_ENABLE', 'False')
+        return True if res.lower() == "true" or res.lower() == "1" else False
+
+    @handle_exceptions_method
+    def volume_stats_page_size(self):
+        res = self.load_key('VOLUME_STATS_PAGE_SIZE',
+                            '500')
+        return max(1, int(res))
+
+    @handle_exceptions_method
+    def config_reload_path(self):
+        return self.load_key('CONFIG_RELOAD_PATH', '')
+
+    @handle_exceptions_method
+    def config_reload_sec(self):
+        res = self.load_key('CONFIG_RELOAD_SEC',
+                            '30')
+        return max(1, int(res))
+
+    @handle_exceptions_method
+    def loop_monitor_enable(self):
+        res = self.load_key('LOOP_MONITOR_ENABLE', 'False')
+        return True if res.lower() == "true" or res.lower() == "1" else False
+
+    @handle_exceptions_method
+    def loop_monitor_interval_ms(self):
+        res = self.load_key('LOOP_MONITOR_INTERVAL_MS',
+                            '500')
+        return max(10, int(res))
+
+    @handle_exceptions_method
+    def loop_stall_threshold_ms(self):
+        res = self.load_key('LOOP_STALL_THRESHOLD_MS',
+                            '1000')
+        return max(10, int(res))
+
+    @handle_exceptions_method
+    def ready_file(self):
+        return self.load_key('READY_FILE', '')
+
     @handle_exceptions_method
     def get_regex_patterns_ignore_nm(self):
         regex_list = []
@@ -215,6 +522,7 @@ class ConfigK8sProcess:
 
         self.backup_enable = True
         self.backup_key = 'backup'
+        self.backup_stats_columnar = False
 
         self.schedule_enable = True
         self.schedule_key = 'schedule'
@@ -226,6 +534,51 @@ class ConfigK8sProcess:
         # LS 2023.11.23 add ignored namespaces
         self.ignore_namespace = []
 
+        # circuit breaker and request timeouts of the k8s api calls
+        self.breaker_failures = 2
+        self.breaker_backoff_sec = 30
+        self.breaker_max_backoff_sec = 1800
+        self.request_timeout_min = 5
+        self.request_timeout_max = 120
+        self.connect_timeout = 10
+        # transport of the k8s api calls
+        self.pool_maxsize = 10
+        self.gzip_enable = True
+        self.stream_decode = True
+
+        # history of the backup outcomes
+        self.history_enable = False
+        self.history_path = './logs/history.db'
+        self.history_raw_days = 90
+        self.history_retention_days = 400
+
+        # anomalies of duration and items of the completed backups
+        self.anomaly_enable = False
+        self.anomaly_state_path = './logs/schedule_stats.json'
+        self.anomaly_min_samples = 5
+        self.anomaly_zscore = 3.0
+        self.anomaly_min_ratio = 0.5
+
+        # schedules that did not fire
+        self.missed_schedule_enable = False
+        self.missed_schedule_grace_min = 60
+
+        # PodVolumeBackups and DataUploads aggregation
+        self.volume_stats_enable = False
+        self.volume_stats_page_size = 500
+
+        # file created when the first snapshot is loaded (readiness probe), empty to disable
+        self.ready_file = ''
+
+        # scheduling delay of the event loop and stalls
+        self.loop_monitor_enable = False
+        self.loop_monitor_interval_ms = 500
+        self.loop_stall_threshold_ms = 1000
+
+        # hot reload of the mounted config
+        self.config_reload_path = ''
+        self.config_reload_sec = 30
+
         if cl_config is not None:
             self.__init_configuration_app__(cl_config)
 
@@ -239,9 +592,34 @@ class ConfigK8sProcess:
         print(f"INFO    [Process setup] k8s config file={self.k8s_config_file}")
         print(f"INFO    [Process setup] velero backup enable={self.backup_enable}")
         print(f"INFO    [Process setup] velero schedule enable={self.schedule_enable}")
+        print(f"INFO    [Process setup] velero backup columnar stats={self.backup_stats_columnar}")
         print(f"INFO    [Process setup] k8s send summary message={self.disp_msg_key_unique}")
 
         print(f"INFO    [Process setup] k8s ignored namespaces: regex defined {len(self.ignore_namespace)}")
+        print(f"INFO    [Process setup] k8s circuit breaker failures={self.breaker_failures} "
+              f"backoff={self.breaker_backoff_sec}-{self.breaker_max_backoff_sec} sec")
+        print(f"INFO    [Process setup] k8s request timeout={self.request_timeout_min}-{self.request_timeout_max} sec "
+              f"connect timeout={self.connect_timeout} sec")
+        print(f"INFO    [Process setup] k8s transport pool size={self.pool_maxsize} gzip={self.gzip_enable} "
+              f"stream decode={self.stream_decode}")
+        print(f"INFO    [Process setup] history enable={self.history_enable}")
+        if self.history_enable:
+            print(f"INFO    [Process setup] history path={self.history_path} raw days={self.history_raw_days} "
+                  f"retention days={self.history_retention_days}")
+        print(f"INFO    [Process setup] anomaly detection enable={self.anomaly_enable}")
+        if self.anomaly_enable:
+            print(f"INFO    [Process setup] anomaly state={self.anomaly_state_path} "
+                  f"min samples={self.anomaly_min_samples} zscore={self.anomaly_zscore} "
+                  f"min ratio={self.anomaly_min_ratio}")
+        print(f"INFO    [Process setup] missed schedule enable={self.missed_schedule_enable} "
+              f"grace={self.missed_schedule_grace_min} min")
+        print(f"INFO    [Process setup] volume stats enable={self.volume_stats_enable} "
+              f"page size={self.volume_stats_page_size}")
+        print(f"INFO    [Process setup] ready file={self.ready_file or 'disabled'}")
+        print(f"INFO    [Process setup] loop monitor enable={self.loop_monitor_enable} "
+              f"interval={self.loop_monitor_interval_ms} ms stall threshold={self.loop_stall_threshold_ms} ms")
+        print(f"INFO    [Process setup] config reload path={self.config_reload_path or 'disabled'} "
+              f"every {self.config_reload_sec} sec")
 
     def __init_configuration_app__(self, cl_config: ConfigProgram):
         """
@@ -249,6 +627,7 @@ class ConfigK8sProcess:
         """
         self.backup_enable = cl_config.velero_backup_enable()
         self.schedule_enable = cl_config.velero_schedule_enable()
+        self.backup_stats_columnar = cl_config.velero_backup_stats_columnar()
         self.EXPIRES_DAYS_WARNING = cl_config.velero_expired_days_warning()
         self.cluster_name = cl_config.k8s_cluster_identification()
         self.k8s_in_cluster_mode = cl_config.k8s_incluster_mode()
@@ -257,6 +636,42 @@ class ConfigK8sProcess:
         # LS 2023.11.23 add ignored namespace
         self.ignore_namespace = cl_config.get_regex_patterns_ignore_nm()
 
+        self.breaker_failures = cl_config.k8s_breaker_failures()
+        self.breaker_backoff_sec = cl_config.k8s_breaker_backoff_sec()
+        self.breaker_max_backoff_sec = cl_config.k8s_breaker_max_backoff_sec()
+        self.request_timeout_min = cl_config.k8s_request_timeout_min()
+        self.request_timeout_max = cl_config.k8s_request_timeout_max()
+        self.connect_timeout = cl_config.k8s_connect_timeout()
+        self.pool_maxsize = cl_config.k8s_pool_maxsize()
+        self.gzip_enable = cl_config.k8s_gzip_enable()
+        self.stream_decode = cl_config.k8s_stream_decode()
+
+        self.history_enable = cl_config.history_enable()
+        self.history_path = cl_config.history_path()
+        self.history_raw_days = cl_config.history_raw_days()
+        self.history_retention_days = cl_config.history_retention_days()
+
+        self.anomaly_enable = cl_config.anomaly_enable()
+        self.anomaly_state_path = cl_config.anomaly_state_path()
+        self.anomaly_min_samples = cl_config.anomaly_min_samples()
+        self.anomaly_zscore = cl_config.anomaly_zscore()
+        self.anomaly_min_ratio = cl_config.anomaly_min_ratio()
+
+        self.missed_schedule_enable = cl_config.missed_schedule_enable()
+        self.missed_schedule_grace_min = cl_config.missed_schedule_grace_min()
+
+        self.volume_stats_enable = cl_config.volume_stats_enable()
+        self.volume_stats_page_size = cl_config.volume_stats_page_size()
+
+        self.ready_file = cl_config.ready_file()
+
+        self.loop_monitor_enable = cl_config.loop_monitor_enable()
+        self.loop_monitor_interval_ms = cl_config.loop_monitor_interval_ms()
+        self.loop_stall_threshold_ms = cl_config.loop_stall_threshold_ms()
+
+        self.config_reload_path = cl_config.config_reload_path()
+        self.config_reload_sec = cl_config.config_reload_sec()
+
         self.__print_configuration__()
 
 
@@ -264,6 +679,15 @@ class ConfigDispatcher:
     def __init__(self, cl_config: ConfigProgram = None):
         self.max_msg_len = 50000
         self.alive_message = 24
+        self.dedup_seconds = 0
+        self.dedup_max_entries = 256
+        self.digest_seconds = 0
+        self.digest_max_entries = 500
+        self.delta_report = False
+        self.full_report_hours = 24
+        self.queue_pressure = 5
+        # NOTIFICATION_ROUTE_n definitions, compiled by the notification router
+        self.routes = []
 
         self.telegram_enable = False
         self.telegram_chat_id = '0'
@@ -311,6 +735,15 @@ class ConfigDispatcher:
             print(f"INFO    [Dispatcher setup] email-password={self.email_sender_password}")
             print(f"INFO    [Dispatcher setup] email-recipient={self.email_recipient}")
 
+        print(f"INFO    [Dispatcher setup] notification dedup window={self.dedup_seconds} sec "
+              f"max entries={self.dedup_max_entries}")
+        print(f"INFO    [Dispatcher setup] notification digest window={self.digest_seconds} sec "
+              f"max entries={self.digest_max_entries}")
+        print(f"INFO    [Dispatcher setup] notification delta report={self.delta_report} "
+              f"full report every={self.full_report_hours} hour")
+        print(f"INFO    [Dispatcher setup] notification queue pressure={self.queue_pressure}")
+        print(f"INFO    [Dispatcher setup] notification routes defined {len(self.routes)}")
+
     def __init_configuration_app__(self, cl_config: ConfigProgram):
         """
         Init configuration class reading .env file
@@ -331,6 +764,87 @@ class ConfigDispatcher:
         self.email_recipient = cl_config.email_recipient()
 
         self.alive_message = cl_config.notification_alive_message_hours()
+        self.dedup_seconds = cl_config.notification_dedup_seconds()
+        self.dedup_max_entries = cl_config.notification_dedup_max_entries()
+        self.digest_seconds = cl_config.notification_digest_seconds()
+        self.digest_max_entries = cl_config.notification_digest_max_entries()
+        self.delta_report = cl_config.notification_delta_report()
+        self.full_report_hours = cl_config.notification_full_report_hours()
+        self.queue_pressure = cl_config.notification_queue_pressure()
+        self.routes = cl_config.notification_routes()
 
         # email section
         self.__print_configuration__()
+
+
+class ConfigStatusApi:
+    def __init__(self, cl_config: ConfigProgram = None):
+        self.enable = False
+        self.host = '0.0.0.0'
+        self.port = 8080
+        self.read_timeout = 30
+
+        self.sse_queue_size = 100
+        self.sse_max_clients = 100
+        self.sse_heartbeat = 15
+
+        if cl_config is not None:
+            self.__init_configuration_app__(cl_config)
+
+    def __print_configuration__(self):
+        """
+        Print setup class
+        """
+        print(f"INFO    [Status api setup] http api={self.enable}")
+        if self.enable:
+            print(f"INFO    [Status api setup] http api listen={self.host}:{self.port}")
+            print(f"INFO    [Status api setup] events max clients={self.sse_max_clients} "
+                  f"queue size={self.sse_queue_size}")
+
+    def __init_configuration_app__(self, cl_config: ConfigProgram):
+        """
+        Init configuration class reading .env file
+        """
+        self.enable = cl_config.status_api_enable()
+        self.host = cl_config.status_api_host()
+        self.port = cl_config.status_api_port()
+        self.sse_queue_size = cl_config.status_api_sse_queue_size()
+        self.sse_max_clients = cl_config.status_api_sse_max_clients()
+
+        self.__print_configuration__()
+
+
+class ConfigShard:
+    def __init__(self, cl_config: ConfigProgram = None):
+        self.enable = False
+        self.identity = socket.gethostname()
+        self.namespace = 'default'
+        self.lease_prefix = 'k8s-watchdog'
+        self.lease_duration_sec = 30
+        self.renew_sec = 10
+        self.vnodes = 64
+
+        if cl_config is not None:
+            self.__init_configuration_app__(cl_config)
+
+    def __print_configuration__(self):
+        """
+        Print setup class
+        """
+        print(f"INFO    [Shard setup] shard enable={self.enable}")
+        if self.enable:
+            print(f"INFO    [Shard setup] identity={self.identity} namespace={self.namespace}")
+            print(f"INFO    [Shard setup] lease duration={self.lease_duration_sec} sec renew={self.renew_sec} sec")
+
+    def __init_configuration_app__(self, cl_config: ConfigProgram):
+        """
+        Init configuration class reading .env file
+        """
+        self.enable = cl_config.shard_enable()
+        self.identity = cl_config.shard_identity()
+        self.namespace = cl_config.shard_namespace()
+        self.lease_duration_sec = cl_config.shard_lease_duration_sec()
+        # renew well before the expiration of the lease
+        self.renew_sec = min(cl_config.shard_renew_sec(), max(1, self.lease_duration_sec // 3))
+
+        self.__print_configuration__()
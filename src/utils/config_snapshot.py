@@ -0,0 +1,108 @@
+import os
+from dataclasses import dataclass
+from fnmatch import fnmatchcase
+from types import MappingProxyType
+
+from dotenv import dotenv_values
+
+from utils.config import ConfigProgram, ConfigK8sProcess, ConfigDispatcher
+from utils.handle_error import is_error_result
+from libs.notification_router import compile_routes
+
+# keys read only at startup: a change is reported and applied at the next restart
+RESTART_KEYS = ('DEBUG', 'LOG_*', 'K8S_INCLUSTER_MODE', 'PROCESS_KUBE_CONFIG', 'PROCESS_LOAD_KUBE_CONFIG',
+                'K8S_POOL_MAXSIZE', 'PROCESS_CLUSTER_NAME', 'HTTP_API_*', 'SHARD_*', 'HISTORY_*', 'ANOMALY_ENABLE',
+                'ANOMALY_STATE_PATH', 'MISSED_SCHEDULE_ENABLE', 'LOOP_*', 'READY_FILE', 'CONFIG_RELOAD_*')
+
+# kubernetes projects a mounted ConfigMap as one file for every key, swapped at once through this link
+CONFIGMAP_DATA_LINK = '..data'
+
+
+def read_config_source(path):
+    """
+    Values of a mounted ConfigMap (directory with a file for every key) or of a .env file
+    @return: dict key -> value
+    """
+    if os.path.isdir(path):
+        values = {}
+        for name in os.listdir(path):
+            file_path = os.path.join(path, name)
+            if name.startswith('.') or not os.path.isfile(file_path):
+                continue
+            with open(file_path) as file:
+                values[name] = file.read().strip()
+        return values
+    return {key: value for key, value in dotenv_values(path).items() if value is not None}
+
+
+def source_version(path):
+    """
+    Identity of the current content of the source, it changes when the source is updated
+    """
+    if os.path.isdir(path):
+        link = os.path.join(path, CONFIGMAP_DATA_LINK)
+        if os.path.islink(link):
+            return os.path.realpath(link)
+        return tuple(sorted((name, os.stat(os.path.join(path, name)).st_mtime_ns)
+                            for name in os.listdir(path) if os.path.isfile(os.path.join(path, name))))
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def changed_keys(old_values, new_values):
+    return sorted(key for key in set(old_values) | set(new_values) if old_values.get(key) != new_values.get(key))
+
+
+def restart_keys(keys):
+    return [key for key in keys if any(fnmatchcase(key, pattern) for pattern in RESTART_KEYS)]
+
+
+def __errors__(name, obj):
+    return [f"{name}.{field}: {value['error']['description']}"
+            for field, value in vars(obj).items() if is_error_result(value)]
+
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    """
+    Validated configuration swapped at once in the components.
+    The config classes of a snapshot are never modified: a change builds a new snapshot
+    """
+    version: int
+    values: MappingProxyType
+    k8s: ConfigK8sProcess
+    dispatcher: ConfigDispatcher
+    cycle_seconds: int
+    # dispatcher.routes compiled: the reload only swaps them
+    route_rules: tuple = ()
+
+
+def build_snapshot(version, overrides: dict, debug_on=False):
+    """
+    Build and validate a snapshot from the environment and the mounted values
+    @return: ConfigSnapshot
+    @raise ValueError: a value is not valid (the current snapshot must be kept)
+    """
+    cl_config = ConfigProgram(debug_on=debug_on, overrides=overrides)
+    k8s = ConfigK8sProcess(cl_config)
+    dispatcher = ConfigDispatcher(cl_config)
+    cycle_seconds = cl_config.process_run_sec()
+
+    errors = __errors__('k8s', k8s) + __errors__('dispatcher', dispatcher)
+    if is_error_result(cycle_seconds):
+        errors.append(f"PROCESS_CYCLE_SEC: {cycle_seconds['error']['description']}")
+    elif cycle_seconds <= 0:
+        errors.append(f"PROCESS_CYCLE_SEC: {cycle_seconds} is not positive")
+    if k8s.missed_schedule_enable is True and k8s.schedule_enable is False:
+        errors.append("MISSED_SCHEDULE_ENABLE: needs SCHEDULE_ENABLE")
+    route_rules, route_errors = compile_routes(dispatcher.routes)
+    errors += route_errors
+    if len(errors) > 0:
+        raise ValueError('; '.join(errors))
+
+    return ConfigSnapshot(version=version,
+                          values=MappingProxyType(dict(overrides)),
+                          k8s=k8s,
+                          dispatcher=dispatcher,
+                          cycle_seconds=cycle_seconds,
+                          route_rules=route_rules)
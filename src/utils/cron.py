@@ -0,0 +1,147 @@
+import calendar
+import re
+from datetime import datetime, timedelta, timezone
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # python < 3.9
+    ZoneInfo = None
+
+MONTH_NAMES = {name.lower(): index for index, name in enumerate(calendar.month_abbr) if name}
+DAY_NAMES = {'sun': 0, 'mon': 1, 'tue': 2, 'wed': 3, 'thu': 4, 'fri': 5, 'sat': 6}
+
+MACROS = {'@yearly': '0 0 1 1 *',
+          '@annually': '0 0 1 1 *',
+          '@monthly': '0 0 1 * *',
+          '@weekly': '0 0 * * 0',
+          '@daily': '0 0 * * *',
+          '@midnight': '0 0 * * *',
+          '@hourly': '0 * * * *'}
+
+DURATION_UNITS = {'h': 3600, 'm': 60, 's': 1, 'ms': 0.001}
+DURATION_RE = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+
+# bound of the backward search (one step per not matching month, day, hour or minute)
+MAX_STEPS = 5000
+
+
+class CronError(ValueError):
+    pass
+
+
+def _parse_field(value, low, high, names=None):
+    """
+    Parse a cron field (lists, ranges, steps, names) into the sorted tuple of the allowed values
+    """
+    allowed = set()
+    for part in value.lower().split(','):
+        step = 1
+        if '/' in part:
+            part, step_str = part.split('/', 1)
+            step = int(step_str)
+            if step <= 0:
+                raise CronError(f"invalid step {value}")
+        if part in ('*', '?'):
+            start, end = low, high
+        else:
+            bounds = [names.get(item, item) if names else item for item in part.split('-', 1)]
+            start = int(bounds[0])
+            end = int(bounds[1]) if len(bounds) > 1 else (high if step > 1 else start)
+        if start < low or end > high or start > end:
+            raise CronError(f"value out of range {value}")
+        allowed.update(range(start, end + 1, step))
+    return tuple(sorted(allowed))
+
+
+def parse_duration(value):
+    """
+    Parse a go duration (1h30m, 90s) in seconds
+    """
+    matches = DURATION_RE.findall(value)
+    if not matches or ''.join(number + unit for number, unit in matches) != value:
+        raise CronError(f"invalid duration {value}")
+    return sum(float(number) * DURATION_UNITS[unit] for number, unit in matches)
+
+
+class CronExpression:
+    """
+    Precompiled cron expression (standard 5 fields, names, macros, @every and CRON_TZ/TZ prefix)
+    as accepted by the Velero schedules. previous_fire returns the last activation before a time
+    """
+    __slots__ = ('expression', 'minutes', 'hours', 'days', 'months', 'weekdays',
+                 'any_day', 'any_weekday', 'interval', 'tz')
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        self.interval = None
+        self.tz = timezone.utc
+
+        text = expression.strip()
+        if text.startswith(('CRON_TZ=', 'TZ=')):
+            tz_name, _, text = text.partition(' ')
+            self.tz = self.__load_timezone__(tz_name.split('=', 1)[1])
+            text = text.strip()
+
+        if text.startswith('@every '):
+            self.interval = parse_duration(text[len('@every '):].strip())
+            if self.interval <= 0:
+                raise CronError(f"invalid interval {expression}")
+            return
+
+        text = MACROS.get(text.lower(), text)
+        fields = text.split()
+        if len(fields) != 5:
+            raise CronError(f"expected 5 fields: {expression}")
+
+        self.minutes = _parse_field(fields[0], 0, 59)
+        self.hours = _parse_field(fields[1], 0, 23)
+        self.days = _parse_field(fields[2], 1, 31)
+        self.months = _parse_field(fields[3], 1, 12, MONTH_NAMES)
+        # 7 is sunday as 0
+        self.weekdays = tuple(sorted({day % 7 for day in _parse_field(fields[4], 0, 7, DAY_NAMES)}))
+        self.any_day = fields[2] in ('*', '?')
+        self.any_weekday = fields[4] in ('*', '?')
+
+    @staticmethod
+    def __load_timezone__(name):
+        if ZoneInfo is None:
+            raise CronError(f"time zone not supported {name}")
+        try:
+            return ZoneInfo(name)
+        except Exception:
+            raise CronError(f"unknown time zone {name}")
+
+    def __day_matches__(self, value: datetime):
+        day_ok = value.day in self.days
+        weekday_ok = (value.weekday() + 1) % 7 in self.weekdays
+        # as cron: when both day fields are restricted one of them is enough
+        if not self.any_day and not self.any_weekday:
+            return day_ok or weekday_ok
+        return day_ok and weekday_ok
+
+    def previous_fire(self, before: float):
+        """
+        Last activation at or before an epoch time, None for @every or if not found
+        """
+        if self.interval is not None:
+            return None
+
+        current = datetime.fromtimestamp(before, tz=self.tz).replace(second=0, microsecond=0, tzinfo=None)
+        for _ in range(MAX_STEPS):
+            if current.month not in self.months:
+                # last minute of the previous month
+                current = current.replace(day=1, hour=23, minute=59) - timedelta(days=1)
+                continue
+            if not self.__day_matches__(current):
+                current = current.replace(hour=23, minute=59) - timedelta(days=1)
+                continue
+            if current.hour not in self.hours:
+                current = current.replace(minute=59) - timedelta(hours=1)
+                continue
+            minute = next((value for value in reversed(self.minutes) if value <= current.minute), None)
+            if minute is None:
+                current = current.replace(minute=59) - timedelta(hours=1)
+                continue
+            # local wall time to epoch (fold 0 on the ambiguous times)
+            return current.replace(minute=minute, tzinfo=self.tz).timestamp()
+        return None
@@ -77,3 +77,14 @@ def handle_exceptions_async_method(fn):
                 del tb
 
     return wrapper
+
+
+def is_error_result(value):
+    """
+    Check if the value is the result of a method that raised an exception
+    (see the handle_exceptions_* decorators)
+    """
+    return (isinstance(value, dict)
+            and len(value) == 1
+            and isinstance(value.get('error'), dict)
+            and 'fn name' in value['error'])
@@ -0,0 +1,32 @@
+import hashlib
+from bisect import bisect
+
+
+def _hash(value: str):
+    return int.from_bytes(hashlib.sha1(value.encode('utf-8')).digest()[:8], 'big')
+
+
+class ConsistentHashRing:
+    """
+    Consistent hashing of the keys on the members, with virtual nodes.
+    When a member joins or leaves only the keys of its arcs move (about 1/members of the keys)
+    """
+
+    def __init__(self, members=(), vnodes=64):
+        self.vnodes = vnodes
+        self.members = frozenset(members)
+        points = sorted((_hash(f"{member}#{index}"), member)
+                        for member in self.members for index in range(vnodes))
+        self.hashes = [point for point, _ in points]
+        self.owners = [member for _, member in points]
+        # key -> owner, valid for this ring (a new ring is built when the members change)
+        self.cache = {}
+
+    def owner(self, key):
+        if len(self.hashes) == 0:
+            return None
+        owner = self.cache.get(key)
+        if owner is None:
+            index = bisect(self.hashes, _hash(key)) % len(self.hashes)
+            owner = self.cache[key] = self.owners[index]
+        return owner
@@ -0,0 +1,107 @@
+import codecs
+import json
+import re
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+CHUNK_SIZE = 64 * 1024
+
+
+class JsonListStream:
+    """
+    Incremental decoder of a k8s list document ({"metadata": {...}, "items": [...], ...}).
+    The items are decoded one at a time from the chunks of the response: the whole document and the whole
+    list of items are never in memory. The other top level fields are kept in fields once decoded
+    """
+
+    def __init__(self, chunks):
+        """
+        @param chunks: iterable of bytes (decoded content of the http response)
+        """
+        self.chunks = iter(chunks)
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.body_bytes = 0
+        self.fields = {}
+
+    def __fill__(self):
+        """
+        Append the next chunk to the buffer, the consumed part is dropped
+        @return: False at the end of the document
+        """
+        if self.eof:
+            return False
+        if self.pos > 0:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        for chunk in self.chunks:
+            if not chunk:
+                continue
+            self.body_bytes += len(chunk)
+            self.buffer += self.text_decoder.decode(chunk)
+            return True
+        self.buffer += self.text_decoder.decode(b'', final=True)
+        self.eof = True
+        return False
+
+    def __peek__(self):
+        """
+        @return: next char after the whitespaces, '' at the end of the document
+        """
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.__fill__():
+                return ''
+
+    def __expect__(self, chars):
+        char = self.__peek__()
+        if char == '' or char not in chars:
+            raise ValueError(f"invalid list document: expected {chars!r} at {self.body_bytes} bytes, got {char!r}")
+        self.pos += 1
+        return char
+
+    def __value__(self):
+        """
+        Decode the next json value, reading chunks until it is complete
+        """
+        self.__peek__()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # a number at the end of the buffer can continue in the next chunk
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.__fill__()
+
+    def items(self):
+        """
+        Generator of the items of the list
+        """
+        self.__expect__('{')
+        if self.__peek__() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.__value__()
+            self.__expect__(':')
+            if key == 'items' and self.__peek__() == '[':
+                self.pos += 1
+                if self.__peek__() == ']':
+                    self.pos += 1
+                else:
+                    while True:
+                        yield self.__value__()
+                        if self.__expect__(',]') == ']':
+                            break
+            else:
+                self.fields[key] = self.__value__()
+            if self.__expect__(',}') == '}':
+                return
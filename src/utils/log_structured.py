@@ -0,0 +1,149 @@
+import json
+import logging
+import re
+import time
+from datetime import datetime, timezone
+
+
+class LogContext:
+    """
+    Process wide fields added to every log record: cluster name and current cycle
+    """
+
+    def __init__(self):
+        self.cluster = None
+        self.cycle_id = 0
+        self.cycle_start = None
+
+    def start_cycle(self, cycle_id):
+        self.cycle_id = cycle_id
+        self.cycle_start = time.monotonic()
+
+    def elapsed(self):
+        if self.cycle_start is None:
+            return None
+        return round(time.monotonic() - self.cycle_start, 3)
+
+    def apply(self, record, component=None):
+        msg = record.msg
+        record.cluster = self.cluster
+        record.component = component or getattr(msg, 'name', None) or record.name
+        record.cycle_id = self.cycle_id
+        record.duration = self.elapsed()
+        return record
+
+
+log_context = LogContext()
+
+
+class ContextFilter(logging.Filter):
+    """
+    Capture the context when the record is created (before any queue hop)
+    """
+
+    def filter(self, record):
+        log_context.apply(record)
+        return True
+
+
+class RepetitionFilter(logging.Filter):
+    """
+    Rate-limit identical messages per component.
+    Messages are identical when level, component and template (digits ignored) match.
+    Every window a summary with the number of suppressed messages is emitted
+    """
+    _digits = re.compile(r'\d+')
+
+    def __init__(self, logger: logging.Logger, window_seconds=300, burst=1, max_keys=10000):
+        super().__init__()
+        self.logger = logger
+        self.window_seconds = window_seconds
+        self.burst = burst
+        self.max_keys = max_keys
+
+        # key -> [window start, messages in window, suppressed]
+        self.counters = {}
+        self.templates = {}
+        self.last_flush = time.time()
+
+    def __template__(self, msg):
+        template = getattr(msg, 'msg', msg)
+        if not isinstance(template, str):
+            template = str(template)
+        normalized = self.templates.get(template)
+        if normalized is None:
+            if len(self.templates) > self.max_keys:
+                self.templates.clear()
+            normalized = self._digits.sub('#', template)
+            self.templates[template] = normalized
+        return normalized
+
+    def __flush__(self, now):
+        self.last_flush = now
+        active = {}
+        for (level, component, template), entry in self.counters.items():
+            if entry[2] > 0:
+                summary = logging.LogRecord(self.logger.name, logging.INFO, __file__, 0,
+                                            f"{component} suppressed {entry[2]} repeated messages "
+                                            f"in {self.window_seconds}s: {template}",
+                                            (), None)
+                log_context.apply(summary, component)
+                summary.suppressed = entry[2]
+                self.logger.callHandlers(summary)
+            if now - entry[0] < self.window_seconds:
+                entry[2] = 0
+                active[(level, component, template)] = entry
+        self.counters = active
+
+    def filter(self, record):
+        now = record.created
+        if now - self.last_flush >= self.window_seconds:
+            self.__flush__(now)
+
+        # warnings and errors are never sampled
+        if record.levelno >= logging.WARNING:
+            return True
+
+        key = (record.levelno, getattr(record, 'component', record.name), self.__template__(record.msg))
+        entry = self.counters.get(key)
+        if entry is None or now - entry[0] >= self.window_seconds:
+            if entry is not None and entry[2] > 0:
+                # the window is closed, keep the count for the next summary
+                entry[0], entry[1] = now, 1
+                return True
+            if len(self.counters) >= self.max_keys:
+                self.__flush__(now)
+            self.counters[key] = [now, 1, 0]
+            return True
+
+        entry[1] += 1
+        if entry[1] <= self.burst:
+            return True
+        entry[2] += 1
+        return False
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format the records as JSON lines with stable fields
+    """
+
+    def format(self, record):
+        msg = record.msg
+        if hasattr(msg, 'plain'):
+            message = msg.plain()
+        else:
+            message = record.getMessage()
+
+        data = {'ts': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec='milliseconds'),
+                'level': record.levelname,
+                'cluster': getattr(record, 'cluster', None),
+                'component': getattr(record, 'component', record.name),
+                'cycle_id': getattr(record, 'cycle_id', None),
+                'duration': getattr(record, 'duration', None),
+                'msg': message}
+        if hasattr(record, 'suppressed'):
+            data['suppressed'] = record.suppressed
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
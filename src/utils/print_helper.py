@@ -1,14 +1,66 @@
+import atexit
+import gzip
 import os
 import logging
+import shutil
 import sys
-from logging.handlers import RotatingFileHandler
+import time
+from concurrent.futures import ThreadPoolExecutor
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+from queue import SimpleQueue
 from utils.handle_error import handle_exceptions_method
 from utils.config import ConfigProgram
+from utils.log_structured import log_context, ContextFilter, RepetitionFilter, JsonFormatter
+
+
+class CompressedRotator:
+    """
+    Rotator for RotatingFileHandler: the rotated file is renamed and gzip-compressed by a background worker
+    """
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='log-compress')
+
+    @staticmethod
+    def namer(default_name):
+        return f"{default_name}.gz"
+
+    @staticmethod
+    def __compress__(source, dest):
+        try:
+            with open(source, 'rb') as file_in, gzip.open(dest, 'wb') as file_out:
+                shutil.copyfileobj(file_in, file_out)
+            os.remove(source)
+        except Exception as err:
+            print(f"ERROR   logger compress {source}: {err}")
+
+    def __call__(self, source, dest):
+        if not os.path.exists(source):
+            return
+        # rename immediately, the handler reopens the base file while the worker compresses
+        pending = f"{dest}.{time.time_ns()}.tmp"
+        os.rename(source, pending)
+        self.executor.submit(self.__compress__, pending, dest)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Queue handler that leaves the formatting of the record to the listener thread.
+    The message arguments are formatted later, so they must not be changed after the log call
+    """
+
+    def prepare(self, record):
+        return record
 
 
 class LLogger:
     def __init__(self):
         self.logger = None
+        self.listener = None
+        self.rotator = None
 
     @handle_exceptions_method
     def init_logger_from_config(self, cl_config: ConfigProgram):
@@ -21,6 +73,13 @@ class LLogger:
         logger_file_size = cl_config.logger_max_filesize()
         logger_backup_files = cl_config.logger_his_backups_files()
         logger_level = cl_config.logger_level()
+        logger_async = cl_config.logger_async_enable()
+        logger_compress = cl_config.logger_compress_rotated()
+        logger_json = cl_config.logger_json_format()
+        logger_sampling_sec = cl_config.logger_sampling_seconds()
+        logger_sampling_burst = cl_config.logger_sampling_burst()
+
+        log_context.cluster = cl_config.k8s_cluster_identification()
 
         return self.init_logger(key=logger_key,
                                 output_format=logger_format_msg,
@@ -29,7 +88,12 @@ class LLogger:
                                 filename=logger_file_name,
                                 max_file_size=logger_file_size,
                                 historical_files=logger_backup_files,
-                                level=logger_level)
+                                level=logger_level,
+                                async_mode=logger_async,
+                                compress_rotated=logger_compress,
+                                json_format=logger_json,
+                                sampling_seconds=logger_sampling_sec,
+                                sampling_burst=logger_sampling_burst)
 
     @handle_exceptions_method
     def init_logger(self,
@@ -40,26 +104,75 @@ class LLogger:
                     filename,
                     max_file_size,
                     historical_files,
-                    level):
+                    level,
+                    async_mode=False,
+                    compress_rotated=False,
+                    json_format=False,
+                    sampling_seconds=0,
+                    sampling_burst=1):
         if self.logger is None:
 
-            logging.basicConfig(format=output_format,
-                                level=level)
+            formatter = JsonFormatter() if json_format else logging.Formatter(output_format)
+            handlers = []
+            if async_mode or json_format:
+                # own stream handler instead of the root one: it uses the selected formatter
+                # and in async mode it is moved behind the queue listener
+                stream_handler = logging.StreamHandler()
+                stream_handler.setFormatter(formatter)
+                handlers.append(stream_handler)
+            else:
+                logging.basicConfig(format=output_format,
+                                    level=level)
             self.logger = logging.getLogger(key)
+            self.logger.setLevel(level)
+            self.logger.addFilter(ContextFilter())
+            if sampling_seconds > 0:
+                print(f"INFO    logger sampling repeated messages every {sampling_seconds} sec")
+                self.logger.addFilter(RepetitionFilter(self.logger,
+                                                       window_seconds=sampling_seconds,
+                                                       burst=sampling_burst))
             if save_to_file:
                 print("INFO    logger folder files {0}".format(filename))
                 file_to_log = os.path.join(destination_folder, filename)
                 handler = RotatingFileHandler(file_to_log,
                                               maxBytes=max_file_size,
                                               backupCount=historical_files)
-                formatter = logging.Formatter(output_format)
+                if compress_rotated:
+                    self.rotator = CompressedRotator()
+                    handler.namer = self.rotator.namer
+                    handler.rotator = self.rotator
                 handler.setFormatter(formatter)
-                self.logger.addHandler(handler)
+                handlers.append(handler)
+
+            if async_mode:
+                print("INFO    logger async mode")
+                queue = SimpleQueue()
+                self.logger.addHandler(DeferredQueueHandler(queue))
+                self.logger.propagate = False
+                self.listener = QueueListener(queue, *handlers, respect_handler_level=True)
+                self.listener.start()
+                atexit.register(self.stop)
+            else:
+                for handler in handlers:
+                    self.logger.addHandler(handler)
+                if json_format:
+                    self.logger.propagate = False
 
             # self.logger.setLevel(logging.DEBUG)
 
         return self.logger
 
+    def stop(self):
+        """
+        Flush the pending records and stop the background workers
+        """
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+        if self.rotator is not None:
+            self.rotator.shutdown()
+            self.rotator = None
+
 
 class BColors:
     """
@@ -76,6 +189,28 @@ class BColors:
     UNDERLINE = '\033[4m'
 
 
+class LazyMessage:
+    """
+    Log message composed only when a handler formats the record
+    """
+    __slots__ = ('name', 'color', 'msg', 'args')
+
+    def __init__(self, name, color, msg, args):
+        self.name = name
+        self.color = color
+        self.msg = msg
+        self.args = args
+
+    def plain(self):
+        return self.msg % self.args if self.args else self.msg
+
+    def __str__(self):
+        msg = self.plain()
+        if self.color is not None:
+            return f"{self.color}{self.name} {msg}{BColors.END_C}"
+        return f"{self.name} {msg}"
+
+
 class PrintHelper:
     def __init__(self, namespace, logger=None):
         self.msg_len = 10
@@ -107,102 +242,59 @@ class PrintHelper:
         if self.logger is not None:
             self.logger_enable = True
 
-    @handle_exceptions_method
-    def debug_if(self, enable=True, msg=''):
-        if enable:
-            if self.logger_enable:
-                message = self.__composer_str__(color=BColors.OK_CYAN,
-                                                message=msg)
-                self.logger.debug(message)
-            else:
-                self.debug(msg)
-
-    @handle_exceptions_method
-    def debug(self, msg):
+    def is_enabled(self, level):
+        """
+        Check the level before building the message
+        @param level: logging level
+        """
         if self.logger_enable:
-            message = self.__composer_str__(color=BColors.OK_CYAN,
-                                            message=msg)
-            self.logger.debug(message)
-        else:
-            title = "DEBUG:"
-            self.__composer_str__(color=BColors.OK_CYAN,
-                                  title=title,
-                                  message=msg,
-                                  stdout=True)
+            return self.logger.isEnabledFor(level)
+        return True
 
     @handle_exceptions_method
-    def highlights(self, msg):
+    def __emit__(self, level, color, title, msg, args):
         if self.logger_enable:
-            message = self.__composer_str__(color=BColors.OK_GREEN,
-                                            message=msg)
-            self.logger.info(message)
+            self.logger.log(level, LazyMessage(self.name,
+                                               color if self.colored_stdout else None,
+                                               msg,
+                                               args))
         else:
-            title = "INFO:"
-            self.__composer_str__(color=BColors.OK_GREEN,
+            self.__composer_str__(color=color,
                                   title=title,
-                                  message=msg,
+                                  message=msg % args if args else msg,
                                   stdout=True)
 
-    @handle_exceptions_method
-    def info_if(self, enable=True, msg=''):
-        if enable:
-            if self.logger_enable:
-                message = self.__composer_str__(color=None,
-                                                message=msg)
-                self.logger.info(message)
-            else:
-                self.info(msg)
+    def debug_if(self, enable=True, msg='', *args):
+        if enable and self.is_enabled(logging.DEBUG):
+            self.__emit__(logging.DEBUG, BColors.OK_CYAN, "DEBUG:", msg, args)
 
-    @handle_exceptions_method
-    def info(self, msg):
-        if self.logger_enable:
-            message = self.__composer_str__(color=None,
-                                            message=msg)
-            self.logger.info(message)
-        else:
-            title = "INFO:"
-            self.__composer_str__(color=None,
-                                  title=title,
-                                  stdout=True)
+    def debug(self, msg, *args):
+        if self.is_enabled(logging.DEBUG):
+            self.__emit__(logging.DEBUG, BColors.OK_CYAN, "DEBUG:", msg, args)
 
-    @handle_exceptions_method
-    def wrn(self, msg):
-        if self.logger_enable:
-            message = self.__composer_str__(color=BColors.WARNING,
-                                            message=msg)
-            self.logger.warning(message)
-        else:
-            title = "WARNING:"
-            self.__composer_str__(color=BColors.WARNING,
-                                  title=title,
-                                  message=msg,
-                                  stdout=True)
+    def highlights(self, msg, *args):
+        if self.is_enabled(logging.INFO):
+            self.__emit__(logging.INFO, BColors.OK_GREEN, "INFO:", msg, args)
 
-    @handle_exceptions_method
-    def alert(self, msg):
-        if self.logger_enable:
-            message = self.__composer_str__(color=BColors.BOLD,
-                                            message=msg)
-            self.logger.fatal(message)
-        else:
-            title = "ALERT:"
-            self.__composer_str__(color=BColors.BOLD,
-                                  title=title,
-                                  message=msg,
-                                  stdout=True)
+    def info_if(self, enable=True, msg='', *args):
+        if enable and self.is_enabled(logging.INFO):
+            self.__emit__(logging.INFO, None, "INFO:", msg, args)
 
-    @handle_exceptions_method
-    def error(self, msg):
-        if self.logger_enable:
-            message = self.__composer_str__(color=BColors.FAIL,
-                                            message=msg)
-            self.logger.error(message)
-        else:
-            title = "ERROR:"
-            self.__composer_str__(color=BColors.FAIL,
-                                  title=title,
-                                  message=msg,
-                                  stdout=True)
+    def info(self, msg, *args):
+        if self.is_enabled(logging.INFO):
+            self.__emit__(logging.INFO, None, "INFO:", msg, args)
+
+    def wrn(self, msg, *args):
+        if self.is_enabled(logging.WARNING):
+            self.__emit__(logging.WARNING, BColors.WARNING, "WARNING:", msg, args)
+
+    def alert(self, msg, *args):
+        if self.is_enabled(logging.CRITICAL):
+            self.__emit__(logging.CRITICAL, BColors.BOLD, "ALERT:", msg, args)
+
+    def error(self, msg, *args):
+        if self.is_enabled(logging.ERROR):
+            self.__emit__(logging.ERROR, BColors.FAIL, "ERROR:", msg, args)
 
     @handle_exceptions_method
     def error_and_exception(self,
@@ -211,9 +303,10 @@ class PrintHelper:
         exc_type, exc_obj, exc_tb = sys.exc_info()
         msg = f"line: {exc_tb.tb_lineno} {str(error)} type:{exc_type}"
         if self.logger_enable:
-            message = self.__composer_str__(color=BColors.FAIL,
-                                            message=f"{procedure_name} {msg}")
-            self.logger.error(message)
+            self.logger.error(LazyMessage(self.name,
+                                          BColors.FAIL if self.colored_stdout else None,
+                                          f"{procedure_name} {msg}",
+                                          ()))
         else:
             title = "ERROR:"
             self.__composer_str__(color=BColors.FAIL,
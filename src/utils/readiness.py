@@ -0,0 +1,36 @@
+import os
+import time
+
+
+class ReadinessSignal:
+    """
+    Readiness of the watchdog: set when the first snapshot is loaded.
+    Served by the http api (/readyz) and, when a path is defined, written as a file for an exec probe
+    """
+
+    def __init__(self, path=None):
+        self.path = path or None
+        self.ready = False
+        self.ready_at = None
+        self.start = time.monotonic()
+        if self.path is not None:
+            # a file left by a previous run is not a readiness
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def set_ready(self):
+        """
+        @return: True on the first call
+        """
+        if self.ready:
+            return False
+        self.ready = True
+        self.ready_at = time.monotonic() - self.start
+        if self.path is not None:
+            folder = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(folder, exist_ok=True)
+            with open(self.path, 'w') as file:
+                file.write(f"{time.time():.0f}\n")
+        return True
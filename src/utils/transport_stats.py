@@ -0,0 +1,88 @@
+import threading
+
+
+class _CallStats:
+    __slots__ = ('calls', 'errors', 'wire_bytes', 'body_bytes', 'seconds', 'max_seconds')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.wire_bytes = 0
+        self.body_bytes = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+
+
+class TransportStats:
+    """
+    Bytes and latency of the k8s api calls for every resource kind. Wire bytes are the bytes read from the
+    socket (compressed with gzip), body bytes the decoded response. The calls run in worker threads
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.kinds = {}
+
+    def __stats__(self, kind):
+        stats = self.kinds.get(kind)
+        if stats is None:
+            stats = _CallStats()
+            self.kinds[kind] = stats
+        return stats
+
+    def record(self, kind, seconds, wire_bytes=0, body_bytes=0):
+        with self.lock:
+            stats = self.__stats__(kind)
+            stats.calls += 1
+            stats.wire_bytes += wire_bytes
+            stats.body_bytes += body_bytes
+            stats.seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+
+    def record_error(self, kind, seconds):
+        with self.lock:
+            stats = self.__stats__(kind)
+            stats.calls += 1
+            stats.errors += 1
+            stats.seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+
+    def summary(self):
+        """
+        @return: kind -> calls, errors, bytes and latency
+        """
+        with self.lock:
+            return {kind: {'calls': stats.calls,
+                           'errors': stats.errors,
+                           'wire_bytes': stats.wire_bytes,
+                           'body_bytes': stats.body_bytes,
+                           'avg_seconds': round(stats.seconds / stats.calls, 6) if stats.calls > 0 else 0.0,
+                           'max_seconds': round(stats.max_seconds, 6)}
+                    for kind, stats in sorted(self.kinds.items())}
+
+    def metrics(self):
+        """
+        Prometheus text lines of the api calls
+        """
+        with self.lock:
+            kinds = sorted(self.kinds.items())
+            families = (('watchdog_k8s_requests_total', 'counter', 'K8s api calls',
+                         lambda stats: stats.calls),
+                        ('watchdog_k8s_request_errors_total', 'counter', 'K8s api calls failed',
+                         lambda stats: stats.errors),
+                        ('watchdog_k8s_response_wire_bytes_total', 'counter',
+                         'Bytes of the k8s api responses read from the socket',
+                         lambda stats: stats.wire_bytes),
+                        ('watchdog_k8s_response_body_bytes_total', 'counter',
+                         'Bytes of the decoded k8s api responses',
+                         lambda stats: stats.body_bytes),
+                        ('watchdog_k8s_request_seconds_sum', 'counter', 'Total time of the k8s api calls',
+                         lambda stats: f'{stats.seconds:.6f}'),
+                        ('watchdog_k8s_request_max_seconds', 'gauge', 'Slowest k8s api call',
+                         lambda stats: f'{stats.max_seconds:.6f}'))
+            lines = []
+            for name, metric_type, description, value in families:
+                lines += [f'# HELP {name} {description}',
+                          f'# TYPE {name} {metric_type}']
+                lines += [f'{name}{{kind="{kind}"}} {value(stats)}' for kind, stats in kinds]
+            return lines